@@ -0,0 +1,502 @@
+"""
+Benchmarks for the PromQL ingest and analysis hot paths, run on synthetic data shaped like our
+    Thanos responses (many short lived pods over an hourly step).
+
+Run from the AutoMetrics root so the plugin imports resolve:
+    python path/to/extra_scripts/benchmarks.py transform --series 5000 --steps 744
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# The analyses benchmark's worker processes import this script as __mp_main__
+if(__name__ not in ["__main__", "__mp_main__"]):
+    print("This script is only supposed to be executed by itself")
+    exit()
+
+sys.path.insert(0, os.getcwd())
+
+def synthetic_response(series_cnt, steps, max_lifetime, start_ts=1_700_000_000, step=3600, seed=0):
+    """
+    Generate a PromQL query_range result list, each series is a pod that lives for a random amount
+        of steps somewhere in the range.
+    """
+    rng = random.Random(seed)
+    response = []
+    for i in range(series_cnt):
+        lifetime = rng.randint(1, max_lifetime)
+        first_step = rng.randint(0, max(steps-lifetime, 0))
+        value = str(rng.choice([1, 2, 4, 8, 0.5]))
+        response.append({
+            "metric": {
+                "namespace": f"sdsu-ns-{i % 40}",
+                "node": f"rci-tide-gpu-{i % 17:02d}.sdsu.edu",
+                "pod": f"pod-{i}",
+                "resource": "nvidia_com_gpu",
+                "uid": f"{i:08x}-0000-0000-0000-000000000000"
+            },
+            "values": [[start_ts + (first_step+k)*step, value] for k in range(lifetime)]
+        })
+    return response
+
+def time_call(label, func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter()-start)
+    print(f"  {label:<24} {best*1000:10.1f} ms")
+    return result
+
+def fresh_frame(df):
+    """ Copy a Grafana DataFrame with its own copy of the label table, so keys memoized on the table aren't reused. """
+    from plugins.rci_plugins.promql.label_table import LABELS_ATTR, LabelTable
+
+    fresh_df = df.copy(deep=False)
+    if(LABELS_ATTR in df.attrs):
+        fresh_df.attrs = {**df.attrs, LABELS_ATTR: LabelTable.from_dict(df.attrs[LABELS_ATTR].to_dict())}
+    return fresh_df
+
+def bench_transform(args):
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+
+    response = synthetic_response(args.series, args.steps, args.max_lifetime)
+    print(f"transform_query_response: {args.series} series over {args.steps} steps")
+
+    pivot_df = time_call("pivot", lambda: transform_query_response(response, method="pivot"), args.repeat)
+    matrix_df = time_call("matrix", lambda: transform_query_response(response, method="matrix"), args.repeat)
+
+    if(list(pivot_df.columns) != list(matrix_df.columns) or not pivot_df.iloc[:, 1:].astype(float).equals(matrix_df.iloc[:, 1:])):
+        print("  WARNING: pivot and matrix DataFrames differ.")
+
+def bench_cache(args):
+    import tempfile
+    from plugins.rci_plugins.promql.cache_backends import CACHE_BACKENDS, pyarrow
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+
+    df = transform_query_response(synthetic_response(args.series, args.steps, args.max_lifetime))
+    print(f"cache backends: {df.shape[1]-1} columns over {df.shape[0]} rows")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, backend_type in CACHE_BACKENDS.items():
+            if(backend_type.extension == ".parquet" and pyarrow is None):
+                print(f"  {name:<24} skipped, pyarrow isn't installed")
+                continue
+
+            backend = backend_type()
+            path_base = os.path.join(tmp_dir, name)
+            time_call(f"{name} write", lambda: backend.write(path_base, df), 1)
+            time_call(f"{name} read", lambda: backend.read(path_base), args.repeat)
+
+            size = sum(os.path.getsize(os.path.join(tmp_dir, file)) for file in os.listdir(tmp_dir) if file.startswith(name))
+            print(f"  {name + ' size':<24} {size/1_000_000:10.1f} MB")
+
+def bench_intervals(args):
+    from plugins.rci_plugins.analyses.impls.hours import _analyze_hours_byns_ondf, namespace_key_function
+    from plugins.rci_plugins.analyses.impls.jobs import _analyze_jobs_byns_ondf
+    from plugins.rci_plugins.promql.pod_intervals import PodIntervalStore
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+
+    df = transform_query_response(synthetic_response(args.series, args.steps, args.max_lifetime))
+    print(f"pod interval store: {df.shape[1]-1} columns over {df.shape[0]} rows")
+
+    store = time_call("build store", lambda: PodIntervalStore.from_grafana_df(df), 1)
+    print(f"  {'DataFrame size':<24} {df.memory_usage(deep=True).sum()/1_000_000:10.1f} MB")
+    print(f"  {'store size':<24} {store.nbytes/1_000_000:10.1f} MB ({len(store)} runs)")
+
+    time_call("hours on DataFrame", lambda: _analyze_hours_byns_ondf(df, namespace_key_function), args.repeat)
+    time_call("hours on store", lambda: _analyze_hours_byns_ondf(store, namespace_key_function), args.repeat)
+    time_call("jobs on DataFrame", lambda: _analyze_jobs_byns_ondf(df), args.repeat)
+    time_call("jobs on store", lambda: _analyze_jobs_byns_ondf(store), args.repeat)
+
+def apply_status_loop(status_df, values_df):
+    """ The per column _apply_status_df implementation, kept as the benchmark reference. """
+    import re
+    from src.utils.timeutils import to_unix_ts
+
+    start_ts = to_unix_ts(values_df["Time"][0])
+    end_ts = to_unix_ts(list(values_df["Time"])[-1])
+    times_list = [to_unix_ts(time) for time in status_df["Time"]]
+    start_index = times_list.index(start_ts) if start_ts in times_list else 0
+    end_index = times_list.index(end_ts) if end_ts in times_list else len(times_list)-1
+
+    drop_columns = []
+    for column in values_df.columns[1:]:
+        uid = re.search(r'uid="([^"]+)"', column).group(1)
+        if(uid not in status_df.columns):
+            drop_columns.append(column)
+            continue
+
+        status_column = status_df[uid].iloc[range(start_index, end_index+1)]
+        status_column.index = values_df.index
+        values_df[column] = values_df[column].where(status_column == 1)
+
+    values_df.drop(columns=drop_columns, inplace=True)
+    return values_df
+
+def bench_status(args):
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+    from plugins.rci_plugins.promql.query_ingest import _apply_status_df
+
+    for series_cnt in args.series:
+        response = synthetic_response(series_cnt, args.steps, args.max_lifetime)
+        values_df = transform_query_response(response)
+
+        # Pods are running for the first half of their lifetime, every 10th pod has no status
+        status_response = []
+        for series in response:
+            uid = series["metric"]["uid"]
+            if(int(uid[:8], 16) % 10 == 0):
+                continue
+            status_response.append({"metric": {"uid": uid}, "values": [[time, "1" if idx < len(series["values"])/2 else "0"] for idx, (time, _) in enumerate(series["values"])]})
+        status_df = transform_query_response(status_response)
+        status_df = status_df.set_axis(["Time"] + [column.split('"')[1] for column in status_df.columns[1:]], axis=1)
+        status_df = status_df.set_index("Time").reindex(values_df["Time"]).reset_index()
+
+        print(f"_apply_status_df: {series_cnt} pods over {args.steps} steps")
+        loop_df = time_call("loop", lambda: apply_status_loop(status_df, values_df.copy()), args.repeat)
+        vector_df = time_call("vectorized", lambda: _apply_status_df(status_df, values_df.copy()), args.repeat)
+
+        if(not loop_df.equals(vector_df)):
+            print("  WARNING: loop and vectorized DataFrames differ.")
+
+def infer_times_loop(df, step):
+    """ The row by row _infer_times implementation, kept as the benchmark reference. """
+    import math
+    import pandas as pd
+    from src.utils.timeutils import to_unix_ts, from_unix_ts
+
+    columns_excluding_time = list(df.columns)
+    columns_excluding_time.remove("Time")
+
+    i = 0
+    while i < len(df["Time"]) - 1:
+        time_offset = to_unix_ts(df["Time"][i+1])-to_unix_ts(df["Time"][i])
+        if(time_offset <= step):
+            i += 1
+            continue
+
+        rows_to_add = math.floor(time_offset/step)
+        times_arr = [from_unix_ts(to_unix_ts(df["Time"][i]) + j*step) for j in range(1, rows_to_add)]
+        rows_df = pd.DataFrame({"Time": times_arr} | {key: [float('NaN')]*len(times_arr) for key in columns_excluding_time})
+        df = pd.concat([df.iloc[:i+1], rows_df, df.iloc[i+1:]]).reset_index(drop=True)
+
+        i += rows_to_add
+
+    return df
+
+def bench_infer(args):
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+    from plugins.rci_plugins.promql.query_preprocess import _infer_times
+
+    step = 3600
+    df = transform_query_response(synthetic_response(args.series, args.steps, args.max_lifetime, step=step))
+
+    # Remove every gap_every-th step, leaving args.steps/gap_every gaps in the Time column
+    rng = random.Random(0)
+    gap_rows = sorted(rng.sample(range(1, len(df)-1), len(df)//args.gap_every))
+    df = df.drop(index=gap_rows).reset_index(drop=True)
+    print(f"_infer_times: {df.shape[1]-1} columns over {df.shape[0]} rows with {len(gap_rows)} missing steps")
+
+    loop_df = time_call("loop", lambda: infer_times_loop(df, step), args.repeat)
+    grid_df = time_call("grid reindex", lambda: _infer_times(df, step), args.repeat)
+
+    if(not loop_df.equals(grid_df)):
+        print("  WARNING: loop and grid reindex DataFrames differ.")
+
+def hours_loop(df, key_function):
+    """ The previous _analyze_hours_byns_ondf totals, a key function and sum call per column. """
+    namespace_totals = {}
+    for column in df.columns[1:]:
+        key = key_function(column)
+        total = df[column].sum()
+        if(key in namespace_totals):
+            namespace_totals[key] += total
+        else:
+            namespace_totals[key] = float(total)
+    return namespace_totals
+
+def bench_hours(args):
+    from plugins.rci_plugins.analyses.impls.hours import _analyze_hours_byns_ondf, namespace_key_function, jupyterhub_pod_key_function
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+
+    response = synthetic_response(args.series, args.steps, args.max_lifetime)
+    for series in response:
+        series["metric"]["pod"] = f"jupyter-user{series['metric']['pod'][4:]}-40sdsu-2eedu"
+    df = transform_query_response(response)
+    print(f"_analyze_hours_byns_ondf: {args.series} columns over {args.steps} steps")
+
+    for key_name, key_function in [("namespace", namespace_key_function), ("jupyterhub pod", jupyterhub_pod_key_function)]:
+        loop_totals = time_call(f"{key_name} loop", lambda: hours_loop(df, key_function), args.repeat)
+        # A fresh label table each run so the memoized keys aren't reused
+        hours_df = time_call(f"{key_name} grouped", lambda: _analyze_hours_byns_ondf(fresh_frame(df), key_function), args.repeat)
+
+        loop_totals = {key: total for key, total in loop_totals.items() if key is not None and total >= 0.001}
+        if(loop_totals != dict(zip(hours_df["Namespace"], hours_df["Hours"]))):
+            print(f"  WARNING: loop and grouped {key_name} totals differ.")
+
+def cpu_only_jobs_frames(cpu_df, gpu_df):
+    """ The previous analyze_cpu_only_jobs_byns, excluding the GPU uids by parsing both frames. """
+    from plugins.rci_plugins.analyses.impls.jobs import _analyze_jobs_byns_ondf
+    from plugins.rci_plugins.promql.label_table import get_column_labels
+
+    gpu_df = gpu_df.drop(columns="Time")
+    gpu_df = gpu_df[[col for col in gpu_df.columns if gpu_df[col].sum() > 0]]
+    gpu_uuid = set(get_column_labels(gpu_df, "uid").dropna())
+    return _analyze_jobs_byns_ondf(cpu_df, gpu_uuid, True)
+
+def bench_jobs(args):
+    import tempfile
+    import plugins.rci_plugins.promql.uid_index as uid_index_module
+    from plugins.rci_plugins.analyses.impls.jobs import analyze_cpu_only_jobs_byns
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+    from plugins.rci_plugins.promql.uid_index import UidIndex
+    from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
+    from src.data.data_repository import DataRepository
+
+    response = synthetic_response(args.series, args.steps, args.max_lifetime)
+    cpu_df = transform_query_response(response)
+    # Every third pod also requests a GPU
+    gpu_df = transform_query_response(response[::3])
+    period = (0, 1)
+    print(f"cpu only jobs: {args.series} cpu columns and {len(response[::3])} gpu columns over {args.steps} steps")
+
+    frames_df = time_call("frames", lambda: cpu_only_jobs_frames(cpu_df, gpu_df), args.repeat)
+
+    def build_index(uid_index):
+        uid_index.add("bench", "cpu", period, cpu_df)
+        uid_index.add("bench", "gpu", period, gpu_df)
+    # A fresh index each run, loaded from an empty directory
+    time_call("build uid index", lambda: build_index(UidIndex.load(tempfile.mkdtemp())), args.repeat)
+
+    # The analysis as the ParallelAnalysisDriver runs it, against the index ingest built
+    uid_index_module._uid_index = UidIndex.load(tempfile.mkdtemp())
+    build_index(uid_index_module._uid_index)
+    cpu_identifier = GrafanaIdentifier(period[0], period[1], "cpu", "bench")
+    data_repo = DataRepository()
+    data_repo.add(cpu_identifier, cpu_df)
+    data_repo.add(GrafanaIdentifier(period[0], period[1], "gpu", "bench"), gpu_df)
+    index_df = time_call("cpu only jobs analysis", lambda: analyze_cpu_only_jobs_byns(cpu_identifier, data_repo), args.repeat)
+
+    if(not frames_df.equals(index_df)):
+        print("  WARNING: frames and uid index counts differ.")
+
+def stitch_loop(dfs):
+    """ The previous stitch, concatenating each sub period onto the growing DataFrame. """
+    import pandas as pd
+
+    df = pd.DataFrame()
+    for df_toadd in dfs:
+        df = pd.concat([df, df_toadd], ignore_index=True, sort=False)
+    return df
+
+def peak_call(label, get_input, func):
+    """ Report the peak traced memory of func(input), counting the input it's given. """
+    tracemalloc.start()
+    func_input = [get_input()]
+    tracemalloc.reset_peak()
+    # Only func holds the input, so it can free it
+    func(func_input.pop())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<24} {peak/1e6:10.1f} MB peak")
+
+def bench_stitch(args):
+    from types import SimpleNamespace
+    from plugins.rci_plugins.promql.promql_ingest import stitch
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+    from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
+
+    start_ts = 1_700_000_000
+    step = 3600
+    response = synthetic_response(args.series, args.steps, args.max_lifetime, start_ts=start_ts, step=step)
+
+    # Split the range into sub periods, each holding only the pods running in it
+    chunk_steps = -(-args.steps // args.chunks)
+    periods = [(start_ts + i*chunk_steps*step, start_ts + min((i+1)*chunk_steps, args.steps)*step - 1) for i in range(args.chunks)]
+    def get_period_dfs():
+        period_dfs = {}
+        for period in periods:
+            period_response = [{"metric": series["metric"], "values": [value for value in series["values"] if period[0] <= value[0] <= period[1]]} for series in response]
+            period_response = [series for series in period_response if len(series["values"]) > 0]
+            period_dfs[GrafanaIdentifier(period[0], period[1], "gpu", "bench")] = transform_query_response(period_response)
+        return period_dfs
+
+    timeline = SimpleNamespace(main_periods=[(periods[0][0], periods[-1][1])])
+    identifier = GrafanaIdentifier(periods[0][0], periods[-1][1], "gpu", "bench")
+    print(f"stitch: {args.series} series over {args.steps} steps in {args.chunks} sub periods")
+
+    period_dfs = get_period_dfs()
+    loop_df = time_call("loop concat", lambda: stitch_loop(list(period_dfs.values())), args.repeat)
+    # stitch removes the entries it consumed, give it a shallow copy of the dictionary
+    stitch_df = time_call("single concat", lambda: stitch(timeline, dict(period_dfs)).get_data(identifier), args.repeat)
+    period_dfs = None
+
+    # Peak memory while stitching, counting the sub periods
+    peak_call("loop concat", lambda: list(get_period_dfs().values()), stitch_loop)
+    peak_call("single concat", get_period_dfs, lambda period_dfs: stitch(timeline, period_dfs))
+
+    if(not loop_df.equals(stitch_df)):
+        print("  WARNING: loop and single concat DataFrames differ.")
+
+def bench_analyses(args):
+    from functools import partial
+    from types import SimpleNamespace
+    from plugins.rci_plugins.analyses.impls.hours import analyze_hours_byns, namespace_key_function
+    from plugins.rci_plugins.analyses.parallel_driver import ParallelAnalysis, ParallelAnalysisDriver
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+    from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
+    from src.data.data_repository import DataRepository
+
+    step = 3600
+    period_dfs = {}
+    for period_idx in range(args.periods):
+        start_ts = 1_700_000_000 + period_idx*args.steps*step
+        response = synthetic_response(args.series, args.steps, args.max_lifetime, start_ts=start_ts, step=step, seed=period_idx)
+        period_dfs[GrafanaIdentifier(start_ts, start_ts + args.steps*step - 1, "cpu", "bench")] = transform_query_response(response)
+
+    analysis = ParallelAnalysis(
+        name="benchhours",
+        prereq_analyses=None,
+        filter=lambda identifier: isinstance(identifier, GrafanaIdentifier),
+        method=partial(analyze_hours_byns, key_function=namespace_key_function)
+    )
+    print(f"hours analysis: {args.periods} periods of {args.series} columns over {args.steps} steps")
+
+    def run_analysis(workers):
+        # Fresh label tables each run so the memoized keys aren't reused
+        data_repo = DataRepository()
+        for identifier, df in period_dfs.items():
+            data_repo.add(identifier, fresh_frame(df))
+        ParallelAnalysisDriver().run_analysis(analysis, SimpleNamespace(data_repo=data_repo), {"workers": workers})
+        return [data_repo.get_data(identifier) for identifier in data_repo.filter_ids(lambda identifier: not isinstance(identifier, GrafanaIdentifier))]
+
+    serial_dfs = time_call("serial", lambda: run_analysis(1), args.repeat)
+    parallel_dfs = time_call(f"{args.workers} workers", lambda: run_analysis(args.workers), args.repeat)
+
+    if(len(serial_dfs) != len(parallel_dfs) or not all(serial_df.equals(parallel_df) for serial_df, parallel_df in zip(serial_dfs, parallel_dfs))):
+        print("  WARNING: serial and parallel results differ.")
+
+def bench_save(args):
+    import tempfile
+    import pandas as pd
+    from types import SimpleNamespace
+    from plugins.rci_plugins.promql.query_executor import transform_query_response
+    from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
+    from plugins.rci_plugins.savers.dataframe_saver import FORMATS, DataFrameSaver, pyarrow, zstandard
+    from src.data.data_repository import DataRepository
+    from src.utils.timeutils import to_unix_ts
+
+    # The Time strings are local times, the parquet round trip is checked away from UTC
+    os.environ["TZ"] = args.tz
+    time.tzset()
+
+    step = 3600
+    data_repo = DataRepository()
+    for period_idx in range(args.periods):
+        start_ts = 1_700_000_000 + period_idx*args.steps*step
+        response = synthetic_response(args.series, args.steps, args.max_lifetime, start_ts=start_ts, step=step, seed=period_idx)
+        data_repo.add(GrafanaIdentifier(start_ts, start_ts + args.steps*step - 1, "cpu", "bench"), transform_query_response(response))
+    prog_data = SimpleNamespace(data_repo=data_repo)
+    print(f"DataFrame saver: {args.periods} periods of {args.series} columns over {args.steps} steps, TZ={args.tz}")
+
+    for format in FORMATS:
+        if((format == "parquet" and pyarrow is None) or (format == "csv.zst" and zstandard is None)):
+            print(f"  {format:<24} skipped, its compressor isn't installed")
+            continue
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_section = {"format": format, "workers": args.workers}
+            time_call(f"{format} save", lambda: DataFrameSaver().save(prog_data, config_section, tmp_dir), args.repeat)
+
+            size = sum(os.path.getsize(os.path.join(tmp_dir, file)) for file in os.listdir(tmp_dir))
+            print(f"  {format + ' size':<24} {size/1_000_000:10.1f} MB")
+
+            if(format == "parquet"):
+                df_paths = DataFrameSaver().save(prog_data, config_section, tmp_dir)
+                for identifier, df_path in zip(data_repo.get_ids(), df_paths):
+                    saved_times = pd.read_parquet(df_path)["Time"]
+                    expected_times = pd.to_datetime([to_unix_ts(time) for time in data_repo.get_data(identifier)["Time"]], unit="s", utc=True)
+                    if(not (saved_times.dt.tz is not None and (saved_times.values == expected_times.values).all())):
+                        raise Exception(f"The Time column of {df_path} doesn't round trip")
+                    if(saved_times.iloc[0].timestamp() != identifier.start_ts):
+                        raise Exception(f"The first Time of {df_path} isn't the start of its period")
+                print(f"  {'parquet Time':<24} round trips")
+
+parser = argparse.ArgumentParser(description="Benchmark RCI metrics hot paths on synthetic data.")
+parser.add_argument("--repeat", type=int, default=3, help="Amount of runs per method, the best time is reported")
+subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+transform_parser = subparsers.add_parser("transform", help="Query response to Grafana DataFrame transform")
+transform_parser.add_argument("--series", type=int, default=5000)
+transform_parser.add_argument("--steps", type=int, default=744)
+transform_parser.add_argument("--max-lifetime", type=int, default=48)
+transform_parser.set_defaults(func=bench_transform)
+
+cache_parser = subparsers.add_parser("cache", help="Cached DataFrame write/read per cache format")
+cache_parser.add_argument("--series", type=int, default=5000)
+cache_parser.add_argument("--steps", type=int, default=744)
+cache_parser.add_argument("--max-lifetime", type=int, default=48)
+cache_parser.set_defaults(func=bench_cache)
+
+status_parser = subparsers.add_parser("status", help="Applying the status DataFrame to the values DataFrame")
+status_parser.add_argument("--series", type=int, nargs="+", default=[1000, 5000, 10000, 20000], help="Pod counts to benchmark")
+status_parser.add_argument("--steps", type=int, default=744)
+status_parser.add_argument("--max-lifetime", type=int, default=48)
+status_parser.set_defaults(func=bench_status)
+
+infer_parser = subparsers.add_parser("infer", help="Filling missing steps of a Grafana DataFrame")
+infer_parser.add_argument("--series", type=int, default=2000)
+infer_parser.add_argument("--steps", type=int, default=744)
+infer_parser.add_argument("--max-lifetime", type=int, default=48)
+infer_parser.add_argument("--gap-every", type=int, default=4, help="Remove one in every this many steps")
+infer_parser.set_defaults(func=bench_infer)
+
+intervals_parser = subparsers.add_parser("intervals", help="Pod interval store size and analyses against the Grafana DataFrame")
+intervals_parser.add_argument("--series", type=int, default=5000)
+intervals_parser.add_argument("--steps", type=int, default=744)
+intervals_parser.add_argument("--max-lifetime", type=int, default=48)
+intervals_parser.set_defaults(func=bench_intervals)
+
+jobs_parser = subparsers.add_parser("jobs", help="CPU only job counts from the frames against analyze_cpu_only_jobs_byns over the uid index")
+jobs_parser.add_argument("--series", type=int, default=20000)
+jobs_parser.add_argument("--steps", type=int, default=744)
+jobs_parser.add_argument("--max-lifetime", type=int, default=48)
+jobs_parser.set_defaults(func=bench_jobs)
+
+hours_parser = subparsers.add_parser("hours", help="Hours by namespace and by JupyterHub pod")
+hours_parser.add_argument("--series", type=int, default=20000)
+hours_parser.add_argument("--steps", type=int, default=744)
+hours_parser.add_argument("--max-lifetime", type=int, default=48)
+hours_parser.set_defaults(func=bench_hours)
+
+stitch_parser = subparsers.add_parser("stitch", help="Stitching sub period DataFrames into their main period")
+stitch_parser.add_argument("--series", type=int, default=20000)
+stitch_parser.add_argument("--steps", type=int, default=744)
+stitch_parser.add_argument("--max-lifetime", type=int, default=48)
+stitch_parser.add_argument("--chunks", type=int, default=9, help="Amount of sub periods in the main period")
+stitch_parser.set_defaults(func=bench_stitch)
+
+analyses_parser = subparsers.add_parser("analyses", help="Per period analyses run serially against the process pool")
+analyses_parser.add_argument("--series", type=int, default=20000)
+analyses_parser.add_argument("--steps", type=int, default=744)
+analyses_parser.add_argument("--max-lifetime", type=int, default=48)
+analyses_parser.add_argument("--periods", type=int, default=12, help="Amount of periods, like the months of a year")
+analyses_parser.add_argument("--workers", type=int, default=4)
+analyses_parser.set_defaults(func=bench_analyses)
+
+save_parser = subparsers.add_parser("save", help="Saving Grafana DataFrames per DataFrameSaver format")
+save_parser.add_argument("--series", type=int, default=5000)
+save_parser.add_argument("--steps", type=int, default=744)
+save_parser.add_argument("--max-lifetime", type=int, default=48)
+save_parser.add_argument("--periods", type=int, default=4, help="Amount of periods, like the months of a year")
+save_parser.add_argument("--workers", type=int, default=4)
+save_parser.add_argument("--tz", default="America/Los_Angeles", help="Time zone the Time strings are written and read in")
+save_parser.set_defaults(func=bench_save)
+
+if(__name__ == "__main__"):
+    args = parser.parse_args()
+    args.func(args)
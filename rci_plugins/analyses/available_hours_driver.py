@@ -1,9 +1,8 @@
 from dataclasses import dataclass
 
 from plugins.rci_plugins.rci_identifiers import AvailableHoursIdentifier
+from plugins.rci_plugins.rci_index import get_identifier_index
 from src.data.data_repository import DataRepository
-from src.data.filters import filter_type
-from src.data.identifier import TimeStampIdentifier
 from src.parameter_utils import ConfigurationException
 from src.plugin_mgmt.plugins import Analysis, AnalysisDriverPlugin
 from src.program_data import ProgramData
@@ -65,8 +64,7 @@ class AvailableHoursDriver(AnalysisDriverPlugin):
 
         data_repo: DataRepository = prog_data.data_repo
 
-        identifiers = data_repo.filter_ids(filter_type(TimeStampIdentifier, True))
-        identifiers.sort(key=lambda id: id.start_ts)
+        identifiers = get_identifier_index(data_repo).get_timestamp_ids()
 
         for node_configuration in config_section.keys():
             node_infos = config_section[node_configuration]
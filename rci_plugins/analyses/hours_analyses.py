@@ -1,6 +1,7 @@
 from functools import partial
 
 from plugins.rci_plugins.analyses.available_hours_driver import AvailHoursAnalysis
+from plugins.rci_plugins.analyses.parallel_driver import ParallelAnalysis
 from plugins.rci_plugins.analyses.impls.hours import namespace_key_function, jupyterhub_pod_key_function, analyze_hours_byns, analyze_hours_total, verify_hours, extract_rci_jh_hours
 from plugins.rci_plugins.rci_filters import filter_source_type, grafana_analysis_key
 from src.builtin_plugins.meta_analysis_driver import MetaAnalysis
@@ -14,7 +15,7 @@ class HoursAnalyses(AnalysisPlugin):
     def get_analyses(self):
         return [
 #region CPU
-            SimpleAnalysis(
+            ParallelAnalysis(
                 name="cpuhours", 
                 prereq_analyses=None,
                 filter=filter_source_type("cpu"),
@@ -68,7 +69,7 @@ class HoursAnalyses(AnalysisPlugin):
             ),
 #endregion
 #region GPU
-            SimpleAnalysis(
+            ParallelAnalysis(
                 name="gpuhours", 
                 prereq_analyses=None,
                 filter=filter_source_type("gpu"),
@@ -174,13 +175,13 @@ class HoursAnalyses(AnalysisPlugin):
             ),
 #endregion
 #region JupyterHub pod hours
-            SimpleAnalysis(
+            ParallelAnalysis(
                 name="cpujhpodhours",
                 prereq_analyses=["cpuhours"],
                 filter=filter_source_type("cpu"),
                 method=partial(analyze_hours_byns, key_function=jupyterhub_pod_key_function)
             ),
-            SimpleAnalysis(
+            ParallelAnalysis(
                 name="gpujhpodhours",
                 prereq_analyses=["gpuhours"],
                 filter=filter_source_type("gpu"),
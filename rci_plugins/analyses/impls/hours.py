@@ -1,9 +1,12 @@
 # This code is repackaged from Tide2.ipynb in https://github.com/SDSU-Research-CI/rci-helpful-scripts
+import numpy as np
 import pandas as pd
 import re
 from typing import Callable
 
 from plugins.rci_plugins.promql.grafana_df_cleaning import has_time_column, clear_time_column
+from plugins.rci_plugins.promql.label_table import LabelTable, get_label_table
+from plugins.rci_plugins.promql.pod_intervals import PodIntervalStore
 from plugins.rci_plugins.rci_identifiers import AvailableHoursIdentifier
 from src.data.data_repository import DataRepository
 from src.data.identifier import *
@@ -16,9 +19,11 @@ def namespace_key_function(col):
 
 def jupyterhub_pod_key_function(col):
 	match = re.search(r'pod="([^"]+)"', col)
-	result = match.group(1)
+	return _pod_to_email(match.group(1))
+
+def _pod_to_email(pod):
 	# Clean string
-	result = result.replace("jupyter-", "").replace("-40", "@").replace("-2e", ".")
+	result = pod.replace("jupyter-", "").replace("-40", "@").replace("-2e", ".")
 	result = reconstruct_email(result)
 	return result
 
@@ -35,6 +40,39 @@ def reconstruct_email(name):
 	else:
 		return name
 
+# The label each built in key function reads, and the function mapping the label's value to the
+#	key. Lets _get_column_keys look keys up in the DataFrame's label table
+_LABEL_KEY_FUNCTIONS = {
+	namespace_key_function: ("namespace", None),
+	jupyterhub_pod_key_function: ("pod", _pod_to_email),
+}
+
+def _get_column_keys(df, key_function: Callable[[str], str]) -> np.ndarray:
+	"""
+	Get the key of each value column of a Grafana DataFrame or pod interval store. Built in key
+		functions are answered from the label table, mapping each unique label value once. The
+		keys are memoized on the label table per key function, see LabelTable.get_keys.
+	"""
+	if(isinstance(df, PodIntervalStore)):
+		table, columns = df.labels, df.columns
+	else:
+		table = get_label_table(df)
+		columns = df.columns[1:] if has_time_column(df) else df.columns
+
+	return table.get_keys(key_function, columns, lambda table_columns: _compute_column_keys(table, table_columns, key_function))
+
+def _compute_column_keys(table: LabelTable, columns, key_function: Callable[[str], str]) -> np.ndarray:
+	if(key_function not in _LABEL_KEY_FUNCTIONS):
+		return np.array([key_function(column) for column in columns], dtype=object)
+
+	label, value_function = _LABEL_KEY_FUNCTIONS[key_function]
+	keys = table.get(label, columns)
+	if(value_function is not None):
+		values = keys.dropna().unique()
+		keys = keys.map(dict(zip(values, map(value_function, values))))
+
+	return keys.to_numpy(dtype=object)
+
 def analyze_hours_byns(identifier, data_repo: DataRepository, key_function: Callable[[str], str] = namespace_key_function):
 	"""
 	Unpack the Grafana DataFrame from the DataRepository and perform _analyze_hours_byns_ondf on
@@ -55,25 +93,26 @@ def _analyze_hours_byns_ondf(df, key_function: Callable[[str], str]):
 	Analyze hours by namespace.
 
 	Args:
-		df (pd.DataFrame): The Grafana DataFrame to analyze
+		df (pd.DataFrame | PodIntervalStore): The Grafana DataFrame to analyze, or its pod
+			interval store.
 	Returns:
 		pd.DataFrame: The result DataFrame with columns [Namespace, Hours].    
 	"""
 
-	if(has_time_column(df)):
-		df = clear_time_column(df)
+	keys = _get_column_keys(df, key_function)
+	if(isinstance(df, PodIntervalStore)):
+		column_totals = df.get_column_totals()
+	else:
+		if(has_time_column(df)):
+			df = clear_time_column(df)
+		column_totals = df.sum().to_numpy(dtype=float)
 
-	# Calculate the sum for each namespace
-	namespace_totals = {}
-	for column in df.columns:
-		key = key_function(column)
-		total = df[column].sum()
-		if(key in namespace_totals):
-			namespace_totals[key] += total
-		else:
-			namespace_totals[key] = float(total)
+	# Calculate the sum for each namespace, bincount adds the column totals in column order
+	codes, namespaces = pd.factorize(keys)
+	has_key = codes >= 0
+	namespace_totals = np.bincount(codes[has_key], weights=column_totals[has_key], minlength=len(namespaces))
 
-	namespace_totals_df = pd.DataFrame(list(namespace_totals.items()), columns=["Namespace", "Hours"])
+	namespace_totals_df = pd.DataFrame({"Namespace": namespaces, "Hours": namespace_totals})
 
 	# Drop NA and 0 values
 	namespace_totals_df.dropna(inplace=True)
@@ -1,9 +1,14 @@
 # This code is repackaged from Tide2.ipynb in https://github.com/SDSU-Research-CI/rci-helpful-scripts
+import numpy as np
 import pandas as pd
 
 from src.data.data_repository import DataRepository
 from src.data.identifier import AnalysisIdentifier
+from plugins.rci_plugins.promql.grafana_df_analyzer import JOBS_ATTR, is_aggregate_df
+from plugins.rci_plugins.promql.pod_intervals import PodIntervalStore, analyze_jobs_onstore
+from plugins.rci_plugins.promql.label_table import get_column_labels
 from plugins.rci_plugins.promql.grafana_df_cleaning import clear_duplicate_uids, clear_blacklisted_uids, has_time_column, clear_time_column
+from plugins.rci_plugins.promql.uid_index import get_uid_index
 from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
 
 def analyze_jobs_byns(identifier, data_repo: DataRepository):
@@ -16,8 +21,11 @@ def analyze_jobs_byns(identifier, data_repo: DataRepository):
         pd.DataFrame: Result from _analyze_jobs_byns_ondf.
     """
 
-    df = data_repo.get_data(identifier)
-    return _analyze_jobs_byns_ondf(df)
+    uid_codes = _get_uid_codes(identifier, data_repo)
+    if(uid_codes is None):
+        return _analyze_jobs_byns_ondf(data_repo.get_data(identifier))
+
+    return _count_jobs_byns(uid_codes)
 
 def analyze_cpu_only_jobs_byns(identifier: GrafanaIdentifier, data_repo: DataRepository):
     """
@@ -34,38 +42,87 @@ def analyze_cpu_only_jobs_byns(identifier: GrafanaIdentifier, data_repo: DataRep
     """
 
     # We have to locate the corresponding GPU data block
-    # The UIDs in the GPU will be used to clear blacklisted IDs
+    # The active UIDs in the GPU will be excluded from the CPU UIDs
     gpu_identifier = GrafanaIdentifier(identifier.start_ts, identifier.end_ts, "gpu", identifier.query_cfg)
-    gpu_uuid = None
+    gpu_uid_codes = None
 
     if(data_repo.contains(gpu_identifier)):    
-        gpu_df = data_repo.get_data(gpu_identifier)
-        if(has_time_column(gpu_df)):
-            gpu_df = clear_time_column(gpu_df)
-
-        gpu_greater_than_zero_cols = [col for col in gpu_df.columns if gpu_df[col].sum() > 0]
-        gpu_df = gpu_df[gpu_greater_than_zero_cols].fillna(0)
-        gpu_uuid = set(gpu_df.columns.str.extract(r'uid="([^"]+)"')[0].dropna())
+        gpu_uid_codes = _get_uid_codes(gpu_identifier, data_repo)
     else:
         print(f"WARNING: Analyzing cpu only jobs, the corresponding gpu data frame under identifier \"{gpu_identifier}\" could not be found.")
 
-    # Unpack cpu dataframe
-    df = data_repo.get_data(identifier)
+    uid_codes = _get_uid_codes(identifier, data_repo)
+    if(uid_codes is None):
+        raise Exception(f"Can't analyze cpu only jobs for identifier \"{identifier}\", it was pulled in aggregate mode and has no per pod uids. Use the raw mode for its query config.")
+
+    if(gpu_uid_codes is not None):
+        uid_codes = uid_codes[~np.isin(uid_codes, gpu_uid_codes)]
+
+    return _count_jobs_byns(uid_codes)
+
+def _get_uid_codes(identifier: GrafanaIdentifier, data_repo: DataRepository):
+    """
+    Get the codes of the uids active in an identifier's DataFrame from the uid index. Ingest
+        indexes every DataFrame, the DataFrame is only read to index it if its period is missing.
+
+    Returns:
+        np.ndarray: The uid codes, None for aggregate DataFrames which have no per pod uids.
+    """
+    uid_index = get_uid_index()
+    period = (identifier.start_ts, identifier.end_ts)
+
+    uid_codes = uid_index.get(identifier.query_cfg, identifier.type, period)
+    if(uid_codes is None):
+        df = data_repo.get_data(identifier)
+        if(not isinstance(df, PodIntervalStore) and is_aggregate_df(df)):
+            return None
+        uid_codes = uid_index.add(identifier.query_cfg, identifier.type, period, df)
 
-    return _analyze_jobs_byns_ondf(df, gpu_uuid, True)
+    return uid_codes
+
+def _count_jobs_byns(uid_codes):
+    """
+    Count the uids per namespace like _analyze_jobs_byns_ondf, from the codes of the active uids
+        in the uid index.
+
+    Returns:
+        pd.DataFrame: The result DataFrame with columns [Namespace, Count].
+    """
+    namespaces = get_uid_index().get_labels(uid_codes, "namespace")
+
+    namespace_counts_sorted = pd.DataFrame(namespaces.value_counts().sort_values(ascending=False)).reset_index()
+    namespace_counts_sorted.columns = ["Namespace", "Count"]
+
+    return namespace_counts_sorted
 
 def _analyze_jobs_byns_ondf(df, blacklisted_uuids=None, strip_cols_0=True):
     """
     Analyze jobs by namespace. Calculates the unique amount of uids per namespace and sums them.
+        DataFrames pulled in aggregate mode already hold these counts in their attrs.
 
     Args:
-        df (pd.DataFrame): The Grafana DataFrame to analyze
+        df (pd.DataFrame | PodIntervalStore): The Grafana DataFrame to analyze, or its pod
+            interval store.
         blacklisted_uuids (list[str]): The blacklisted uuids to exclude from the job count.
         strip_cols_0 (bool): boolean to strip columns that total 0.
     Returns:
         pd.DataFrame: The result DataFrame with columns [Namespace, Count].    
     """
 
+    if(isinstance(df, PodIntervalStore)):
+        job_counts = analyze_jobs_onstore(df, blacklisted_uuids)
+        namespace_counts_sorted = pd.DataFrame(list(job_counts.items()), columns=["Namespace", "Count"])
+        return namespace_counts_sorted.sort_values(by="Count", ascending=False).reset_index(drop=True)
+
+    # Aggregate DataFrames already have the job counts from Prometheus
+    if(is_aggregate_df(df)):
+        if(blacklisted_uuids is not None):
+            raise Exception("Can't exclude blacklisted uuids from an aggregate DataFrame, it has no per pod uids.")
+
+        job_counts = [(namespace, count) for namespace, count in df.attrs[JOBS_ATTR].items() if count > 0]
+        namespace_counts_sorted = pd.DataFrame(job_counts, columns=["Namespace", "Count"])
+        return namespace_counts_sorted.sort_values(by="Count", ascending=False).reset_index(drop=True)
+
     # Preprocessing steps, clear time column, duplicate uids, and blacklisted uids.
     if(has_time_column(df)):
         df = clear_time_column(df)
@@ -83,7 +140,7 @@ def _analyze_jobs_byns_ondf(df, blacklisted_uuids=None, strip_cols_0=True):
         df = df[greater_than_zero_columns].fillna(0)
 
     #extract all the namespaces and use them as columns, group and summing the values 
-    columns = df.columns.str.extract(r'namespace="([^"]+)"')[0]
+    columns = get_column_labels(df, "namespace")
 
     namespace_counts_sorted = pd.DataFrame(columns.value_counts().sort_values(ascending=False)).reset_index()
     namespace_counts_sorted.columns = ["Namespace", "Count"]
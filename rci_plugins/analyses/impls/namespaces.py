@@ -1,14 +1,19 @@
 from plugins.rci_plugins.promql.grafana_df_cleaning import has_time_column, clear_time_column
+from plugins.rci_plugins.promql.label_table import get_column_labels
+from plugins.rci_plugins.promql.pod_intervals import PodIntervalStore
 from src.data.data_repository import DataRepository
 
 def analyze_uniquens(identifier, data_repo: DataRepository):
     df = data_repo.get_data(identifier)
 
+    if(isinstance(df, PodIntervalStore)):
+        return set(df.get_column_labels("namespace"))
+
     if(has_time_column(df)):
         df = clear_time_column(df)
 
 	# Extract namespaces from column names, excluding the first since that's the Time column
-    namespaces = df.columns.str.extract(r'namespace="([^"]+)"')[0]
+    namespaces = get_column_labels(df, "namespace")
     namespaces = set(namespaces)
 
     return namespaces
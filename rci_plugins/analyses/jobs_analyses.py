@@ -1,4 +1,5 @@
 from plugins.rci_plugins.analyses.impls.jobs import analyze_cpu_only_jobs_byns, analyze_jobs_byns, analyze_jobs_total, analyze_all_jobs_total
+from plugins.rci_plugins.analyses.parallel_driver import ParallelAnalysis
 from plugins.rci_plugins.rci_filters import filter_source_type, grafana_analysis_key
 from src.builtin_plugins.meta_analysis_driver import MetaAnalysis
 from src.builtin_plugins.simple_analysis_driver import SimpleAnalysis
@@ -9,11 +10,13 @@ from src.plugin_mgmt.plugins import AnalysisPlugin
 class JobsAnalyses(AnalysisPlugin):
     def get_analyses(self):
         return [
-            SimpleAnalysis(
+            ParallelAnalysis(
                 name="cpujobs", 
                 prereq_analyses=["gpujobs"],
                 filter=filter_source_type("cpu"),
-                method=analyze_cpu_only_jobs_byns
+                method=analyze_cpu_only_jobs_byns,
+                # The gpu DataFrames of the periods are looked up for their uids
+                shared=filter_source_type("gpu")
             ),
             SimpleAnalysis(
                 name="cpujobstotal", 
@@ -34,7 +37,7 @@ class JobsAnalyses(AnalysisPlugin):
                     }
                 )
             ), 
-            SimpleAnalysis(
+            ParallelAnalysis(
                 name="gpujobs", 
                 prereq_analyses=None,
                 filter=filter_source_type("gpu"),
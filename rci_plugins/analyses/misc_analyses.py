@@ -1,8 +1,10 @@
+from plugins.rci_plugins.analyses.parallel_driver import ParallelAnalysis
 from plugins.rci_plugins.analyses.select_sorted_driver import SelectSortedAnalysis
 from plugins.rci_plugins.analyses.summary_driver import SummaryAnalysis
 from plugins.rci_plugins.analyses.impls.namespaces import analyze_uniquens, analyze_all_uniquens
 from plugins.rci_plugins.analyses.impls.usedcapacity import analyze_usedcapacity
 from plugins.rci_plugins.analyses.tidesplit_driver import TideSplitAnalysis, aggregate_tide_split
+from plugins.rci_plugins.rci_filters import filter_analysis_cfg
 from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
 from src.builtin_plugins.agg_analysis_driver import AggregateAnalysis
 from src.builtin_plugins.meta_analysis_driver import MetaAnalysis
@@ -19,7 +21,7 @@ def filter_sdsu_namespaces(row: pd.Series):
 class MiscAnalyses(AnalysisPlugin):
     def get_analyses(self):
         return [
-            SimpleAnalysis(
+            ParallelAnalysis(
                 name="uniquens",
                 prereq_analyses=None,
                 filter=filter_type(GrafanaIdentifier, strict=True),
@@ -65,7 +67,7 @@ class MiscAnalyses(AnalysisPlugin):
             SelectSortedAnalysis(
                 name="topsdsuusers_cpu",
                 prereq_analyses=["cpujhpodhours"],
-                filter=lambda id: filter_analyis_type("cpujhpodhours")(id) and id.find_base().query_cfg == "jupyterhub",
+                filter=filter_analysis_cfg("cpujhpodhours", "jupyterhub"),
                 filter_col_name="Namespace",
                 filter_col_method=filter_sdsu_emails,
                 rank_col_name="Hours",
@@ -75,7 +77,7 @@ class MiscAnalyses(AnalysisPlugin):
             SelectSortedAnalysis(
                 name="topsdsuusers_gpu",
                 prereq_analyses=["gpujhpodhours"],
-                filter=lambda id: filter_analyis_type("gpujhpodhours")(id) and id.find_base().query_cfg == "jupyterhub",
+                filter=filter_analysis_cfg("gpujhpodhours", "jupyterhub"),
                 filter_col_name="Namespace",
                 filter_col_method=filter_sdsu_emails,
                 rank_col_name="Hours",
@@ -85,7 +87,7 @@ class MiscAnalyses(AnalysisPlugin):
             SelectSortedAnalysis(
                 name="topsdsunamespaces_cpu",
                 prereq_analyses=["cpuhours"],
-                filter=lambda id: filter_analyis_type("cpuhours")(id) and id.find_base().query_cfg == "monthly",
+                filter=filter_analysis_cfg("cpuhours", "monthly"),
                 filter_col_name="Namespace",
                 filter_col_method=filter_sdsu_namespaces,
                 rank_col_name="Hours",
@@ -95,7 +97,7 @@ class MiscAnalyses(AnalysisPlugin):
             SelectSortedAnalysis(
                 name="topsdsunamespaces_gpu",
                 prereq_analyses=["gpuhours"],
-                filter=lambda id: filter_analyis_type("gpuhours")(id) and id.find_base().query_cfg == "monthly",
+                filter=filter_analysis_cfg("gpuhours", "monthly"),
                 filter_col_name="Namespace",
                 filter_col_method=filter_sdsu_namespaces,
                 rank_col_name="Hours",
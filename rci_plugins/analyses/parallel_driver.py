@@ -0,0 +1,189 @@
+"""
+The parallel analysis driver runs per identifier analyses like SimpleAnalysis, but fans the
+  identifiers out across a process pool. The value matrix of each analyzed Grafana DataFrame is
+  copied once into a shared memory segment, the workers wrap the segments in DataFrames without
+  copying them, so only the Time column, column names and attrs of each frame are pickled. Other
+  data (pod interval stores) is pickled as is.
+The workers are started from a fork server, a single threaded process started for the pools, so
+  the threads of this process (the ingest's pull and progress threads) can't be holding locks the
+  workers inherit. Like any spawned process the workers import the main module as __mp_main__, it
+  has to guard its entry point with if __name__ == "__main__".
+Caches the workers build (label table keys, uid index entries) stay in the workers. Results are
+  added to the DataRepository in identifier order so a parallel run is identical to a serial one.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Callable
+import numpy as np
+import pandas as pd
+
+from plugins.rci_plugins.promql.label_table import LABELS_ATTR, LabelTable
+from plugins.rci_plugins.rci_index import filter_ids
+from plugins.rci_plugins.sysutils import get_available_cpus
+from src.data.data_repository import DataRepository
+from src.data.identifier import AnalysisIdentifier, Identifier
+from src.parameter_utils import ConfigurationException
+from src.plugin_mgmt.plugins import Analysis, AnalysisDriverPlugin
+from src.program_data import ProgramData
+
+import plugins.rci_plugins.analyses.parallel_driver as pkg
+
+@dataclass(frozen=True)
+class ParallelAnalysis(Analysis):
+    """ Runs method(identifier, data_repo) for every identifier passing the filter, like a
+            SimpleAnalysis. The method runs in a worker process, on a DataRepository holding the
+            data of the analyzed identifiers and of the identifiers passing the shared filter. It
+            has to be picklable (a module level function or a partial of one) and its changes to
+            the DataRepository aren't kept. """
+    filter: Callable[[Identifier], bool]
+    method: Callable[[Identifier, DataRepository], object]
+    shared: Callable[[Identifier], bool] = None
+
+class ParallelAnalysisDriver(AnalysisDriverPlugin):
+    # pkg. is a workaround to point to the global definition of ParallelAnalysis instead of the file definition
+    SERVED_TYPE=pkg.ParallelAnalysis
+
+    def verify_config_section(self, config_section):
+        # Optional config section, if its None that's fine
+        if(config_section is None):
+            return True
+
+        if(not set(config_section.keys()).issubset(set(["workers"]))):
+            raise ConfigurationException("The configuration section for ParallelAnalysisDriver only expects a workers section.")
+
+        workers = config_section.get("workers")
+        if(workers is not None and (not isinstance(workers, int) or isinstance(workers, bool) or workers < 1)):
+            raise ConfigurationException(f"The configuration section for ParallelAnalysisDriver workers is expected to be a positive integer. Is: {workers}")
+
+        return True
+
+    def run_analysis(self, analysis, prog_data: ProgramData, config_section: dict):
+        data_repo: DataRepository = prog_data.data_repo
+
+        identifiers = filter_ids(data_repo, analysis.filter)
+
+        workers = None
+        if(config_section is not None):
+            workers = config_section.get("workers")
+        if(workers is None):
+            workers = get_available_cpus()
+        workers = min(workers, len(identifiers))
+
+        if(workers <= 1):
+            results = [analysis.method(identifier, data_repo) for identifier in identifiers]
+        else:
+            results = _run_parallel(analysis, data_repo, identifiers, workers)
+
+        # Added in identifier order so the repository is the same regardless of the worker count
+        for identifier, result in zip(identifiers, results):
+            data_repo.add(AnalysisIdentifier(on=identifier, analysis=analysis.name), result)
+
+def _run_parallel(analysis: ParallelAnalysis, data_repo: DataRepository, identifiers, workers):
+    """ Run the analysis method for each identifier on a pool of workers sharing the data. """
+    shared_ids = list(identifiers)
+    if(analysis.shared is not None):
+        analyzed = set(identifiers)
+        shared_ids += [identifier for identifier in filter_ids(data_repo, analysis.shared) if identifier not in analyzed]
+
+    segments = []
+    try:
+        shared_data = [(identifier, _share_data(data_repo.get_data(identifier), segments)) for identifier in shared_ids]
+
+        context = _get_context()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(analysis.method, shared_data)) as executor:
+            return list(executor.map(_run_task, identifiers))
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+def _get_context():
+    """
+    Get the multiprocessing context of the pools. The fork server imports this module (and with
+        it pandas/numpy) once, so the workers forked from it start without importing them.
+    """
+    if("forkserver" not in multiprocessing.get_all_start_methods()):
+        return multiprocessing.get_context("spawn")
+
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+def _share_data(data, segments):
+    """
+    Get the description of an identifier's data the workers rebuild it from, see _unshare_data.
+        The values of Grafana DataFrames are copied into a new shared memory segment, which is
+        appended to segments.
+    """
+    if(not isinstance(data, pd.DataFrame)):
+        return ("data", data)
+
+    has_time = len(data.columns) > 0 and data.columns[0] == "Time"
+    values = data[data.columns[1:]] if has_time else data
+    if(values.size == 0 or not (values.dtypes == np.float64).all()):
+        return ("data", data)
+
+    segment = shared_memory.SharedMemory(create=True, size=values.size*np.dtype(np.float64).itemsize)
+    segments.append(segment)
+    np.ndarray(values.shape, dtype=np.float64, buffer=segment.buf)[:] = values.to_numpy()
+
+    attrs = dict(data.attrs)
+    # The table's memoized keys are left behind, the workers build their own
+    if(isinstance(attrs.get(LABELS_ATTR), LabelTable)):
+        attrs[LABELS_ATTR] = attrs[LABELS_ATTR].to_dict()
+
+    time = data["Time"].tolist() if has_time else None
+    return ("frame", segment.name, values.shape, list(values.columns), time, attrs)
+
+# The analysis method, DataRepository and attached segments of a worker process
+_worker_state = None
+
+def _init_worker(method, shared_data):
+    """ Build the worker's DataRepository from the shared data. """
+    global _worker_state
+
+    data_repo = DataRepository()
+    segments = []
+    for identifier, description in shared_data:
+        data_repo.add(identifier, _unshare_data(description, segments))
+
+    _worker_state = (method, data_repo, segments)
+
+def _unshare_data(description, segments):
+    """ Rebuild an identifier's data from its _share_data description. """
+    if(description[0] == "data"):
+        return description[1]
+
+    _, name, shape, columns, time, attrs = description
+    segment = _attach_segment(name)
+    segments.append(segment)
+
+    values = np.ndarray(shape, dtype=np.float64, buffer=segment.buf)
+    # Every worker reads the same segment
+    values.flags.writeable = False
+    df = pd.DataFrame(values, columns=columns, copy=False)
+    if(time is not None):
+        df.insert(0, "Time", time)
+
+    if(isinstance(attrs.get(LABELS_ATTR), dict)):
+        attrs[LABELS_ATTR] = LabelTable.from_dict(attrs[LABELS_ATTR])
+    df.attrs = attrs
+
+    return df
+
+def _attach_segment(name):
+    """ Attach a segment created by the main process, which is the one unlinking it. """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the segment with the resource tracker, the
+        #   workers share the main process' tracker so it's already registered
+        return shared_memory.SharedMemory(name=name)
+
+def _run_task(identifier):
+    """ Run the analysis method in a worker on its DataRepository. """
+    method, data_repo, _ = _worker_state
+    return method(identifier, data_repo)
@@ -3,6 +3,7 @@ from typing import Callable
 import pandas as pd
 
 from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier, SummaryIdentifier
+from plugins.rci_plugins.rci_index import filter_ids
 from src.data.data_repository import DataRepository
 from src.data.filters import filter_type
 from src.data.identifier import AnalysisIdentifier, Identifier
@@ -37,7 +38,7 @@ class SelectSortedDriver(AnalysisDriverPlugin):
         
         has_rank = analysis.rank_col_name is not None
 
-        identifiers = data_repo.filter_ids(analysis.filter)
+        identifiers = filter_ids(data_repo, analysis.filter)
         for identifier in identifiers:
             df = data_repo.get_data(identifier).copy()
 
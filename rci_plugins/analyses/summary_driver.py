@@ -2,8 +2,8 @@ from dataclasses import dataclass
 import pandas as pd
 
 from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier, SummaryIdentifier
+from plugins.rci_plugins.rci_index import get_identifier_index
 from src.data.data_repository import DataRepository
-from src.data.filters import filter_type
 from src.data.identifier import AnalysisIdentifier
 from src.parameter_utils import ConfigurationException
 from src.plugin_mgmt.plugins import Analysis, AnalysisDriverPlugin
@@ -85,7 +85,7 @@ class SummaryDriver(AnalysisDriverPlugin):
     def run_analysis(self, analysis, prog_data: ProgramData, config_section: dict):
         data_repo: DataRepository = prog_data.data_repo
     
-        identifiers = data_repo.filter_ids(filter_type(GrafanaIdentifier))
+        identifiers = get_identifier_index(data_repo).get_source_ids()
         for identifier in identifiers:
             start_ts = identifier.start_ts
             end_ts = identifier.end_ts
@@ -1,18 +1,19 @@
 from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 
-from plugins.rci_plugins.rci_filters import grafana_analysis_key
 from plugins.rci_plugins.rci_identifiers import TideSplitIdentifier
+from plugins.rci_plugins.rci_index import IdentifierIndex, get_identifier_index
 from src.data.data_repository import DataRepository
-from src.data.filters import filter_type
 from src.data.identifier import TimeStampIdentifier
 from src.plugin_mgmt.plugins import Analysis, AnalysisDriverPlugin
 from src.program_data import ProgramData
-from src.utils.datautils import resolve_analysis
 from src.utils.timeutils import get_range_printable
 
 import plugins.rci_plugins.analyses.tidesplit_driver as pkg
 
+TIDE_SPLIT_TYPES = ["cpu", "gpu"]
+
 @dataclass(frozen=True)
 class TideSplitAnalysis(Analysis):
     """ A wrapper for the standard analysis so we can capture it with the SummaryDriver. """
@@ -27,123 +28,97 @@ class TideSplitDriver(AnalysisDriverPlugin):
     
         # CSU v NRP cpu, tainted v untainted cpu, CSU v NRP gpu, tainted v untainted gpu 
 
-        ts_identifiers = data_repo.filter_ids(filter_type(TimeStampIdentifier, strict=True))
-        ts_identifiers.sort(key=lambda id: id.start_ts)
-
-        for ts_identifier in ts_identifiers:
-            for type in ["cpu", "gpu"]:
-                data = _get_data(data_repo, ts_identifier, type)
-                identifier = TideSplitIdentifier(on=ts_identifier, analysis=analysis.name, type=type)
-
-                data_repo.add(identifier, data)
-
-def _get_data(data_repo: DataRepository, ts_identifier, type):
-    available_hours_type_key = lambda id: (id.type, id.config)
+        index = get_identifier_index(data_repo)
+        ts_identifiers = index.get_timestamp_ids()
 
-    hrs_id_csu = resolve_analysis(data_repo, ts_identifier.start_ts, ts_identifier.end_ts, f"{type}hourstotal", key_method=grafana_analysis_key, unique_key="csu")
-    hrs_id_noncsu = resolve_analysis(data_repo, ts_identifier.start_ts, ts_identifier.end_ts, f"{type}hourstotal", key_method=grafana_analysis_key, unique_key="non-csu")
-    hrs_id_tainted = resolve_analysis(data_repo, ts_identifier.start_ts, ts_identifier.end_ts, f"{type}hourstotal", key_method=grafana_analysis_key, unique_key="tainted")
-    hrs_id_untainted = resolve_analysis(data_repo, ts_identifier.start_ts, ts_identifier.end_ts, f"{type}hourstotal", key_method=grafana_analysis_key, unique_key="untainted")
-    
-    avail_hrs_id_default = resolve_analysis(data_repo, ts_identifier.start_ts, ts_identifier.end_ts, f"{type}hoursavailable", key_method=available_hours_type_key, unique_key=(type, "default"))
-    avail_hrs_id_tainted = resolve_analysis(data_repo, ts_identifier.start_ts, ts_identifier.end_ts, f"{type}hoursavailable", key_method=available_hours_type_key, unique_key=(type, "tainted"))
-    avail_hrs_id_untainted = resolve_analysis(data_repo, ts_identifier.start_ts, ts_identifier.end_ts, f"{type}hoursavailable", key_method=available_hours_type_key, unique_key=(type, "untainted"))
+        splits = {type: get_tide_split(data_repo, index, ts_identifiers, type) for type in TIDE_SPLIT_TYPES}
 
-    hrs_csu = float(data_repo.get_data(hrs_id_csu)) if data_repo.contains(hrs_id_csu) else 0
-    hrs_noncsu = float(data_repo.get_data(hrs_id_noncsu)) if data_repo.contains(hrs_id_noncsu) else 0
-    hrs_tainted = float(data_repo.get_data(hrs_id_tainted)) if data_repo.contains(hrs_id_tainted) else 0
-    hrs_untainted = float(data_repo.get_data(hrs_id_untainted)) if data_repo.contains(hrs_id_untainted) else 0
+        for idx, ts_identifier in enumerate(ts_identifiers):
+            for type in TIDE_SPLIT_TYPES:
+                identifier = TideSplitIdentifier(on=ts_identifier, analysis=analysis.name, type=type)
 
-    avail_hrs_default = float(data_repo.get_data(avail_hrs_id_default)) if data_repo.contains(avail_hrs_id_default) else 0
-    avail_hrs_tainted = float(data_repo.get_data(avail_hrs_id_tainted)) if data_repo.contains(avail_hrs_id_tainted) else 0
-    avail_hrs_untainted = float(data_repo.get_data(avail_hrs_id_untainted)) if data_repo.contains(avail_hrs_id_untainted) else 0
+                data_repo.add(identifier, tuple(splits[type][idx].tolist()))
+
+def get_tide_split_columns(type):
+    """ The tidesplitmeta columns of a type, in the order of a tide split tuple. """
+    type = type.upper()
+    return [f"CSU {type} Hours", f"Non-CSU {type} Hours", f"{type} Hours Idle", f"{type} Hours Available",
+            f"Tainted {type} Hours", f"Tainted {type} Hours Idle", f"Tainted {type} Hours Available",
+            f"Untainted {type} Hours", f"Untainted {type} Hours Idle", f"Untainted {type} Hours Available"]
+
+def get_tide_split(data_repo: DataRepository, index: IdentifierIndex, ts_identifiers, type):
+    """
+    Compute the tide split of a type for every period at once.
+
+    Args:
+        data_repo (DataRepository): The repository holding the hours total and available analyses.
+        index (IdentifierIndex): The repository's identifier index.
+        ts_identifiers (list[TimeStampIdentifier]): The periods.
+        type (str): The resource type, cpu or gpu.
+    Returns:
+        np.ndarray: A (periods, 10) matrix, each row is the period's tide split in the order of
+            get_tide_split_columns. Hours of analyses that weren't run for a period are 0.
+    """
+    analyses = [f"{type}hourstotal", f"{type}hoursavailable"]
+
+    # (analysis, (start_ts, end_ts), cfg) -> hours, gathered in one pass over the index buckets
+    values = {}
+    for analysis in analyses:
+        for period, keys in index.get_analysis_periods(analysis).items():
+            for (id_type, cfg), identifiers in keys.items():
+                if(id_type != type or len(identifiers) == 0):
+                    continue
+                if(len(identifiers) > 1):
+                    raise Exception(f"Can't resolve analysis \"{analysis}\" for {period[0]}-{period[1]}, {len(identifiers)} identifiers match the type {type} and cfg {cfg}.")
+
+                values[(analysis, period, cfg)] = float(data_repo.get_data(identifiers[0]))
+
+    periods = [(ts_identifier.start_ts, ts_identifier.end_ts) for ts_identifier in ts_identifiers]
+    def get_hours(analysis, cfg):
+        return np.array([values.get((analysis, period, cfg), 0.0) for period in periods])
+
+    hrs_csu = get_hours(f"{type}hourstotal", "csu")
+    hrs_noncsu = get_hours(f"{type}hourstotal", "non-csu")
+    hrs_tainted = get_hours(f"{type}hourstotal", "tainted")
+    hrs_untainted = get_hours(f"{type}hourstotal", "untainted")
+
+    avail_hrs_default = get_hours(f"{type}hoursavailable", "default")
+    avail_hrs_tainted = get_hours(f"{type}hoursavailable", "tainted")
+    avail_hrs_untainted = get_hours(f"{type}hoursavailable", "untainted")
 
     idle_csunoncsu = avail_hrs_default - hrs_csu - hrs_noncsu
     idle_tainted = avail_hrs_tainted - hrs_tainted
     idle_untainted = avail_hrs_untainted - hrs_untainted
 
-    return hrs_csu, hrs_noncsu, idle_csunoncsu, avail_hrs_default, hrs_tainted, idle_tainted, avail_hrs_tainted, hrs_untainted, idle_untainted, avail_hrs_untainted
+    return np.column_stack([hrs_csu, hrs_noncsu, idle_csunoncsu, avail_hrs_default, hrs_tainted, idle_tainted, avail_hrs_tainted, hrs_untainted, idle_untainted, avail_hrs_untainted])
 
 def aggregate_tide_split(identifiers, data_repo: DataRepository):
-
-    columns = ["Period", 
-               "CSU CPU Hours", "Non-CSU CPU Hours", "CPU Hours Idle", "CPU Hours Available",
-               "Tainted CPU Hours", "Tainted CPU Hours Idle", "Tainted CPU Hours Available",
-               "Untainted CPU Hours", "Untainted CPU Hours Idle", "Untainted CPU Hours Available",
-               "CSU GPU Hours", "Non-CSU GPU Hours", "GPU Hours Idle", "GPU Hours Available",
-               "Tainted GPU Hours", "Tainted GPU Hours Idle", "Tainted GPU Hours Available",
-               "Untainted GPU Hours", "Untainted GPU Hours Idle", "Untainted GPU Hours Available"]
-
-    identifiers.sort(key=lambda id: id.find_base().start_ts)
-    out_df = pd.DataFrame(columns=columns)
-
-    current_ts = None
-    cpu_id = None
-    gpu_id = None
-
-    def add_to_df():
-        # Create a tuple of zeroes that corresponds with each variable for default purposes
-        zero_tuple = (0, 0, 0, 0,
-                      0, 0, 0,
-                      0, 0, 0)
-        
-        if(data_repo.contains(cpu_id)):            
-            (cpu_hrs_csu, cpu_hrs_noncsu, cpu_idle_csunoncsu, cpu_avail_hrs_default, 
-             cpu_hrs_tainted, cpu_idle_tainted, cpu_avail_hrs_tainted, 
-             cpu_hrs_untainted, cpu_idle_untainted, cpu_avail_hrs_untainted) = data_repo.get_data(cpu_id)
-        else:
-            (cpu_hrs_csu, cpu_hrs_noncsu, cpu_idle_csunoncsu, cpu_avail_hrs_default, 
-             cpu_hrs_tainted, cpu_idle_tainted, cpu_avail_hrs_tainted, 
-             cpu_hrs_untainted, cpu_idle_untainted, cpu_avail_hrs_untainted) = zero_tuple
-            print(f"WARNING: Aggregating tide split results failed to find cpu tide split analysis for {current_ts}")
-
-        if(data_repo.contains(gpu_id)):            
-            (gpu_hrs_csu, gpu_hrs_noncsu, gpu_idle_csunoncsu, gpu_avail_hrs_default, 
-             gpu_hrs_tainted, gpu_idle_tainted, gpu_avail_hrs_tainted, 
-             gpu_hrs_untainted, gpu_idle_untainted, gpu_avail_hrs_untainted) = data_repo.get_data(gpu_id)
-        else:
-            (gpu_hrs_csu, gpu_hrs_noncsu, gpu_idle_csunoncsu, gpu_avail_hrs_default, 
-             gpu_hrs_tainted, gpu_idle_tainted, gpu_avail_hrs_tainted, 
-             gpu_hrs_untainted, gpu_idle_untainted, gpu_avail_hrs_untainted) = zero_tuple
-            print(f"WARNING: Aggregating tide split results failed to find gpu tide split analysis for {current_ts}")
-
-        row = [
-            get_range_printable(current_ts.start_ts, current_ts.end_ts),
-            cpu_hrs_csu, cpu_hrs_noncsu, cpu_idle_csunoncsu, cpu_avail_hrs_default, 
-            cpu_hrs_tainted, cpu_idle_tainted, cpu_avail_hrs_tainted, 
-            cpu_hrs_untainted, cpu_idle_untainted, cpu_avail_hrs_untainted,
-            gpu_hrs_csu, gpu_hrs_noncsu, gpu_idle_csunoncsu, gpu_avail_hrs_default, 
-            gpu_hrs_tainted, gpu_idle_tainted, gpu_avail_hrs_tainted, 
-            gpu_hrs_untainted, gpu_idle_untainted, gpu_avail_hrs_untainted
-        ]
-
-        out_df.loc[len(out_df)] = row
-
-    def clear_ids():
-        global cpu_id, gpu_id
-        
-        cpu_id = None
-        gpu_id = None
-
-    for identifier in identifiers:
-        
-        looking_at_ts = TimeStampIdentifier(identifier.find_base().start_ts, identifier.find_base().end_ts)
-
-        if(looking_at_ts != current_ts):
-            if(current_ts is not None):
-                # Add the current timestamps to df
-                add_to_df()
-                clear_ids()
-
-            current_ts = looking_at_ts
-        
-        if(identifier.type == "cpu"):
-            cpu_id = identifier
-        elif(identifier.type == "gpu"):
-            gpu_id = identifier
-        else:
+    """
+    Build the tidesplitmeta DataFrame, a row per period with the cpu and gpu tide splits. The
+        tide splits are gathered into a matrix per type and the DataFrame is built from the
+        columns in one go.
+    """
+    # The cpu and gpu identifier of each period, ordered by start_ts
+    period_ids = {}
+    for identifier in sorted(identifiers, key=lambda id: id.find_base().start_ts):
+        if(identifier.type not in TIDE_SPLIT_TYPES):
             raise Exception(f"Don't know how to handle tidesplit identifier type \"{identifier.type}\"")
-        
-    add_to_df()
 
-    return out_df
\ No newline at end of file
+        base = identifier.find_base()
+        period_ids.setdefault((base.start_ts, base.end_ts), {})[identifier.type] = identifier
+
+    periods = list(period_ids.keys())
+    out_data = {"Period": [get_range_printable(start_ts, end_ts) for start_ts, end_ts in periods]}
+
+    for type in TIDE_SPLIT_TYPES:
+        splits = np.zeros((len(periods), len(get_tide_split_columns(type))))
+        for idx, period in enumerate(periods):
+            identifier = period_ids[period].get(type)
+            if(identifier is not None and data_repo.contains(identifier)):
+                splits[idx] = data_repo.get_data(identifier)
+            else:
+                print(f"WARNING: Aggregating tide split results failed to find {type} tide split analysis for {TimeStampIdentifier(*period)}")
+
+        out_data.update(zip(get_tide_split_columns(type), splits.T))
+
+    return pd.DataFrame(out_data)
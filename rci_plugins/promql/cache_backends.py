@@ -0,0 +1,247 @@
+"""
+Cache backends store the pulled Grafana DataFrames on disk. Each backend is given a path base (the
+  cache path without a file extension) and decides how the DataFrame is laid out from there.
+"""
+
+from abc import ABC, abstractmethod
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from plugins.rci_plugins.promql.label_table import encode_attrs, decode_attrs
+from src.utils.timeutils import to_unix_ts, from_unix_ts
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+class CacheBackend(ABC):
+    """
+    Base class for a cached DataFrame file format. Subclasses store the frame itself, non-empty
+        DataFrame.attrs (like the label table) are kept in a .attrs.json file next to it for
+        every format. Files are written to a temporary file that then replaces the cached file,
+        a DataFrame still memory-mapping the old file keeps reading the old contents.
+    """
+    name = None
+    extension = None
+
+    def get_path(self, path_base):
+        return path_base + self.extension
+
+    def get_attrs_path(self, path_base):
+        return path_base + ".attrs.json"
+
+    def exists(self, path_base):
+        return os.path.exists(self.get_path(path_base))
+
+    def write(self, path_base, df: pd.DataFrame):
+        self._write_df(path_base, df)
+
+        attrs_path = self.get_attrs_path(path_base)
+        if(len(df.attrs) > 0):
+            _write_replacing(attrs_path, "w", lambda file: json.dump(encode_attrs(df.attrs), file))
+        elif(os.path.exists(attrs_path)):
+            os.remove(attrs_path)
+
+    def read(self, path_base) -> pd.DataFrame:
+        df = self._read_df(path_base)
+
+        attrs_path = self.get_attrs_path(path_base)
+        if(os.path.exists(attrs_path)):
+            with open(attrs_path, "r") as file:
+                df.attrs = decode_attrs(json.load(file))
+
+        return df
+
+    def remove(self, path_base):
+        os.remove(self.get_path(path_base))
+
+        attrs_path = self.get_attrs_path(path_base)
+        if(os.path.exists(attrs_path)):
+            os.remove(attrs_path)
+
+    @abstractmethod
+    def _write_df(self, path_base, df: pd.DataFrame):
+        pass
+
+    @abstractmethod
+    def _read_df(self, path_base) -> pd.DataFrame:
+        pass
+
+class CSVCacheBackend(CacheBackend):
+    """ The original plain .csv cache, kept for compatibility. """
+    name = "csv"
+    extension = ".csv"
+
+    def _write_df(self, path_base, df: pd.DataFrame):
+        _write_replacing(self.get_path(path_base), "w", lambda file: df.to_csv(file, index=False))
+
+    def _read_df(self, path_base) -> pd.DataFrame:
+        return pd.read_csv(self.get_path(path_base))
+
+class NpyCacheBackend(CacheBackend):
+    """
+    Stores the values as a single float64 .npy matrix with a .json sidecar holding the column
+        names and the Time column as unix timestamps. Loads are memory-mapped copy-on-write, so
+        reading the matrix doesn't copy it and the loaded DataFrame is still safe to modify.
+    """
+    name = "npy"
+    extension = ".npy"
+
+    def get_sidecar_path(self, path_base):
+        return path_base + ".json"
+
+    def exists(self, path_base):
+        return super().exists(path_base) and os.path.exists(self.get_sidecar_path(path_base))
+
+    def _write_df(self, path_base, df: pd.DataFrame):
+        sidecar = {
+            "columns": list(df.columns[1:]),
+            "time": [to_unix_ts(time) for time in df["Time"]]
+        }
+
+        self._write_values(path_base, df.iloc[:, 1:].to_numpy(dtype=np.float64))
+        _write_replacing(self.get_sidecar_path(path_base), "w", lambda file: json.dump(sidecar, file))
+
+    def _read_df(self, path_base) -> pd.DataFrame:
+        with open(self.get_sidecar_path(path_base), "r") as file:
+            sidecar = json.load(file)
+
+        values = self._read_values(path_base)
+
+        df = pd.DataFrame(values, columns=sidecar["columns"], copy=False)
+        df.insert(0, "Time", [from_unix_ts(time) for time in sidecar["time"]])
+        return df
+
+    def remove(self, path_base):
+        super().remove(path_base)
+        os.remove(self.get_sidecar_path(path_base))
+
+    def _write_values(self, path_base, values: np.ndarray):
+        _write_replacing(self.get_path(path_base), "wb", lambda file: np.save(file, values))
+
+    def _read_values(self, path_base) -> np.ndarray:
+        return np.load(self.get_path(path_base), mmap_mode="c")
+
+class NpzCacheBackend(NpyCacheBackend):
+    """
+    The npy layout with the matrix deflate compressed into a .npz archive. Pod columns are NaN
+        for most of the period so the matrix compresses very well, loads decompress into memory
+        instead of being memory-mapped.
+    """
+    name = "npz"
+    extension = ".npz"
+
+    def _write_values(self, path_base, values: np.ndarray):
+        _write_replacing(self.get_path(path_base), "wb", lambda file: np.savez_compressed(file, values=values))
+
+    def _read_values(self, path_base) -> np.ndarray:
+        with np.load(self.get_path(path_base)) as archive:
+            return archive["values"]
+
+class ParquetCacheBackend(CacheBackend):
+    """
+    Stores the DataFrame as a zstd compressed Parquet file with the Time column as unix
+        timestamps. Reads are memory-mapped. Requires pyarrow.
+    """
+    name = "parquet"
+    extension = ".parquet"
+
+    def __init__(self):
+        if(pyarrow is None):
+            raise Exception("The parquet cache format requires pyarrow, install it or use the npy or csv cache format.")
+
+    def _write_df(self, path_base, df: pd.DataFrame):
+        df = df.copy(deep=False)
+        # The attrs are stored by the base class, pandas would try to put them in the metadata
+        df.attrs = {}
+        df["Time"] = np.array([to_unix_ts(time) for time in df["Time"]], dtype=np.int64)
+        _write_replacing(self.get_path(path_base), "wb", lambda file: df.to_parquet(file, engine="pyarrow", compression="zstd", index=False))
+
+    def _read_df(self, path_base) -> pd.DataFrame:
+        df = pd.read_parquet(self.get_path(path_base), engine="pyarrow", memory_map=True)
+        df["Time"] = df["Time"].map(from_unix_ts)
+        return df
+
+CACHE_BACKENDS = {backend.name: backend for backend in [CSVCacheBackend, NpyCacheBackend, NpzCacheBackend, ParquetCacheBackend]}
+
+# Memory-mapped loads over smaller files, the npz format trades load time for disk space
+DEFAULT_CACHE_FORMAT = "npy"
+
+def _write_replacing(path, mode, write):
+    """
+    Write a file by calling write(file) on a temporary file, which then atomically replaces the
+        file at the path. The old file is unlinked instead of overwritten, memory maps of it stay
+        valid and a failed write leaves it untouched.
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, mode) as file:
+            write(file)
+        os.replace(tmp_path, path)
+    finally:
+        if(os.path.exists(tmp_path)):
+            os.remove(tmp_path)
+
+def get_cache_backend(cache_format=None) -> CacheBackend:
+    """
+    Get the cache backend for the format name, one of CACHE_BACKENDS' keys.
+
+    Args:
+        cache_format (str): The format name, defaults to DEFAULT_CACHE_FORMAT.
+    Returns:
+        CacheBackend: The backend for the format.
+    """
+    if(cache_format is None):
+        cache_format = DEFAULT_CACHE_FORMAT
+
+    if(cache_format not in CACHE_BACKENDS):
+        raise Exception(f"Unknown cache format \"{cache_format}\", options are: {', '.join(CACHE_BACKENDS.keys())}")
+
+    return CACHE_BACKENDS[cache_format]()
+
+def find_cached_backend(path_base, preferred: CacheBackend):
+    """
+    Find the backend that holds a cached DataFrame at the path base, checking the preferred
+        backend first and then every other format.
+
+    Returns:
+        CacheBackend: The backend with an existing file, None if nothing is cached.
+    """
+    if(preferred.exists(path_base)):
+        return preferred
+
+    for backend_type in CACHE_BACKENDS.values():
+        if(backend_type.name == preferred.name or (backend_type is ParquetCacheBackend and pyarrow is None)):
+            continue
+
+        backend = backend_type()
+        if(backend.exists(path_base)):
+            return backend
+
+    return None
+
+def read_cached(path_base, preferred: CacheBackend) -> pd.DataFrame:
+    """
+    Read the cached DataFrame at the path base. If it's stored in a different format than the
+        preferred backend it is rewritten in the preferred format and the old file is removed, so
+        existing caches migrate the first time they're used.
+
+    Returns:
+        pd.DataFrame: The cached DataFrame, None if nothing is cached.
+    """
+    backend = find_cached_backend(path_base, preferred)
+    if(backend is None):
+        return None
+
+    df = backend.read(path_base)
+
+    if(backend.name != preferred.name):
+        # Detach from the old files before removing them, formats can share the sidecar file
+        df = df.copy()
+        backend.remove(path_base)
+        preferred.write(path_base, df)
+
+    return df
@@ -1,26 +1,19 @@
 import datetime
 import pandas as pd
 
+from plugins.rci_plugins.promql.label_table import get_column_labels
 from plugins.rci_plugins.promql.settings import settings
 from src.utils.timeutils import to_unix_ts
 
-def _extract_column_data(col_name):
+JOBS_ATTR = "jobs_by_namespace"
+""" The DataFrame.attrs key holding the namespace->job count dictionary of an aggregate DataFrame. """
+
+def is_aggregate_df(df):
     """
-    Given a column name with the format {label1="value1", label2="value2",...} break it down into a
-      usable python dictionary.
+    Check if a Grafana DataFrame was pulled in aggregate mode. Aggregate DataFrames have a column
+        per namespace instead of per pod and carry their job counts in df.attrs.
     """
-    # Strip opening and closing {}
-    col_name = col_name[1:-1]
-    data = {}
-
-    for pair in col_name.split(', '):
-        pairsplit = pair.split('=')
-        label = pairsplit[0]
-        value = pairsplit[1][1:-1] # Grab the value without the first and last characters to remove quotes.
-
-        data[label] = value
-
-    return data
+    return JOBS_ATTR in df.attrs
 
 def get_resource_type(df):
     """
@@ -40,14 +33,12 @@ def get_resource_type(df):
             DataFrame, the settings["type_string"] doesn't contain the target type- the function
             won't be able to reverse the program type from the type string.
     """
-    col_datas = [_extract_column_data(col_name) for col_name in df.columns[1:]]
+    resources = get_column_labels(df, "resource")
+    if(resources.isna().any()):
+        raise Exception(f"Column \"{resources.index[resources.isna()][0]}\" doesn't have a resource type.")
 
     # Create a set of all the type strings, this will give a list of unique type names
-    type_set = set()
-    for col_data in col_datas:
-        if("resource" not in col_data.keys()):
-            raise Exception(f"Column \"{col_data}\" doesn't have a resource type.")
-        type_set.add(col_data["resource"])
+    type_set = set(resources.unique())
 
     # If the length of the set is more than one we have an invalid DF
     if(len(type_set) == 0):
@@ -1,4 +1,4 @@
-from plugins.rci_plugins.promql.grafana_df_analyzer import _extract_column_data
+from plugins.rci_plugins.promql.label_table import get_column_labels
 
 def has_time_column(df):
     return df.columns[0]=="Time"
@@ -15,23 +15,15 @@ def clear_duplicate_uids(df):
     Args:
     df (Pandas DataFrame): The DataFrame to deduplicate
     """
-    uids = set()
-
     if(has_time_column(df)):
         df = clear_time_column(df)
 
-    def is_not_duplicate(col_name):
-        nonlocal uids
-        col_data = _extract_column_data(col_name)
-        uid = col_data['uid']
-        if(uid in uids):
-            return False
-        else:
-            uids.add(uid)
-            return True
+    uids = get_column_labels(df, "uid")
+    if(uids.isna().any()):
+        raise Exception(f"Column \"{uids.index[uids.isna()][0]}\" doesn't have a uid.")
 
-    df_included_columns = [col_name for col_name in df.columns if is_not_duplicate(col_name)]
-    return df[df_included_columns]
+    # Keep the first column of each uid
+    return df.loc[:, ~uids.duplicated().to_numpy()]
 
 def clear_blacklisted_uids(df, blacklist):
     """
@@ -45,5 +37,5 @@ def clear_blacklisted_uids(df, blacklist):
     if(has_time_column(df)):
         df = clear_time_column(df)
 
-    df_included_columns = [col_name for col_name in df.columns if _extract_column_data(col_name)['uid'] not in blacklist]
-    return df[df_included_columns]
\ No newline at end of file
+    uids = get_column_labels(df, "uid")
+    return df.loc[:, ~uids.isin(blacklist).to_numpy()]
\ No newline at end of file
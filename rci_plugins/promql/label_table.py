@@ -0,0 +1,160 @@
+"""
+The label table holds the parsed labels of a Grafana DataFrame's columns, one row per column
+  name with a column per label (uid, namespace, pod, node, resource, ...). The ingest builds it
+  from the metric dictionaries in the query response and attaches it to the DataFrame in
+  df.attrs[LABELS_ATTR], so helpers look labels up instead of parsing the {k="v", ...} column
+  names again.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+LABELS_ATTR = "labels"
+""" The DataFrame.attrs key holding a Grafana DataFrame's LabelTable. """
+
+_LABEL_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+
+class LabelTable():
+    """
+    The labels of a set of column names. Tables are immutable, they are shared between every
+        DataFrame derived from the one they were attached to instead of being copied with the
+        DataFrame's attrs. Keys derived from the labels (see get_keys) are memoized on the table,
+        so they're shared the same way.
+    """
+
+    def __init__(self, labels: pd.DataFrame):
+        self._labels = labels
+        # Key name to the pd.Series of each column's key, see get_keys
+        self._keys = {}
+
+    @classmethod
+    def from_metrics(cls, columns, metrics):
+        """
+        Build the table from the metric dictionaries of a query response.
+
+        Args:
+            columns (list[str]): The column names.
+            metrics (list[dict]): The metric dictionary of each column.
+        """
+        labels = pd.DataFrame.from_records(metrics, index=pd.Index(columns))
+        return cls(labels[~labels.index.duplicated()])
+
+    @classmethod
+    def from_columns(cls, columns):
+        """ Build the table by parsing {k="v", ...} column names, for DataFrames without one. """
+        return cls.from_metrics(columns, [dict(_LABEL_PATTERN.findall(column)) for column in columns])
+
+    @classmethod
+    def union(cls, tables):
+        """ Combine tables, the first table with a column decides its labels. """
+        tables = [table for table in tables if table is not None]
+        if(len(tables) == 1):
+            return tables[0]
+
+        labels = pd.concat([table._labels for table in tables], sort=False)
+        return cls(labels[~labels.index.duplicated()])
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __copy__(self):
+        return self
+
+    def __len__(self):
+        return len(self._labels)
+
+    def covers(self, columns):
+        """ Check if the table has labels for every column. """
+        return bool(pd.Index(columns).isin(self._labels.index).all())
+
+    def get(self, label, columns) -> pd.Series:
+        """
+        Look up a label for each column.
+
+        Args:
+            label (str): The label name, like "uid" or "namespace".
+            columns (list[str]): The column names to get the label of.
+        Returns:
+            pd.Series: The label values indexed by column name, NaN where a column doesn't have
+                the label.
+        """
+        if(label not in self._labels.columns):
+            return pd.Series(np.nan, index=pd.Index(columns), dtype=object)
+
+        return self._labels[label].reindex(columns)
+
+    def get_keys(self, key, columns, compute_keys) -> np.ndarray:
+        """
+        Get a key for each column, like the namespace a column's hours are grouped by. The keys
+            of every column in the table are computed once per key and memoized on the table.
+
+        Args:
+            key (Hashable): The name of the key, like the function computing it.
+            columns (list[str]): The column names to get the key of, columns the table doesn't
+                have get NaN.
+            compute_keys (Callable[[pd.Index], np.ndarray]): Computes the key of each of the
+                table's columns.
+        Returns:
+            np.ndarray: The key of each column.
+        """
+        keys = self._keys.get(key)
+        if(keys is None):
+            keys = pd.Series(compute_keys(self._labels.index), index=self._labels.index, dtype=object)
+            self._keys[key] = keys
+
+        if(keys.index.equals(pd.Index(columns))):
+            return keys.to_numpy()
+        return keys.reindex(columns).to_numpy()
+
+    def to_dict(self):
+        """ Get a JSON serializable dictionary of the table, see from_dict. """
+        labels = self._labels.astype(object).where(self._labels.notna(), None)
+        return {"columns": list(labels.index), "labels": labels.to_dict(orient="list")}
+
+    @classmethod
+    def from_dict(cls, table_dict):
+        return cls(pd.DataFrame(table_dict["labels"], index=pd.Index(table_dict["columns"])))
+
+def get_label_table(df: pd.DataFrame) -> LabelTable:
+    """
+    Get the label table of a Grafana DataFrame. DataFrames without a table covering their columns
+        (like ones read from csv caches) get one parsed from their column names, which is then
+        attached so the columns are only parsed once.
+    """
+    columns = _get_label_columns(df)
+
+    table = df.attrs.get(LABELS_ATTR)
+    if(table is None or not table.covers(columns)):
+        table = LabelTable.from_columns(columns)
+        df.attrs[LABELS_ATTR] = table
+
+    return table
+
+def get_column_labels(df: pd.DataFrame, label) -> pd.Series:
+    """ Get a label for each column of a Grafana DataFrame, excluding the Time column. """
+    return get_label_table(df).get(label, _get_label_columns(df))
+
+def _get_label_columns(df: pd.DataFrame):
+    return df.columns[1:] if len(df.columns) > 0 and df.columns[0] == "Time" else df.columns
+
+def union_label_tables(dfs):
+    """ Get the combined label table of DataFrames, None if none of them has one. """
+    tables = [df.attrs.get(LABELS_ATTR) for df in dfs]
+    if(all(table is None for table in tables)):
+        return None
+
+    return LabelTable.union(tables)
+
+def encode_attrs(attrs):
+    """ Get JSON serializable DataFrame attrs, the label table is stored as its dictionary. """
+    attrs = dict(attrs)
+    if(LABELS_ATTR in attrs):
+        attrs[LABELS_ATTR] = attrs[LABELS_ATTR].to_dict()
+    return attrs
+
+def decode_attrs(attrs):
+    """ Restore DataFrame attrs written with encode_attrs. """
+    if(LABELS_ATTR in attrs):
+        attrs[LABELS_ATTR] = LabelTable.from_dict(attrs[LABELS_ATTR])
+    return attrs
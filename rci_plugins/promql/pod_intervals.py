@@ -0,0 +1,141 @@
+"""
+The pod interval store is a run-length representation of a Grafana DataFrame. Each column of a
+  Grafana DataFrame is a pod that's NaN for every step it isn't running, the store only keeps the
+  runs of steps where a pod holds the same value as (column, start_ts, end_ts, value) rows.
+A month of hourly steps is 744 rows per pod while most pods live for a few hours, so the store
+  is orders of magnitude smaller than the DataFrame it was built from.
+"""
+
+import numpy as np
+import pandas as pd
+
+from plugins.rci_plugins.promql.label_table import LABELS_ATTR, LabelTable, get_label_table
+from src.utils.timeutils import to_unix_ts, from_unix_ts
+
+class PodIntervalStore():
+    """
+    Holds the runs of a Grafana DataFrame. Run i is column columns[col_idxs[i]] holding values[i]
+        at every step from start_ts[i] to end_ts[i], both included. Runs are ordered by column
+        then start timestamp. labels is the LabelTable of the columns, parsed from the column
+        names if not provided.
+    """
+
+    def __init__(self, columns, times, step, col_idxs, start_ts, end_ts, values, labels: LabelTable = None):
+        self.columns = list(columns)
+        self.labels = labels if labels is not None else LabelTable.from_columns(self.columns)
+        self.times = np.asarray(times, dtype=np.int64)
+        self.step = step
+        self.col_idxs = np.asarray(col_idxs, dtype=np.int32)
+        self.start_ts = np.asarray(start_ts, dtype=np.int64)
+        self.end_ts = np.asarray(end_ts, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    @classmethod
+    def from_grafana_df(cls, df: pd.DataFrame, step=None):
+        """
+        Build the store from a Grafana DataFrame. A run ends where the column's value changes,
+            turns NaN or where the Time column skips a step.
+
+        Args:
+            df (pd.DataFrame): The Grafana DataFrame, a Time column followed by a column per pod.
+            step (int): The step in seconds, inferred from the Time column if not provided.
+        Returns:
+            PodIntervalStore: The store holding the runs of every column.
+        """
+        times = np.array([to_unix_ts(time) for time in df["Time"]], dtype=np.int64)
+        if(step is None):
+            diffs = np.diff(times)
+            step = int(diffs[diffs > 0].min()) if np.any(diffs > 0) else 1
+
+        matrix = df.drop(columns="Time").to_numpy(dtype=np.float64)
+        valid = ~np.isnan(matrix)
+
+        gaps = np.diff(times) > step
+        # Compare each row with the row before/after it, a run continues if both are valid, equal
+        #   and there's no gap in time between them
+        continues = valid[1:] & valid[:-1] & (matrix[1:] == matrix[:-1]) & ~gaps[:, None]
+
+        starts = valid.copy()
+        starts[1:] &= ~continues
+        ends = valid.copy()
+        ends[:-1] &= ~continues
+
+        # Transposed so the runs come out ordered by column, then row. Every run has exactly one
+        #   start and one end so the two lists line up
+        start_cols, start_rows = np.nonzero(starts.T)
+        _, end_rows = np.nonzero(ends.T)
+
+        return cls(df.columns[1:], times, step, start_cols, times[start_rows], times[end_rows], matrix[start_rows, start_cols], get_label_table(df))
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        """ The bytes held by the store's arrays. """
+        return self.times.nbytes + self.col_idxs.nbytes + self.start_ts.nbytes + self.end_ts.nbytes + self.values.nbytes
+
+    def get_step_counts(self):
+        """ Get the amount of steps each run covers. """
+        return (self.end_ts - self.start_ts) // self.step + 1
+
+    def window(self, start_ts, end_ts):
+        """
+        Get the store for a sub window, runs are clipped to the steps inside the window.
+
+        Args:
+            start_ts (int): The first timestamp of the window.
+            end_ts (int): The last timestamp of the window.
+        Returns:
+            PodIntervalStore: A store holding only the window.
+        """
+        # Clip each run onto the steps of its own grid that fall inside the window
+        clip_start = self.start_ts + np.maximum(0, -((self.start_ts - start_ts) // self.step)) * self.step
+        clip_end = self.end_ts - np.maximum(0, -((end_ts - self.end_ts) // self.step)) * self.step
+        keep = clip_start <= clip_end
+
+        times = self.times[(self.times >= start_ts) & (self.times <= end_ts)]
+        return PodIntervalStore(self.columns, times, self.step, self.col_idxs[keep], clip_start[keep], clip_end[keep], self.values[keep], self.labels)
+
+    def get_column_labels(self, label) -> pd.Series:
+        """ Get a label for each column, see LabelTable.get. """
+        return self.labels.get(label, self.columns)
+
+    def get_column_totals(self):
+        """ Get the sum of each column's values over all steps, 0 for columns without runs. """
+        return np.bincount(self.col_idxs, weights=self.values * self.get_step_counts(), minlength=len(self.columns))
+
+    def to_grafana_df(self) -> pd.DataFrame:
+        """ Rebuild the Grafana DataFrame over the store's times. """
+        matrix = np.full((len(self.times), len(self.columns)), np.nan)
+
+        step_counts = self.get_step_counts()
+        # The time of every step of every run, placed on the row with that time
+        run_idxs = np.repeat(np.arange(len(self.values)), step_counts)
+        step_offsets = np.arange(len(run_idxs)) - np.repeat(np.cumsum(step_counts) - step_counts, step_counts)
+        rows = np.searchsorted(self.times, self.start_ts[run_idxs] + step_offsets * self.step)
+        matrix[rows, self.col_idxs[run_idxs]] = self.values[run_idxs]
+
+        df = pd.DataFrame(matrix, columns=self.columns, copy=False)
+        df.insert(0, "Time", [from_unix_ts(time) for time in self.times])
+        df.attrs[LABELS_ATTR] = self.labels
+        return df
+
+def analyze_jobs_onstore(store: PodIntervalStore, blacklisted_uuids=None):
+    """
+    Count the unique uids with usage per namespace. Like _analyze_jobs_byns_ondf, only the first
+        column of each uid is counted.
+
+    Returns:
+        dict: The namespace to job count.
+    """
+    totals = store.get_column_totals()
+    uids = store.get_column_labels("uid")
+
+    counted = ~uids.duplicated().to_numpy() & (totals > 0)
+    if(blacklisted_uuids is not None):
+        counted &= ~uids.isin(blacklisted_uuids).to_numpy()
+
+    # Columns without a namespace aren't counted, like in _analyze_jobs_byns_ondf
+    namespaces = store.get_column_labels("namespace")[counted]
+    return namespaces.value_counts(sort=False).to_dict()
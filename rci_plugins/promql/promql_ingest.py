@@ -1,11 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
+import json
+import numpy as np
 import os
 import pandas as pd
-import shutil
+import time
 from tqdm import tqdm
 import yaml
 
-from plugins.rci_plugins.promql.query_ingest import run, verify_query_config, DataFramePullException
+from plugins.rci_plugins.promql.grafana_df_analyzer import is_aggregate_df
+from plugins.rci_plugins.promql.label_table import LABELS_ATTR, union_label_tables
+from plugins.rci_plugins.promql.pod_intervals import PodIntervalStore
+from plugins.rci_plugins.promql.cache_backends import CacheBackend, get_cache_backend, find_cached_backend, read_cached
+from plugins.rci_plugins.promql.query_cache import CacheManifest, RunCheckpoint, get_cache_key, get_cache_path, get_complete_ts, get_last_step_ts, get_period_str
+from plugins.rci_plugins.promql.query_executor import configure_session, configure_responses, RESPONSE_MODES, FIXTURE_LOCATION
+from plugins.rci_plugins.promql.query_ingest import run, verify_query_config, DataFramePullException, StatusDFCache
+from plugins.rci_plugins.promql.query_preprocess import _infer_times
+from plugins.rci_plugins.promql.uid_index import get_uid_index
 from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
+from plugins.rci_plugins.rci_index import ObservableDataRepository
 from src.data.data_repository import DataRepository
 from src.data.timeline import Timeline
 from src.plugin_mgmt.plugins import IngestPlugin
@@ -34,14 +47,43 @@ class PromQLIngestController(IngestPlugin):
         if(not isinstance(config_section["query-cfgs"], list)):
             raise ConfigurationException("The query_cfgs section is not in the form of a list. PromQLIngestController query-cfgs section expects a list of names for query configs stored in the plugin_dir/ingest_configs/ directory.")
 
+        if("concurrency" in config_section):
+            concurrency = config_section["concurrency"]
+            if(not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1):
+                raise ConfigurationException(f"The concurrency section expects a positive integer amount of concurrent pulls, got: {concurrency}")
+
+        if("response-mode" in config_section and config_section["response-mode"] not in RESPONSE_MODES):
+            raise ConfigurationException(f"The response-mode section has unexpected mode \"{config_section['response-mode']}\". Options are: {', '.join(RESPONSE_MODES)}")
+
+        if("cache-format" in config_section):
+            try:
+                get_cache_backend(config_section["cache-format"])
+            except Exception as e:
+                raise ConfigurationException(f"The cache-format section is invalid: {e}")
+
+        main_periods = config_section.get("main-periods") is True
         for cfg_name in config_section["query-cfgs"]:
-            load_query_config(cfg_name=cfg_name, verify=True)
+            query_cfg = load_query_config(cfg_name=cfg_name, verify=True)
+
+            # Job counts are distinct uids over the pulled period, counts of sub periods can't be
+            #   stitched together since a pod can run in more than one of them
+            if(query_cfg.get("mode", "raw") == "aggregate" and not main_periods):
+                raise ConfigurationException(f"Query config \"{cfg_name}\" uses the aggregate mode, which requires main-periods to be true.")
 
         return True
 
     def ingest(self, prog_data: ProgramData, config_section: dict) -> DataRepository:
         
-        data_repo = DataRepository()
+        # Identifier to the DataFrame of each pulled period, consumed by stitch
+        period_dfs = {}
+
+        self.cache_backend: CacheBackend = get_cache_backend(config_section.get("cache-format"))
+        self.cache_manifest = CacheManifest.load()
+
+        response_mode = config_section.get("response-mode", "live")
+        configure_responses(response_mode, config_section.get("fixture-dir", FIXTURE_LOCATION))
+        # Recording and replaying go through every pull, the DataFrame cache would skip them
+        self.use_cache = response_mode == "live"
 
         # Select between main periods and sub periods
         period_list = prog_data.timeline.periods
@@ -50,103 +92,356 @@ class PromQLIngestController(IngestPlugin):
 
         # A dictionary of loaded cfg_name->config dictionary for flyweight pattern
         loaded_cfgs = {cfg_name: load_query_config(cfg_name) for cfg_name in config_section["query-cfgs"]}
-        # A list of (cfg_name, type, period) tuples to pull from Prometheus
+        self.checkpoint = RunCheckpoint.load(get_run_id(loaded_cfgs, period_list))
+        # A list of (cfg_name, type, period, pull_period) tuples to pull from Prometheus, the
+        #   pull_period is the part of the period that isn't cached yet
         pull_schedule = []
+        # Schedule index to the cached part of a still open period that the pull will extend
+        self._partial_dfs = {}
         cached_dfs = 0
+        checkpointed_pulls = 0
+        now = time.time()
 
         for cfg_name in config_section["query-cfgs"]:
-            for type in loaded_cfgs[cfg_name]["yieldstypes"]:
+            cfg = loaded_cfgs[cfg_name]
+            for type in cfg["yieldstypes"]:
                 for period in period_list:
 
-                    if(self.has_cached(loaded_cfgs[cfg_name], type, period)):
-                        cached_df = self.get_cached(cfg_name, type, period)
+                    if(self.has_cached(cfg, type, period)):
                         identifier = GrafanaIdentifier(period[0], period[1], type, cfg_name)
-                        data_repo.add(identifier, cached_df)
+                        period_dfs[identifier] = self.get_cached(cfg, type, period)
                         cached_dfs += 1
-                    else:
-                        pull_schedule.append((cfg_name, type, period))
-
-        print(f"PromQL: Using {cached_dfs} cached DataFrames, pulling {len(pull_schedule)} new DataFrames from Prometheus.")
-
-        if(len(pull_schedule) > 0):
-            cached_status_dfs = {}
-    
-            pbar = tqdm(pull_schedule, unit="query")
-            for pull_data in pbar:
-                cfg_name, type, period = pull_data
-                cfg = loaded_cfgs[cfg_name]
+                        continue
+
+                    # An interrupted run already pulled this and it came back empty
+                    if(self.checkpoint.is_empty(get_cache_key(cfg, type), period)):
+                        checkpointed_pulls += 1
+                        continue
+
+                    complete_ts = get_complete_ts(period, cfg["step"], now)
+                    if(complete_ts is None):
+                        # The period hasn't started yet, there's nothing to pull
+                        continue
+
+                    pull_start = period[0]
+                    # Aggregate job counts can't be extended with a delta pull, open periods are
+                    #   pulled from the start every run
+                    watermark = self.get_watermark(cfg, type, period) if cfg.get("mode", "raw") == "raw" else None
+                    if(watermark is not None):
+                        self._partial_dfs[len(pull_schedule)] = self.get_cached(cfg, type, period)
+                        pull_start = watermark + cfg["step"]
+                        # Nothing new to pull since the last run, use the cached part as is
+                        if(pull_start > complete_ts):
+                            pull_start = None
+
+                    pull_schedule.append((cfg_name, type, period, (pull_start, complete_ts) if pull_start is not None else None))
+
+        pull_cnt = len([pull_data for pull_data in pull_schedule if pull_data[3] is not None])
+        print(f"PromQL: Using {cached_dfs} cached DataFrames and {len(self._partial_dfs)} partially cached DataFrames, pulling {pull_cnt} new DataFrames from Prometheus.")
+        if(checkpointed_pulls > 0):
+            print(f"PromQL: Resuming an interrupted run, skipping {checkpointed_pulls} pulls that came back empty.")
+
+        if(pull_cnt > 0):
+            concurrency = config_section.get("concurrency", 1)
+            configure_session(pool_size=concurrency)
+
+            if(concurrency > 1):
+                pulled_dfs = self._pull_concurrent(loaded_cfgs, pull_schedule, concurrency)
+            else:
+                pulled_dfs = self._pull_serial(loaded_cfgs, pull_schedule)
+        else:
+            pulled_dfs = {}
 
-                pbar.set_description(f"{cfg_name} {type}@{get_range_printable(period[0], period[1], cfg["step"])}")
+        # Add in schedule order so the repository is identical regardless of pull mode
+        for schedule_idx, (cfg_name, type, period, _) in enumerate(pull_schedule):
+            if(schedule_idx in pulled_dfs):
+                df = pulled_dfs.pop(schedule_idx)
+            elif(schedule_idx in self._partial_dfs):
+                df = self._partial_dfs[schedule_idx]
+            else:
+                continue
 
-                try:
-                    pulled_df = run(cfg, type, period, cached_status_dfs)
-                except DataFramePullException as e:
-                    tqdm.write(str(e))
-                    continue
+            identifier = GrafanaIdentifier(period[0], period[1], type, cfg_name)
+            period_dfs[identifier] = df
 
-                identifier = GrafanaIdentifier(period[0], period[1], type, cfg_name)
-                data_repo.add(identifier, pulled_df)
+        # Drop the references so stitch is left holding the only ones
+        self._partial_dfs = {}
+        df = None
 
-                self.add_cached(loaded_cfgs[cfg_name], type, period, pulled_df)
+        sources = {identifier: self.get_source(loaded_cfgs[identifier.query_cfg], identifier.type, (identifier.start_ts, identifier.end_ts)) for identifier in period_dfs.keys()}
 
-        data_repo = stitch(timeline=prog_data.timeline, data_repo=data_repo)
+        data_repo = stitch(timeline=prog_data.timeline, period_dfs=period_dfs)
+        self._index_uids(data_repo, sources)
+        data_repo = to_interval_stores(data_repo, loaded_cfgs)
+        self.checkpoint.clear()
 
         print(f"PromQL: Done.")
 
         return data_repo
     
+    def _index_uids(self, data_repo: DataRepository, sources: dict):
+        """
+        Index the active uids of every stitched DataFrame so job counts are answered from the uid
+            index. A stitched DataFrame's source combines the sources of its sub periods, frames
+            already indexed by an earlier run from the same source are skipped without reading
+            them. Aggregate DataFrames have no per pod uids and aren't indexed.
+
+        Args:
+            sources (dict): The GrafanaIdentifier of each pulled period to its source, see
+                get_source.
+        """
+        # (cfg_name, type) to the (start_ts, end_ts, source) of its sub periods
+        sub_sources = {}
+        for identifier, source in sources.items():
+            sub_sources.setdefault((identifier.query_cfg, identifier.type), []).append((identifier.start_ts, identifier.end_ts, source))
+
+        uid_index = get_uid_index()
+        for identifier in data_repo.get_ids():
+            period = (identifier.start_ts, identifier.end_ts)
+            period_sources = [source for start_ts, end_ts, source in sub_sources.get((identifier.query_cfg, identifier.type), [])
+                              if start_ts >= period[0] and end_ts <= period[1]]
+
+            source = None
+            if(len(period_sources) > 0 and None not in period_sources):
+                source = hashlib.sha256("\n".join(sorted(period_sources)).encode("utf-8")).hexdigest()[:32]
+
+            if(source is not None and uid_index.has(identifier.query_cfg, identifier.type, period, source)):
+                continue
+
+            df = data_repo.get_data(identifier)
+            if(not is_aggregate_df(df)):
+                uid_index.add(identifier.query_cfg, identifier.type, period, df, source)
+
+        uid_index.save()
+
+    def _pull_serial(self, loaded_cfgs, pull_schedule):
+        """
+        Pull each (cfg_name, type, period, pull_period) tuple in the pull schedule one after
+            another.
+
+        Returns:
+            dict: The pull schedule index to pulled DataFrame, skipped pulls are absent.
+        """
+        cached_status_dfs = self.get_status_df_cache()
+        pulled_dfs = {}
+
+        pbar = tqdm([pull_data for pull_data in enumerate(pull_schedule) if pull_data[1][3] is not None], unit="query")
+        for schedule_idx, pull_data in pbar:
+            cfg_name, type, period, pull_period = pull_data
+            cfg = loaded_cfgs[cfg_name]
+
+            pbar.set_description(f"{cfg_name} {type}@{get_range_printable(pull_period[0], pull_period[1], cfg["step"])}")
+
+            try:
+                pulled_df = run(cfg, type, pull_period, cached_status_dfs, period)
+            except DataFramePullException as e:
+                tqdm.write(str(e))
+                self.checkpoint.add_empty(get_cache_key(cfg, type), period)
+                continue
+
+            pulled_dfs[schedule_idx] = self._store_pull(cfg, type, period, pull_period, pulled_df, self._partial_dfs.get(schedule_idx))
+
+        return pulled_dfs
+
+    def _pull_concurrent(self, loaded_cfgs, pull_schedule, concurrency):
+        """
+        Pull the (cfg_name, type, period, pull_period) tuples in the pull schedule on a pool of concurrency
+            threads. The largest pulls are submitted first so a long pull doesn't end up running
+            alone at the end of the schedule. Status DataFrames are still pulled once per
+            (status query, period) and shared between the threads that need them.
+
+        Returns:
+            dict: The pull schedule index to pulled DataFrame, skipped pulls are absent.
+        """
+        cached_status_dfs = self.get_status_df_cache()
+        pulled_dfs = {}
+
+        def pull_size(schedule_idx):
+            cfg_name, _, _, pull_period = pull_schedule[schedule_idx]
+            return (pull_period[1]-pull_period[0])/loaded_cfgs[cfg_name]["step"]
+
+        pull_idxs = [schedule_idx for schedule_idx in range(len(pull_schedule)) if pull_schedule[schedule_idx][3] is not None]
+        ordered_idxs = sorted(pull_idxs, key=pull_size, reverse=True)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {}
+            for schedule_idx in ordered_idxs:
+                cfg_name, type, period, pull_period = pull_schedule[schedule_idx]
+                future = executor.submit(run, loaded_cfgs[cfg_name], type, pull_period, cached_status_dfs, period)
+                futures[future] = schedule_idx
+
+            pbar = tqdm(total=len(futures), unit="query", desc=f"Pulling with {concurrency} threads")
+            try:
+                for future in as_completed(futures):
+                    schedule_idx = futures[future]
+                    cfg_name, type, period, pull_period = pull_schedule[schedule_idx]
+                    pbar.update(1)
+
+                    try:
+                        pulled_df = future.result()
+                    except DataFramePullException as e:
+                        tqdm.write(str(e))
+                        self.checkpoint.add_empty(get_cache_key(loaded_cfgs[cfg_name], type), period)
+                        continue
+
+                    # Cache writes stay on this thread, pulls for the same config share files
+                    pulled_dfs[schedule_idx] = self._store_pull(loaded_cfgs[cfg_name], type, period, pull_period, pulled_df, self._partial_dfs.get(schedule_idx))
+            except BaseException:
+                # Don't start the rest of the schedule if a pull failed
+                executor.shutdown(cancel_futures=True)
+                raise
+            finally:
+                pbar.close()
+
+        return pulled_dfs
+
+    def get_status_df_cache(self):
+        """ Get a status DataFrame cache for the pulls, backed by the DataFrame cache when it's used. """
+        if(not self.use_cache):
+            return StatusDFCache()
+
+        return StatusDFCache(self.cache_backend, self.cache_manifest)
+
+    def _store_pull(self, cfg, type, period, pull_period, pulled_df, partial_df):
+        """
+        Append a pulled DataFrame to the cached part of its period, if there is one, and cache the
+            result. If the pull didn't reach the end of the period the result is cached with a
+            watermark at the end of the pull so the next run only pulls what comes after it.
+
+        Returns:
+            pd.DataFrame: The DataFrame for the whole pulled part of the period.
+        """
+        if(partial_df is not None):
+            label_table = union_label_tables([partial_df, pulled_df])
+            pulled_df = pd.concat([partial_df, pulled_df], ignore_index=True, sort=False)
+            if(label_table is not None):
+                pulled_df.attrs[LABELS_ATTR] = label_table
+            if("status" in cfg["queries"]):
+                pulled_df = _infer_times(pulled_df, cfg["step"])
+
+        watermark = pull_period[1] if pull_period[1] < get_last_step_ts(period, cfg["step"]) else None
+        if(self.use_cache):
+            self.add_cached(cfg, type, period, pulled_df, watermark)
+
+        return pulled_df
+
     def has_cached(self, cfg, type, period):
         """
-        Check if we have the DataFrame cached for this configuration. It's important that the
-            configuration matches the configuration saved in the cache, this is so we can avoid
-            pulling inaccurate data if anything in the new config changes.
+        Check if we have the DataFrame cached for this configuration. Cache entries are keyed by
+            the rendered queries and step, so changes to a query config only miss the entries of
+            the queries that actually changed.
         
         Arguments:
             cfg (dict): The full query configuration dictionary.
             type (str): The type being pulled.
             period (tuple): The (start_ts, end_ts) period being pulled.
         """
-        cache_root = os.path.join(CACHE_LOCATION, cfg["cfg_name"])
-        if(not os.path.isdir(cache_root)):
+        if(not self.use_cache):
             return False
-        
-        cached_cfg = os.path.join(cache_root, "config.yaml")
-        if(not os.path.exists(cached_cfg)):
+
+        key = get_cache_key(cfg, type)
+        if(not self.cache_manifest.has(key, period)):
             return False
 
-        with open(cached_cfg, "r") as file:
-            cached = yaml.safe_load(file)
+        return find_cached_backend(get_cache_path(key, period), self.cache_backend) is not None
 
-        # If the provided config doesn't match the cached config, delete cache so it can be
-        #   rebuilt with the new config.
-        if(cfg != cached):
-            shutil.rmtree(cache_root)
-            return False
+    def get_watermark(self, cfg, type, period):
+        """
+        Get the last complete timestamp cached for a still open period.
+
+        Returns:
+            int: The watermark timestamp, None if there is no partially cached DataFrame.
+        """
+        if(not self.use_cache):
+            return None
 
-        return os.path.exists(get_cache_path(cfg["cfg_name"], type, period))
+        key = get_cache_key(cfg, type)
+        watermark = self.cache_manifest.get_watermark(key, period)
+        if(watermark is None or find_cached_backend(get_cache_path(key, period), self.cache_backend) is None):
+            return None
 
-    def get_cached(self, cfg_name, type, period):
-        cache_path = get_cache_path(cfg_name, type, period)
-        if(not os.path.exists(cache_path)):
-            raise Exception(f"Failed to find cached DataFrame at expected location: {cache_path}")
+        return watermark
 
-        return pd.read_csv(cache_path)
+    def get_source(self, cfg, type, period):
+        """
+        Get the source of a period's DataFrame in the DataFrame cache: its cache key, period and
+            watermark. The DataFrames of the same source have the same contents.
+
+        Returns:
+            str: The source, None if the DataFrame isn't cached.
+        """
+        if(not self.use_cache):
+            return None
+
+        key = get_cache_key(cfg, type)
+        if(self.cache_manifest.has(key, period)):
+            return f"{key}/{get_period_str(period)}/complete"
+
+        watermark = self.cache_manifest.get_watermark(key, period)
+        if(watermark is not None):
+            return f"{key}/{get_period_str(period)}/{watermark}"
+
+        return None
 
-    def add_cached(self, cfg, type, period, df: pd.DataFrame):
-        cfg_name = cfg["cfg_name"]
-        cache_root = os.path.join(CACHE_LOCATION, cfg_name)
+    def get_cached(self, cfg, type, period):
+        """
+        Read a cached DataFrame, caches stored in another format are migrated to the configured
+            cache format.
+        """
+        cache_path = get_cache_path(get_cache_key(cfg, type), period)
+        df = read_cached(cache_path, self.cache_backend)
+        if(df is None):
+            raise Exception(f"Failed to find cached DataFrame at expected location: {self.cache_backend.get_path(cache_path)}")
+
+        return df
+
+    def add_cached(self, cfg, type, period, df: pd.DataFrame, watermark=None):
+        """
+        Cache a DataFrame for the period, a watermark marks the DataFrame as only complete up to
+            the watermark timestamp.
+        """
+        key = get_cache_key(cfg, type)
+        cache_path = get_cache_path(key, period)
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.cache_backend.write(cache_path, df)
+
+        self.cache_manifest.add(key, period, cfg, type, watermark)
+        self.cache_manifest.save()
+
+def get_run_id(loaded_cfgs, period_list):
+    """
+    Get the id of an ingest run, runs pulling the same queries over the same periods share an id
+        and can resume each other's checkpoint.
+    """
+    cache_keys = sorted(get_cache_key(cfg, type) for cfg in loaded_cfgs.values() for type in cfg["yieldstypes"])
+    run_data = json.dumps({"cache_keys": cache_keys, "periods": [list(period) for period in period_list]})
+    return hashlib.sha256(run_data.encode("utf-8")).hexdigest()[:32]
+
+def to_interval_stores(data_repo: DataRepository, loaded_cfgs):
+    """
+    Replace the DataFrames of query configs with intervals: true by their pod interval stores.
+        The analyses of these query configs read the store instead of the DataFrame, which is
+        freed once the repository holding it is dropped.
+
+    Returns:
+        DataRepository: The repository holding the stores, the same repository if no query config
+            uses intervals.
+    """
+    if(not any(cfg.get("intervals", False) for cfg in loaded_cfgs.values())):
+        return data_repo
 
-        os.makedirs(cache_root, exist_ok=True)
+    out_data_repo = ObservableDataRepository()
+    for identifier in data_repo.get_ids():
+        data = data_repo.get_data(identifier)
 
-        cached_cfg = os.path.join(cache_root, "config.yaml")
-        with open(cached_cfg, "w") as file:
-            yaml.safe_dump(cfg, file)
+        cfg = loaded_cfgs[identifier.query_cfg]
+        if(cfg.get("intervals", False)):
+            data = PodIntervalStore.from_grafana_df(data, step=cfg["step"])
 
-        cache_dir_path = get_cache_dir(cfg_name, type)
-        os.makedirs(cache_dir_path, exist_ok=True)
+        out_data_repo.add(identifier, data)
 
-        cache_path = get_cache_path(cfg_name, type, period)
-        df.to_csv(cache_path, index=False)
+    return out_data_repo
 
 def load_query_config(cfg_name, verify=False):
     dir_path = os.path.dirname(os.path.abspath(__file__))
@@ -167,31 +462,21 @@ def load_query_config(cfg_name, verify=False):
 
     return query_cfg
 
-CACHE_LOCATION = "./io/cached_dfs"
-
-def get_cache_dir(cfg_name, type):
-    return os.path.join(CACHE_LOCATION, cfg_name, type)
-
-def get_cache_path(cfg_name, type, period):
-    cache_root = get_cache_dir(cfg_name, type)
-    start_ts, end_ts = period
-    file_name = f"{start_ts}-{end_ts}.csv"
-    return os.path.join(cache_root, file_name)
-
-def stitch(timeline: Timeline, data_repo: DataRepository):
+def stitch(timeline: Timeline, period_dfs: dict):
     """
     Stitch multiple periods of identifiers together. For example, if the data is broken down into
         week-long periods, stitch will join together the weeks into months.
 
     Args:
-        data_repo (DataRepository): The input repository, contains GrafanaIdentifiers to
-            be transformed.
+        period_dfs (dict): The GrafanaIdentifier to DataFrame of each pulled period. Entries are
+            removed as they're stitched so each sub period DataFrame can be freed once it's been
+            copied into its main period.
     
     Returns:
         DataRepository: The output DataRepository, contains SourceIdentifiers.
     """
 
-    out_data_repo = DataRepository()
+    out_data_repo = ObservableDataRepository()
 
     def key_func(identifier: GrafanaIdentifier):
         return (identifier.query_cfg, identifier.type)
@@ -200,7 +485,7 @@ def stitch(timeline: Timeline, data_repo: DataRepository):
 
     # Sort identifiers into buckets by key function
     # Data in each bucket can be ordered by time and stitched together
-    for identifier in data_repo.get_ids():
+    for identifier in period_dfs.keys():
         key = key_func(identifier)
         if(key not in buckets):
             buckets[key] = []
@@ -213,26 +498,12 @@ def stitch(timeline: Timeline, data_repo: DataRepository):
         if(len(identifiers) == 0):
             continue
 
-        df = pd.DataFrame()
-        # Stores a list of identifiers for this specific dataframe
-        df_ids = [] 
+        # Stores a list of identifiers for the main period we're stitching
+        df_ids = []
         # Store the current main period we're stitching, this is used to detect when we're done
         #   and to move on to the next main period.
         timeline_idx = 0
 
-        # Store the current data frame
-        def store_df():
-            nonlocal df, df_ids
-
-            new_identifier = GrafanaIdentifier(df_ids[0].start_ts, df_ids[-1].end_ts, df_ids[0].type, df_ids[0].query_cfg)
-            out_data_repo.add(new_identifier, df)
-
-        def reset_df():
-            nonlocal df, df_ids
-
-            df = pd.DataFrame()
-            df_ids = []
-
         identifiers.sort(key=lambda id: id.start_ts)
         for identifier in identifiers:
 
@@ -240,16 +511,77 @@ def stitch(timeline: Timeline, data_repo: DataRepository):
             if(identifier.start_ts > current_timeline_period[1]):
                 raise Exception(f"Failed to stitch! Identifier {identifier} passed it's main period target ending point. Is there an identifier with an end timestamp that matches end timestamp for a main-period?")
 
-            df_toadd = data_repo.get_data(identifier)
-            df = pd.concat([df, df_toadd], ignore_index=True, sort=False)
+            if(len(df_ids) > 0 and is_aggregate_df(period_dfs[identifier])):
+                raise Exception(f"Failed to stitch! Identifier {identifier} holds an aggregate DataFrame, its job counts can't be combined with other periods. Use main-periods with aggregate query configs.")
+
             df_ids.append(identifier)
 
             if(identifier.end_ts == current_timeline_period[1]):
-                store_df()
-                reset_df()
+                new_identifier = GrafanaIdentifier(df_ids[0].start_ts, df_ids[-1].end_ts, df_ids[0].type, df_ids[0].query_cfg)
+                out_data_repo.add(new_identifier, _concat_period_dfs(period_dfs, df_ids))
+                df_ids = []
                 timeline_idx += 1
 
         if(timeline_idx != len(timeline.main_periods)):
             raise Exception(f"Failed to stitch! Not all main periods were stitched, stopped at timeline index {timeline_idx} out of {len(timeline.main_periods)}")
 
-    return out_data_repo
\ No newline at end of file
+    return out_data_repo
+
+def _concat_period_dfs(period_dfs: dict, identifiers):
+    """
+    Concatenate the DataFrames of consecutive periods with a single copy, the result has the union
+        of their columns in order of appearance like pd.concat. The values are copied block by
+        block into one preallocated matrix and each DataFrame is removed from period_dfs as soon
+        as its block is filled, so at most one sub period is held twice.
+
+    Args:
+        period_dfs (dict): The GrafanaIdentifier to DataFrame dictionary, the identifiers' entries
+            are removed.
+        identifiers (list[GrafanaIdentifier]): The identifiers to concatenate, ordered by time.
+    Returns:
+        pd.DataFrame: The stitched DataFrame.
+    """
+    dfs = [period_dfs[identifier] for identifier in identifiers]
+    label_table = union_label_tables(dfs)
+
+    # A main period pulled as a single period, like every aggregate DataFrame, is used as is
+    if(len(dfs) == 1 and isinstance(dfs[0].index, pd.RangeIndex) and dfs[0].index.start == 0 and dfs[0].index.step == 1):
+        del period_dfs[identifiers[0]]
+        return dfs[0]
+
+    # Only Grafana DataFrames, a Time column followed by float columns, are copied into a matrix.
+    #   Anything else goes through pandas
+    if(not all(len(df.columns) > 0 and df.columns[0] == "Time" and (df.dtypes.iloc[1:] == np.float64).all() for df in dfs)):
+        for identifier in identifiers:
+            del period_dfs[identifier]
+        out_df = pd.concat(dfs, ignore_index=True, sort=False)
+    else:
+        value_dfs = [df.iloc[:, 1:] for df in dfs]
+        columns = pd.Index([])
+        for df in value_dfs:
+            columns = columns.append(df.columns.difference(columns, sort=False))
+        times = pd.concat([df["Time"] for df in dfs], ignore_index=True)
+        dfs = None
+
+        row_cnts = [len(df) for df in value_dfs]
+        # np.empty only commits memory as the blocks are written, alongside the freed sub periods
+        values = np.empty((sum(row_cnts), len(columns)))
+        row = 0
+        for idx, identifier in enumerate(identifiers):
+            block = values[row:row + row_cnts[idx]]
+            column_idxs = columns.get_indexer(value_dfs[idx].columns)
+            if(len(column_idxs) < len(columns)):
+                block.fill(np.nan)
+            block[:, column_idxs] = value_dfs[idx].to_numpy()
+            row += row_cnts[idx]
+
+            # Free the sub period
+            value_dfs[idx] = None
+            del period_dfs[identifier]
+
+        out_df = pd.DataFrame(values, columns=columns, copy=False)
+        out_df.insert(0, "Time", times)
+
+    if(label_table is not None):
+        out_df.attrs[LABELS_ATTR] = label_table
+    return out_df
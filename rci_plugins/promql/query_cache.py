@@ -0,0 +1,291 @@
+"""
+The query cache stores pulled DataFrames content-addressed. Each entry is keyed by a hash of the
+  rendered PromQL queries and step that produce it, with one file per cached period:
+  ./io/cached_dfs/<key>/<start_ts>-<end_ts>.<ext>
+Preprocessed status DataFrames are cached the same way under a key of just the status query.
+A single manifest.json indexes which periods are cached for each key. Editing a query only misses
+  the entries for that query, and ingest configs with identical queries share entries.
+Periods that are still open are cached with a watermark, the last timestamp they're complete up to,
+  so later runs only pull what comes after the watermark.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import yaml
+
+from plugins.rci_plugins.promql.query_designer import render_query
+
+CACHE_LOCATION = "./io/cached_dfs"
+MANIFEST_NAME = "manifest.json"
+CHECKPOINT_NAME = "checkpoint.json"
+
+WATERMARK_LAG = 600
+""" Seconds of the most recent data that aren't trusted to be complete in Prometheus yet. """
+
+def get_cache_key(cfg, type):
+    """
+    Get the cache key for a query config and type. The key covers everything that determines the
+        values DataFrame: the rendered values query, the rendered status query that filters it,
+        the step and the query mode.
+
+    Args:
+        cfg (dict): The full query configuration dictionary.
+        type (str): The type being pulled.
+    Returns:
+        str: The hex cache key.
+    """
+    queries = {"values": render_query(cfg, "values", type)}
+    if("status" in cfg["queries"]):
+        queries["status"] = render_query(cfg, "status", None)
+
+    key_data = {"queries": queries, "step": cfg["step"]}
+    # Raw mode keys predate the mode option, leave them unchanged so their caches stay valid
+    if(cfg.get("mode", "raw") != "raw"):
+        key_data["mode"] = cfg["mode"]
+
+    key_data = json.dumps(key_data, sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()[:32]
+
+def get_status_cache_key(cfg):
+    """
+    Get the cache key for a query config's preprocessed status DataFrame. The key only covers the
+        rendered status query and the step, so every config and type with the same status query
+        shares the cached status DataFrames.
+    """
+    key_data = json.dumps({"queries": {"status": render_query(cfg, "status", None)}, "step": cfg["step"], "frame": "status"}, sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()[:32]
+
+def get_period_str(period):
+    start_ts, end_ts = period
+    return f"{start_ts}-{end_ts}"
+
+def get_last_step_ts(period, step):
+    """ Get the last timestamp a query_range over the period evaluates at. """
+    start_ts, end_ts = period
+    return start_ts + ((end_ts-start_ts)//step)*step
+
+def get_complete_ts(period, step, now):
+    """
+    Get the last timestamp of the period that has complete data at the time now, never a future
+        timestamp.
+
+    Args:
+        period (tuple): The (start_ts, end_ts) period.
+        step (int): The query step in seconds.
+        now (float): The current unix timestamp.
+    Returns:
+        int: The last complete step timestamp, None if the period doesn't have a complete step yet.
+    """
+    start_ts, _ = period
+    complete_until = now - WATERMARK_LAG
+    if(complete_until < start_ts):
+        return None
+
+    return min(start_ts + int((complete_until-start_ts)//step)*step, get_last_step_ts(period, step))
+
+def get_cache_path(key, period):
+    """ Get the cache path base for a key's period, the cache backend adds the file extension. """
+    return os.path.join(CACHE_LOCATION, key, get_period_str(period))
+
+class CacheManifest():
+    """
+    The index of cached entries, loaded once per run. Maps each cache key to the queries it was
+        built from, the cfg/type pairs using it and the periods that are cached.
+    """
+
+    def __init__(self, path, entries):
+        self.path = path
+        self.entries = entries
+        # Status DataFrames are cached from the pull threads
+        self._lock = threading.RLock()
+        self._periods = {key: set(entry["periods"]) for key, entry in entries.items()}
+        for entry in entries.values():
+            entry.setdefault("watermarks", {})
+
+    @classmethod
+    def load(cls, cache_location=CACHE_LOCATION):
+        """
+        Load the manifest from the cache location, migrating caches from the per config layout
+            (<cfg_name>/config.yaml, <cfg_name>/<type>/<start_ts>-<end_ts>.<ext>) into it.
+        """
+        path = os.path.join(cache_location, MANIFEST_NAME)
+
+        entries = {}
+        if(os.path.exists(path)):
+            with open(path, "r") as file:
+                entries = json.load(file)["entries"]
+
+        manifest = cls(path, entries)
+        if(manifest._migrate_legacy(cache_location)):
+            manifest.save()
+
+        return manifest
+
+    def has(self, key, period):
+        """ Check if the key has the complete period cached. """
+        return key in self._periods and get_period_str(period) in self._periods[key]
+
+    def get_watermark(self, key, period):
+        """ Get the watermark of a partially cached period, None if it isn't partially cached. """
+        if(key not in self.entries):
+            return None
+
+        return self.entries[key]["watermarks"].get(get_period_str(period))
+
+    def add(self, key, period, cfg, type, watermark=None):
+        """
+        Register a cached period for the key, call save() to persist. With a watermark the period
+            is registered as only complete up to the watermark timestamp.
+        """
+        with self._lock:
+            if(key not in self.entries):
+                queries = {"values": render_query(cfg, "values", type)}
+                if("status" in cfg["queries"]):
+                    queries["status"] = render_query(cfg, "status", None)
+
+                self._add_entry(key, queries, cfg)
+
+            self._add_period(key, period, f"{cfg['cfg_name']}/{type}", watermark)
+
+    def add_status(self, key, period, cfg):
+        """ Register a cached status DataFrame period for the status key, call save() to persist. """
+        with self._lock:
+            if(key not in self.entries):
+                self._add_entry(key, {"status": render_query(cfg, "status", None)}, cfg)
+
+            self._add_period(key, period, f"{cfg['cfg_name']}/status", None)
+
+    def save(self):
+        """ Write the manifest, replacing the old one atomically so a crash can't corrupt it. """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump({"entries": self.entries}, file, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def _add_entry(self, key, queries, cfg):
+        self.entries[key] = {"queries": queries, "step": cfg["step"], "used_by": [], "periods": [], "watermarks": {}}
+        if(cfg.get("mode", "raw") != "raw" and "values" in queries):
+            self.entries[key]["mode"] = cfg["mode"]
+        self._periods[key] = set()
+
+    def _add_period(self, key, period, used_by, watermark):
+        entry = self.entries[key]
+        if(used_by not in entry["used_by"]):
+            entry["used_by"].append(used_by)
+
+        period_str = get_period_str(period)
+        if(watermark is not None):
+            entry["watermarks"][period_str] = int(watermark)
+            return
+
+        entry["watermarks"].pop(period_str, None)
+        if(period_str not in self._periods[key]):
+            self._periods[key].add(period_str)
+            entry["periods"].append(period_str)
+
+    def _migrate_legacy(self, cache_location):
+        """
+        Move per config cache directories into content-addressed entries. The key for each type
+            is computed from the config.yaml that was cached with it, so every legacy file lands
+            under the key of the queries that actually produced it.
+
+        Returns:
+            bool: True if anything was migrated.
+        """
+        if(not os.path.isdir(cache_location)):
+            return False
+
+        migrated = False
+        for dir_name in os.listdir(cache_location):
+            legacy_root = os.path.join(cache_location, dir_name)
+            legacy_cfg_path = os.path.join(legacy_root, "config.yaml")
+            if(not os.path.isfile(legacy_cfg_path)):
+                continue
+
+            with open(legacy_cfg_path, "r") as file:
+                legacy_cfg = yaml.safe_load(file)
+
+            for type in legacy_cfg.get("yieldstypes", []):
+                type_dir = os.path.join(legacy_root, type)
+                if(not os.path.isdir(type_dir)):
+                    continue
+
+                key = get_cache_key(legacy_cfg, type)
+                os.makedirs(os.path.join(cache_location, key), exist_ok=True)
+
+                for file_name in os.listdir(type_dir):
+                    file_path = os.path.join(type_dir, file_name)
+                    start_ts, end_ts = file_name.split(".")[0].split("-")
+
+                    # Files written before their period ended only hold part of it, don't use them
+                    if(os.path.getmtime(file_path) <= int(end_ts)):
+                        continue
+
+                    os.replace(file_path, os.path.join(cache_location, key, file_name))
+                    self.add(key, (int(start_ts), int(end_ts)), legacy_cfg, type)
+
+            shutil.rmtree(legacy_root)
+            migrated = True
+
+        return migrated
+
+class RunCheckpoint():
+    """
+    Records the progress of an ingest run so a restarted run resumes where it stopped. Pulled
+        DataFrames are already cached as each pull completes, the checkpoint adds the pulls that
+        came back empty so they aren't pulled again. Only a run over the same query configs and
+        periods resumes from the checkpoint, it is removed once the run completes.
+    """
+
+    def __init__(self, path, run_id, empty_pulls):
+        self.path = path
+        self.run_id = run_id
+        self.empty_pulls = empty_pulls
+
+    @classmethod
+    def load(cls, run_id, cache_location=CACHE_LOCATION):
+        """
+        Load the checkpoint of an interrupted run with the same run_id, otherwise start an empty
+            checkpoint.
+        """
+        path = os.path.join(cache_location, CHECKPOINT_NAME)
+
+        if(os.path.exists(path)):
+            with open(path, "r") as file:
+                checkpoint = json.load(file)
+            if(checkpoint["run_id"] == run_id):
+                return cls(path, run_id, set(checkpoint["empty_pulls"]))
+
+        return cls(path, run_id, set())
+
+    @staticmethod
+    def get_pull_id(key, period):
+        return f"{key}/{get_period_str(period)}"
+
+    def is_empty(self, key, period):
+        """ Check if the pull for the key's period already came back empty in this run. """
+        return self.get_pull_id(key, period) in self.empty_pulls
+
+    def add_empty(self, key, period):
+        """ Record that the pull for the key's period came back empty and save the checkpoint. """
+        self.empty_pulls.add(self.get_pull_id(key, period))
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"run_id": self.run_id, "empty_pulls": sorted(self.empty_pulls)}, file)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """ Remove the checkpoint, the run completed. """
+        if(os.path.exists(self.path)):
+            os.remove(self.path)
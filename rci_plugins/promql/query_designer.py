@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 import math
+import urllib.parse
 
 from src.utils.timeutils import get_range_printable, break_period_into_months
 from plugins.rci_plugins.promql.settings import settings
@@ -19,7 +20,11 @@ class QueryData():
     def __str__(self) -> str:
         return f"{self.query_name} {self.type.upper()} {get_range_printable(self.start_ts, self.end_ts)}"
 
-def build_query_url(config, query_name, type, period):
+def render_query(config, query_name, type):
+    """
+    Get the PromQL text for a query in the query config with the %TYPE_STRING% identifier replaced
+        by the type's type strings.
+    """
     query_string = config["queries"][query_name]
     type_string_identifier = settings['type_string_identifier']
     
@@ -28,6 +33,81 @@ def build_query_url(config, query_name, type, period):
         type_string = "|".join(type_strings[type])
         query_string = query_string.replace(type_string_identifier, type_string)
 
+    return query_string
+
+def render_aggregate_query(config, type, aggregate, period=None):
+    """
+    Get PromQL text that aggregates the query config's values query on the server. The values are
+        merged per uid with max (like preprocessing does with duplicate uid columns) and, if the
+        config has a status query, only kept for the steps where the pod is running or pending.
+
+    Args:
+        config (dict): The query config.
+        type (str): The type being pulled.
+        aggregate (str): "hours" for a range query of the summed values by namespace, "jobs" for
+            an instant query at the end of the period counting the distinct uids by namespace.
+        period (tuple): The (start_ts, end_ts) period the jobs are counted over, only used by "jobs".
+    Returns:
+        str: The aggregate PromQL text.
+    """
+    pod_values = f"max by (uid, namespace) ({render_query(config, 'values', type)})"
+    if("status" in config["queries"]):
+        pod_values = f"({pod_values} and on (uid) (max by (uid) ({render_query(config, 'status', None)}) > 0))"
+
+    if(aggregate == "hours"):
+        return f"sum by (namespace) {pod_values}"
+    elif(aggregate == "jobs"):
+        # The subquery range covers both ends of the period, matching the steps of a range query
+        start_ts, end_ts = period
+        return f"count by (namespace) (max_over_time({pod_values}[{end_ts-start_ts+1}s:{config['step']}s]) > 0)"
+    else:
+        raise Exception(f"Unknown aggregate \"{aggregate}\", expected \"hours\" or \"jobs\".")
+
+def plan_query_periods(config, period):
+    """
+    Split a query_range period into time chunks that each stay under the point budget. The points
+        of a request are estimated as expected series * steps, the budget and expected series
+        default to the settings and can be overridden with the query config's point_budget and
+        expected_series. Chunks are aligned to the step so together they evaluate at exactly the
+        timestamps the whole period would.
+
+    Args:
+        config (dict): The query config.
+        period (tuple): The (start_ts, end_ts) period to query.
+    Returns:
+        list[tuple]: The (start_ts, end_ts) chunks in order, just the period if it fits the budget.
+    """
+    start_ts, end_ts = period
+    step = config["step"]
+
+    point_budget = config.get("point_budget", settings["point_budget"])
+    expected_series = config.get("expected_series", settings["expected_series"])
+    chunk_steps = max(1, min(point_budget // expected_series, settings["max_steps_per_request"]))
+
+    total_steps = (end_ts-start_ts)//step + 1
+    if(total_steps <= chunk_steps):
+        return [(start_ts, end_ts)]
+
+    # Even out the chunk sizes so the last chunk isn't a small remainder
+    chunk_cnt = math.ceil(total_steps/chunk_steps)
+    chunk_steps = math.ceil(total_steps/chunk_cnt)
+
+    chunks = []
+    chunk_start = start_ts
+    while(chunk_start <= end_ts):
+        chunk_end = min(chunk_start + (chunk_steps-1)*step, end_ts)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start += chunk_steps*step
+
+    return chunks
+
+def build_query_url(config, query_name, type, period):
+    query_string = render_query(config, query_name, type)
+
+    return build_range_url(config, query_string, period)
+
+def build_range_url(config, query_string, period):
+    """ Build the query_range URL evaluating query_string over the period at the config's step. """
     return build_url(
         config["base_url"], 
         {
@@ -38,19 +118,32 @@ def build_query_url(config, query_name, type, period):
         }
     )
 
+def build_instant_url(config, query_string, time):
+    """
+    Build the instant query URL evaluating query_string at time, the config's base_url is expected
+        to point at the query_range endpoint.
+    """
+    base_url = config["base_url"]
+    if(not base_url.endswith("query_range")):
+        raise Exception(f"Can't build an instant query from base url \"{base_url}\", expected it to end with query_range.")
+
+    return build_url(
+        base_url[:-len("query_range")] + "query",
+        {
+            "time": time,
+            "query": query_string
+        }
+    )
+
 def build_url(base, url_options = {}):
     """
-    Build a URL using a base url and additional options.
-    Example: The URL https://google.com and the associated options { testopt: "testval" } will
-      yield: https://google.com?testopt=testval
+    Build a URL using a base url and additional options, the options are URL encoded.
+    Example: The URL https://google.com and the associated options { testopt: "test val" } will
+      yield: https://google.com?testopt=test+val
     """
     url = base
 
     if(len(url_options.keys()) > 0):
-        url += '?'
-        option_pairs = []
-        for option_key in url_options:
-            option_pairs.append(option_key + "=" + str(url_options[option_key]))
-        url += "&".join(option_pairs)
+        url += '?' + urllib.parse.urlencode({key: str(value) for key, value in url_options.items()})
 
-    return url        
\ No newline at end of file
+    return url
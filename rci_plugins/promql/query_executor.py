@@ -1,73 +1,357 @@
 """
-The Query Executor actually performs the GET request then transforms the returned data into the
+The Query Executor actually performs the PromQL request then transforms the returned data into the
   Grafana DF we're expecting.
 """
 
+import gzip
+import hashlib
 import json
+import numpy as np
+import os
 import pandas as pd
+import random
 import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
+import urllib.parse
+import urllib3
 
+from plugins.rci_plugins.promql.label_table import LabelTable, LABELS_ATTR
+from plugins.rci_plugins.promql.settings import settings
 from src.utils.timeutils import from_unix_ts
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+REQUEST_TIMEOUT = (10, 600)
+""" The (connect, read) timeout in seconds for a single PromQL request. """
+REQUEST_HEADERS = {"Accept-Encoding": "gzip"}
+
+RESPONSE_MODES = ["live", "record", "replay"]
+FIXTURE_LOCATION = "./io/query_fixtures"
+
+_session = None
+_response_mode = "live"
+_fixture_dir = FIXTURE_LOCATION
+
+class QueryRequestException(Exception):
+    """ Exception raised when a PromQL request fails, after retrying if the failure was transient. """
+    pass
+
+class CircuitOpenException(QueryRequestException):
+    """ Exception raised instead of performing a request once the circuit breaker is open. """
+    pass
+
+class CircuitBreaker():
+    """
+    Stops all PromQL requests after a number of consecutive requests failed, so a Prometheus
+        outage ends the run instead of retrying every remaining pull. Shared between pull threads.
+    """
+
+    def __init__(self, failure_threshold):
+        self.failure_threshold = failure_threshold
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        return self._failures >= self.failure_threshold
+
+    def check(self):
+        if(self.is_open()):
+            raise CircuitOpenException(f"Stopped performing PromQL queries after {self._failures} consecutive failed requests.")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+
+    def reset(self):
+        self.record_success()
+
+_circuit_breaker = CircuitBreaker(settings["circuit_breaker_failures"])
+
+def configure_session(pool_size=1):
+    """
+    Create the shared HTTP session used for all PromQL requests. The session keeps connections
+        alive between requests and holds up to pool_size connections per host, so it should be
+        configured with at least as many connections as there are concurrent pulls.
+
+    Args:
+        pool_size (int): The maximum amount of pooled connections per host.
+    Returns:
+        requests.Session: The newly configured session.
+    """
+    global _session
+
+    if(_session is not None):
+        _session.close()
+
+    _circuit_breaker.reset()
+
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    _session = requests.Session()
+    _session.mount("http://", adapter)
+    _session.mount("https://", adapter)
+
+    return _session
+
+def get_session():
+    """ Get the shared HTTP session, configuring a single connection session if there is none. """
+    if(_session is None):
+        configure_session()
+    return _session
+
+def configure_responses(mode="live", fixture_dir=FIXTURE_LOCATION):
+    """
+    Choose where query responses come from. "live" performs the requests, "record" performs them
+        and stores each response as a gzipped fixture keyed by the hash of its URL, "replay" only
+        reads the fixtures and never touches the network.
+
+    Args:
+        mode (str): One of RESPONSE_MODES.
+        fixture_dir (str): The directory the fixtures are stored in.
+    """
+    global _response_mode, _fixture_dir
+
+    if(mode not in RESPONSE_MODES):
+        raise Exception(f"Unknown response mode \"{mode}\", options are: {', '.join(RESPONSE_MODES)}")
+
+    _response_mode = mode
+    _fixture_dir = fixture_dir
+
+def get_fixture_path(queryURL):
+    """ Get the path of the recorded response fixture for a query URL. """
+    url_hash = hashlib.sha256(queryURL.encode("utf-8")).hexdigest()
+    return os.path.join(_fixture_dir, f"{url_hash}.json.gz")
+
 def get_query_response(queryURL):
     """
-    Perform an HTTP GET request with the queryURL, handle the response and return the DataFrame
+    Perform the PromQL request for the queryURL, handle the response and return the result list.
+        In replay mode the recorded response for the queryURL is returned instead.
     """
 
-    cache_mode = 'nocache'
-    json_response = None
+    if(_response_mode == "replay"):
+        fixture_path = get_fixture_path(queryURL)
+        if(not os.path.exists(fixture_path)):
+            raise Exception(f"No recorded response at {fixture_path} to replay for url:\n{queryURL}")
 
-    if(cache_mode == 'nocache' or cache_mode == 'save'):
-        response = requests.get(queryURL)
+        with gzip.open(fixture_path, "rt", encoding="utf-8") as file:
+            return json.load(file)['data']['result']
 
-        if(response.status_code != 200):
-            raise Exception(f"Failed to perform PromQL query for url:\n{queryURL}")
+    json_response = _request_with_retries(queryURL)
 
-        # Check if 'data' is in the response JSON to avoid KeyError
-        json_response = response.json()
-        if 'data' not in json_response:
-            raise Exception(f"Missing 'data' in the response:\n{json_response}")
+    if(_response_mode == "record"):
+        fixture_path = get_fixture_path(queryURL)
+        os.makedirs(_fixture_dir, exist_ok=True)
 
-    if(cache_mode == 'save'):
-        with open('./cached_response.json', 'w') as f:
-            json.dump(json_response, f)
-            print("Saved json.")
-    elif(cache_mode == 'use'):
-        print("WARN: Used cached response instead of performing a new PromQL query.")
-        with open('./cached_response.json', 'r') as f:
-            json_response = json.load(f)
+        # Write then rename so concurrent pulls never replay a partially written fixture
+        tmp_path = f"{fixture_path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+            json.dump(json_response, file)
+        os.replace(tmp_path, fixture_path)
 
     return json_response['data']['result']
 
-def transform_query_response(query_response):
+def split_query_url(queryURL):
+    """
+    Split a query URL into its endpoint and the form data to POST to it. POSTing keeps the long
+        query strings out of the URL.
+
+    Returns:
+        tuple: The (endpoint, form_data) pair, form_data is a list of (key, value) pairs.
+    """
+    url_parts = urllib.parse.urlsplit(queryURL)
+    endpoint = urllib.parse.urlunsplit((url_parts.scheme, url_parts.netloc, url_parts.path, "", ""))
+    return endpoint, urllib.parse.parse_qsl(url_parts.query)
+
+def _request_with_retries(queryURL):
+    """
+    Perform the request for the queryURL as a form-encoded POST with a gzip compressed response,
+        retrying connection errors, timeouts, 429 and 5xx responses with exponential backoff and
+        full jitter. Each request that still fails after its retries counts towards the circuit
+        breaker.
+
+    Returns:
+        dict: The JSON response.
+    """
+    _circuit_breaker.check()
+
+    endpoint, form_data = split_query_url(queryURL)
+
+    retries = settings["request_retries"]
+    for attempt in range(retries+1):
+        try:
+            response = get_session().post(endpoint, data=form_data, headers=REQUEST_HEADERS, timeout=REQUEST_TIMEOUT, stream=True)
+
+            if(response.status_code == 200):
+                with response:
+                    json_response = _decode_response(response)
+                break
+
+            response.close()
+            error = f"HTTP {response.status_code}"
+            if(response.status_code != 429 and response.status_code < 500):
+                _circuit_breaker.record_failure()
+                raise QueryRequestException(f"Failed to perform PromQL query ({error}) for url:\n{queryURL}")
+        except (requests.ConnectionError, requests.Timeout, urllib3.exceptions.HTTPError) as e:
+            error = f"{type(e).__name__}: {e}"
+
+        if(attempt == retries):
+            _circuit_breaker.record_failure()
+            raise QueryRequestException(f"Failed to perform PromQL query after {retries+1} attempts ({error}) for url:\n{queryURL}")
+
+        backoff = min(settings["retry_backoff_max"], settings["retry_backoff_base"] * 2**attempt)
+        time.sleep(random.uniform(0, backoff))
+        # Fail fast if other pulls opened the circuit while we were waiting
+        _circuit_breaker.check()
+
+    # Check if 'data' is in the response JSON to avoid KeyError
+    if 'data' not in json_response:
+        raise Exception(f"Missing 'data' in the response:\n{json_response}")
+
+    _circuit_breaker.record_success()
+    return json_response
+
+def _decode_response(response: requests.Response):
+    """
+    Decode the JSON of a streamed response. With ijson the JSON is parsed incrementally as the
+        decompressed body streams in, the body itself is never held in memory as bytes or text.
+        Without ijson the body is read whole and decoded with response.json().
+    """
+    if(ijson is None):
+        return response.json()
+
+    response.raw.decode_content = True
+    return next(ijson.items(response.raw, "", use_float=True))
+
+def merge_query_responses(query_responses):
+    """
+    Merge the result lists of query_range requests over consecutive time chunks into the result
+        list a single request over the whole range would have returned. Series with the same
+        labels are joined with their values in chunk order.
+
+    Args:
+        query_responses (list[list]): The result lists in chunk order.
+    Returns:
+        list: The merged result list.
+    """
+    if(len(query_responses) == 1):
+        return query_responses[0]
+
+    merged = {}
+    for query_response in query_responses:
+        for series in query_response:
+            metric_key = tuple(sorted(series['metric'].items()))
+            if(metric_key not in merged):
+                merged[metric_key] = {"metric": series['metric'], "values": []}
+            merged[metric_key]["values"].extend(series['values'])
+
+    return list(merged.values())
+
+def transform_query_response(query_response, method=None):
     """
     Given query_response json, produce a “time-joined” table like Grafana's CSV export.
+
+    Args:
+        query_response (list): The result list from the PromQL response.
+        method (str): The transform method, "matrix" or "pivot". Defaults to
+            settings["transform_method"].
+    Returns:
+        pd.DataFrame: The Grafana DataFrame, a Time column followed by a column for each series.
+            The series' labels are attached as a LabelTable in df.attrs[LABELS_ATTR].
+    """
+    if(method is None):
+        method = settings["transform_method"]
+
+    if(method == "matrix"):
+        df = _transform_query_response_matrix(query_response)
+    elif(method == "pivot"):
+        df = _transform_query_response_pivot(query_response)
+    else:
+        raise Exception(f"Unknown query response transform method \"{method}\", expected \"matrix\" or \"pivot\".")
+
+    if(len(query_response) > 0):
+        metrics = {}
+        for series in query_response:
+            metrics.setdefault(_fmt_metric(series['metric']), series['metric'])
+
+        columns = df.columns[1:]
+        df.attrs[LABELS_ATTR] = LabelTable.from_metrics(columns, [metrics[column] for column in columns])
+
+    return df
+
+def _fmt_metric(mdict):
+    """ Turn a metric dict into the {key="value",…} column name string. """
+    return "{"+", ".join(f'{k}=\"{v}\"' for k,v in mdict.items())+"}"
+
+def _transform_query_response_matrix(query_response):
     """
-    # 1) Helper to turn metric dict → {key="value",…} string
-    def fmt_metric(mdict):
-        return "{"+", ".join(f'{k}=\"{v}\"' for k,v in mdict.items())+"}"
+    Build the Grafana DataFrame by filling a preallocated float64 matrix directly from each 
+        series' values. Every series is assigned a column and every timestamp a row on the sorted
+        grid of all timestamps in the response. Produces the same frame as the pivot method.
+    """
+    if(len(query_response) == 0):
+        return _transform_query_response_pivot(query_response)
+
+    # Column order matches pivot_table, which sorts the metric strings
+    metric_strs = [_fmt_metric(series['metric']) for series in query_response]
+    columns = sorted(set(metric_strs))
+    column_idxs = {mstr: idx for idx, mstr in enumerate(columns)}
 
-    # 2) Build a flat list of (timestamp, metric_str, value)
+    series_times = []
+    series_values = []
+    for series in query_response:
+        times, values = zip(*series['values']) if len(series['values']) > 0 else ((), ())
+        series_times.append(np.array(times, dtype=np.float64).astype(np.int64))
+        try:
+            series_values.append(np.array(values, dtype=np.float64))
+        except ValueError:
+            series_values.append(pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64))
+
+    time_grid = np.unique(np.concatenate(series_times))
+
+    matrix = np.full((len(time_grid), len(columns)), np.nan, dtype=np.float64)
+    # Fill in reverse so the first series wins for duplicate metric strings, like aggfunc='first'
+    for series_idx in range(len(query_response)-1, -1, -1):
+        rows = np.searchsorted(time_grid, series_times[series_idx])
+        matrix[rows, column_idxs[metric_strs[series_idx]]] = series_values[series_idx]
+
+    out_df = pd.DataFrame(matrix, columns=pd.Index(columns, name="Metric"))
+    out_df.insert(0, 'Time', pd.Series(time_grid).map(from_unix_ts))
+
+    return out_df
+
+def _transform_query_response_pivot(query_response):
+    """
+    Build the Grafana DataFrame by pivoting a long (Time, Metric, Value) DataFrame.
+    """
+    # 1) Build a flat list of (timestamp, metric_str, value)
     records = []
     for series in query_response:
-        mstr = fmt_metric(series['metric'])
+        mstr = _fmt_metric(series['metric'])
         # extend with tuples (time, metric, value)
         # values is list of [time, value]
         records.extend((int(ts), mstr, val)
                        for ts, val in series['values'])
 
-    # 3) One-shot construction of the long DataFrame
+    # 2) One-shot construction of the long DataFrame
     long_df = pd.DataFrame.from_records(records,
                                         columns=['Time', 'Metric', 'Value'])
 
-    # 4) Pivot so each metric becomes its own column, outer‐joining on Time
+    # 3) Pivot so each metric becomes its own column, outer‐joining on Time
     out_df = long_df.pivot_table(index='Time',
                                  columns='Metric',
                                  values='Value',
                                  aggfunc='first') \
                     .reset_index()
 
-    # 5) Convert Unix seconds → datetime once, vectorized
+    # 4) Convert Unix seconds → datetime once, vectorized
     out_df['Time'] = out_df['Time'].map(from_unix_ts)
 
     out_df = _convert_to_numeric(out_df)
@@ -3,12 +3,18 @@ import math
 import time
 import datetime
 import numpy as np
+import pandas as pd
 import os
+import threading
+from collections import OrderedDict
 
 from plugins.rci_plugins.promql.query_designer import *
 from plugins.rci_plugins.promql.query_executor import *
 from plugins.rci_plugins.promql.grafana_df_analyzer import *
-from plugins.rci_plugins.promql.query_preprocess import preprocess_df
+from plugins.rci_plugins.promql.cache_backends import read_cached
+from plugins.rci_plugins.promql.label_table import get_column_labels
+from plugins.rci_plugins.promql.query_cache import get_cache_path, get_status_cache_key, WATERMARK_LAG
+from plugins.rci_plugins.promql.query_preprocess import preprocess_df, _filter_cols_zero
 from src.utils.timeutils import to_unix_ts, get_range_printable
 from src.data.filters import *
 from src.parameter_utils import ConfigurationException
@@ -20,6 +26,11 @@ def verify_query_config(query_config):
     Query config expects:
         step: int (seconds)
         yieldstypes: list of strings (from settings["type_options"])
+    Optionally:
+        mode: string (from settings["mode_options"]), defaults to "raw"
+        point_budget: int, the max series*steps points per request
+        expected_series: int, the estimated series per request used to split by the point budget
+        intervals: bool, hold the pulled DataFrames as pod interval stores, defaults to false
     """
 
     intro = f"Problem with query config \"{query_config["cfg_name"]}\":"
@@ -36,31 +47,135 @@ def verify_query_config(query_config):
     config_set = set(query_config["yieldstypes"])
     if(not config_set.issubset(settings_set)):
         raise ConfigurationException(f"{intro} The yieldstypes section had unexpected types: {", ".join(config_set-settings_set)}. Options must be from: {", ".join(settings_set)}")
+    for section in ["point_budget", "expected_series"]:
+        if(section in query_config and (not isinstance(query_config[section], int) or isinstance(query_config[section], bool) or query_config[section] < 1)):
+            raise ConfigurationException(f"{intro} The {section} section expects a positive integer, got: {query_config[section]}")
+    if("mode" in query_config and query_config["mode"] not in settings["mode_options"]):
+        raise ConfigurationException(f"{intro} The mode section has unexpected mode \"{query_config['mode']}\". Options are: {', '.join(settings['mode_options'])}")
+    if("intervals" in query_config):
+        if(not isinstance(query_config["intervals"], bool)):
+            raise ConfigurationException(f"{intro} The intervals section expects a bool, got: {query_config['intervals']}")
+        if(query_config["intervals"] and query_config.get("mode", "raw") == "aggregate"):
+            raise ConfigurationException(f"{intro} The intervals section requires the raw mode, aggregate DataFrames have no pod columns.")
 
 class DataFramePullException(Exception):
     """ Exception raised when there is an issue pulling a DataFrame from PromQL. """
     pass
 
-def run(query_config, type, period, cached_status_dfs):
+class StatusDFCache():
+    """
+    Holds the preprocessed status DataFrames keyed by (status_key, start_ts, end_ts), where the
+        status_key is the hash of the status query (see get_status_cache_key), so query configs
+        and types with the same status query share status DataFrames. The most recently used
+        DataFrames are kept in memory, with a cache backend and manifest the status DataFrames of
+        ended periods are also read from and written to the DataFrame cache and shared between
+        runs.
+    Safe to share between pull threads: each status DataFrame is pulled exactly once, threads that
+        need a status DataFrame that is currently being pulled wait for it instead of pulling it
+        again. Cached status DataFrames are shared between pulls and must be treated as read-only.
+    """
+
+    def __init__(self, cache_backend=None, cache_manifest=None, max_entries=None):
+        self.cache_backend = cache_backend
+        self.cache_manifest = cache_manifest
+        self.max_entries = max_entries if max_entries is not None else settings["status_cache_entries"]
+
+        self._dfs = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, cache_id):
+        return cache_id in self._dfs
+
+    def __getitem__(self, cache_id):
+        return self._dfs[cache_id]
+
+    def __len__(self):
+        return len(self._dfs)
+
+    def get(self, query_config, period, loader, main_period=None):
+        """
+        Get the status DataFrame for the query config's period, calling loader to produce it if it
+            isn't cached in memory or on disk. Only status DataFrames covering a whole main period
+            are kept on disk, the status DataFrames of delta pulls (the part of a main period after
+            its watermark) are never asked for again once the main period is cached.
+
+        Args:
+            query_config (dict): The query config with the status query.
+            period (tuple): The (start_ts, end_ts) period of the status DataFrame.
+            loader (Callable[[], pd.DataFrame]): Pulls and preprocesses the status DataFrame.
+            main_period (tuple): The (start_ts, end_ts) main period the pull is part of, the
+                period itself if not provided.
+        Returns:
+            pd.DataFrame: The cached status DataFrame.
+        """
+        status_key = get_status_cache_key(query_config)
+        cache_id = (status_key, period[0], period[1])
+
+        with self._lock:
+            key_lock = self._locks.setdefault(cache_id, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if(cache_id in self._dfs):
+                    self._dfs.move_to_end(cache_id)
+                    return self._dfs[cache_id]
+
+            persistable = main_period is None or tuple(main_period) == tuple(period)
+
+            status_df = self._read_persisted(status_key, period) if persistable else None
+            if(status_df is None):
+                status_df = loader()
+                if(persistable):
+                    self._persist(status_key, period, query_config, status_df)
+
+            with self._lock:
+                self._dfs[cache_id] = status_df
+                while(len(self._dfs) > self.max_entries):
+                    self._dfs.popitem(last=False)
+
+        return status_df
+
+    def _read_persisted(self, status_key, period):
+        if(self.cache_manifest is None or not self.cache_manifest.has(status_key, period)):
+            return None
+
+        return read_cached(get_cache_path(status_key, period), self.cache_backend)
+
+    def _persist(self, status_key, period, query_config, status_df):
+        # Only ended periods are final, status DataFrames reaching into the last WATERMARK_LAG
+        #   seconds can still change
+        if(self.cache_manifest is None or len(status_df) == 0 or period[1] > time.time() - WATERMARK_LAG):
+            return
+
+        cache_path = get_cache_path(status_key, period)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.cache_backend.write(cache_path, status_df)
+
+        self.cache_manifest.add_status(status_key, period, query_config)
+        self.cache_manifest.save()
+
+def run(query_config, type, period, cached_status_dfs: StatusDFCache, main_period=None):
     """
     Run this query config over the provided period list. Gets the status, cpu values, and gpu
-        values DataFrames and then applies processing steps on them.
+        values DataFrames and then applies processing steps on them. The main_period is the main
+        period a delta pull is part of, see StatusDFCache.get.
     """
 
+    if(query_config.get("mode", "raw") == "aggregate"):
+        return _run_aggregate(query_config, type, period)
+
     start_ts, end_ts = period
 
     requires_status = "status" in query_config["queries"]
     # Get status DataFrame if it is specified in the query config.
     if(requires_status):
-        cache_id = (query_config["cfg_name"], start_ts, end_ts)
-        # tqdm.write(str(cache_id))
-        if(cache_id not in cached_status_dfs):
-            status_url = build_query_url(query_config, "status", None, period) # Gets the URL for performing the query
-            status_response = get_query_response(status_url) # Gets JSON response from web
+        def load_status_df():
+            status_response = pull_range_response(query_config, render_query(query_config, "status", None), period) # Gets JSON response from web
             status_df_raw = transform_query_response(status_response) # Transform the JSON to a DataFrame
-            cached_status_dfs[cache_id] = preprocess_df(status_df_raw, False, query_config["step"]) # Preprocess DF for application
-            
-        status_df = cached_status_dfs[cache_id]
+            return preprocess_df(status_df_raw, False, query_config["step"]) # Preprocess DF for application
+
+        status_df = cached_status_dfs.get(query_config, period, load_status_df, main_period)
 
         if(len(status_df) == 0):
             raise DataFramePullException(f"Status DataFrame pulled for query config \"{query_config['cfg_name']}\" over period {get_range_printable(start_ts, end_ts)} is empty, cannot proceed with applying status filter to values DataFrame.")
@@ -68,8 +183,7 @@ def run(query_config, type, period, cached_status_dfs):
         status_df = None
 
     # The same pipeline as above
-    values_url = build_query_url(query_config, "values", type, period)
-    values_response = get_query_response(values_url)
+    values_response = pull_range_response(query_config, render_query(query_config, "values", type), period)
     values_df = transform_query_response(values_response)
 
     if(len(values_df) == 0):
@@ -82,6 +196,47 @@ def run(query_config, type, period, cached_status_dfs):
 
     return values_df
 
+def pull_range_response(query_config, query_string, period):
+    """
+    Pull the query_range result list for query_string over the period. Periods over the query
+        config's point budget are pulled in time chunks (see plan_query_periods) and merged back
+        into a single result list.
+
+    Returns:
+        list: The result list of the whole period.
+    """
+    query_responses = []
+    for chunk in plan_query_periods(query_config, period):
+        query_responses.append(get_query_response(build_range_url(query_config, query_string, chunk)))
+
+    return merge_query_responses(query_responses)
+
+def _run_aggregate(query_config, type, period):
+    """
+    Run this query config in aggregate mode, Prometheus joins the status query onto the values
+        query and only returns the totals per namespace. The response is a column per namespace
+        instead of a column per pod.
+
+    Returns:
+        pd.DataFrame: The Grafana DataFrame of summed values by namespace, with the distinct uid
+            count by namespace over the period in df.attrs[JOBS_ATTR].
+    """
+    start_ts, end_ts = period
+
+    hours_response = pull_range_response(query_config, render_aggregate_query(query_config, type, "hours"), period)
+    hours_df = transform_query_response(hours_response)
+
+    if(len(hours_df) == 0):
+        raise DataFramePullException(f"Aggregate DataFrame pulled for query config \"{query_config['cfg_name']}\" type \"{type}\" over period {get_range_printable(start_ts, end_ts)} is empty.")
+
+    jobs_url = build_instant_url(query_config, render_aggregate_query(query_config, type, "jobs", period), end_ts)
+    jobs_response = get_query_response(jobs_url)
+
+    hours_df = _filter_cols_zero(hours_df)
+    hours_df.attrs[JOBS_ATTR] = {series["metric"].get("namespace"): int(float(series["value"][1])) for series in jobs_response}
+
+    return hours_df
+
 def _apply_status_df(status_df, values_df):
     """
     Apply the status DataFrame to the values DataFrame, only accepting values from the values_df
@@ -97,52 +252,34 @@ def _apply_status_df(status_df, values_df):
         pd.DataFrame: The values DataFrame with the running/pending statuses applied.
     """
 
-    def select_uid(string):
-        if(string == "Time"):
-            return string
-
-        match = re.search(r'uid="([^"]+)"', string)
-        if match:
-            uid = match.group(1)
-            return uid
-        else:
-            raise Exception(f"Failed to read uid in column name \"{string}\"")
+    value_columns = values_df.columns[1:]
+    uids = pd.Index(get_column_labels(values_df, "uid").to_numpy())
+    if(uids.isna().any()):
+        raise Exception(f"Failed to read uid in column name \"{value_columns[uids.isna()][0]}\"")
 
-    # Strip start and end timestamps from the values DataFrame
-    start_ts = to_unix_ts(values_df["Time"][0])
-    end_ts = to_unix_ts(list(values_df["Time"])[-1])
+    # Values columns without a status column are dropped
+    has_status = uids.isin(status_df.columns)
+    value_columns = value_columns[has_status]
+    uids = uids[has_status]
 
-    # Get the list of timestamps from the status DataFrame
+    # Locate the values DataFrame's start and end timestamps in the status DataFrame
+    start_ts = to_unix_ts(values_df["Time"].iloc[0])
+    end_ts = to_unix_ts(values_df["Time"].iloc[-1])
     times_list = [to_unix_ts(time) for time in status_df["Time"]]
 
-    # Determine the indexes (row numbers) of the start and end timestamps in the status DataFrame
-    try:
-        start_index = times_list.index(start_ts)
-    except ValueError:
-        start_index = 0
-
-    try:
-        end_index = times_list.index(end_ts)
-    except ValueError:
-        end_index = len(times_list)-1
-
-    drop_columns = []
-
-    for column in values_df.columns:
-        if(column == "Time"):
-            continue
-
-        uid = select_uid(column)
-
-        if(uid not in status_df.columns):
-            drop_columns.append(column)
-            continue
+    start_index = times_list.index(start_ts) if start_ts in times_list else 0
+    end_index = times_list.index(end_ts) if end_ts in times_list else len(times_list)-1
 
-        status_column = status_df[uid].iloc[range(start_index, end_index+1)]
-        status_column.index = values_df.index
+    if(end_index-start_index+1 != len(values_df)):
+        raise Exception(f"Failed to apply status DataFrame, the {len(values_df)} values rows don't match the {end_index-start_index+1} status rows between {get_range_printable(start_ts, end_ts)}")
 
-        values_df[column] = values_df[column].where(status_column == 1)
+    # A single mask over the whole matrix, status columns are picked in values column order
+    status_matrix = status_df[uids].to_numpy(dtype=np.float64)[start_index:end_index+1]
+    values_matrix = values_df[value_columns].to_numpy(dtype=np.float64)
+    values_matrix = np.where(status_matrix == 1, values_matrix, np.nan)
 
-    values_df.drop(columns=drop_columns, inplace=True)
+    out_df = pd.DataFrame(values_matrix, columns=value_columns, index=values_df.index, copy=False)
+    out_df.insert(0, "Time", values_df["Time"])
+    out_df.attrs = values_df.attrs
 
-    return values_df
\ No newline at end of file
+    return out_df
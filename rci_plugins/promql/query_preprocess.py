@@ -1,8 +1,7 @@
 import pandas as pd
-import re
 import numpy as np
-import math
 
+from plugins.rci_plugins.promql.label_table import get_column_labels
 from src.utils.timeutils import to_unix_ts, from_unix_ts
 
 def preprocess_df(df: pd.DataFrame, preserve_columns, step):
@@ -47,57 +46,44 @@ def _merge_columns_on_uid(df: pd.DataFrame, preserve_columns: bool = False):
     """
     if(df is None or df.empty):
         raise Exception("Can't merge columns on UID, df is none or emoty.")
-    
-    # Holds string uid key with original column name values
-    orig_names = {}
-
-    def select_uid(string):
-        if(string == "Time"):
-            return string
-
-        match = re.search(r'uid="([^"]+)"', string)
-        if match:
-            uid = match.group(1)
 
-            # Store first instance of the uid's original name, pandas will append .X to duplicate 
-            #   column names
-            if(preserve_columns and uid not in orig_names):
-                orig_names[uid] = string
-
-            return uid
-        else:
-            raise Exception(f"Failed to read uid in column name \"{string}\"")
+    uids = get_column_labels(df, "uid").to_numpy()
+    if(pd.isna(uids).any()):
+        raise Exception(f"Failed to read uid in column name \"{df.columns[1:][pd.isna(uids)][0]}\"")
 
     time_col = df['Time'] # Separate Time column
     df = df.drop(columns='Time')
 
-    uids = [select_uid(col) for col in df.columns]
-    df.columns = uids
-
-    seen_uids = set() # The set of uids that have been visited in the loop
-    duplicate_uids = set() # The set of uids that have more than one column
-    for uid in uids:
-        if(uid in seen_uids):
-            duplicate_uids.add(uid)
-        
-        seen_uids.add(uid)
-        
-    static_df = df[list(seen_uids-duplicate_uids)]
+    # Integer codes in sorted uid order, a stable sort by code puts the columns of each uid next to
+    #   each other in their original order
+    codes, sorted_uids = pd.factorize(uids, sort=True)
+    column_order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[column_order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+
+    # Max of each uid's columns, NaNs are skipped like the groupby max did. Works on the transposed
+    #   matrix so each column is contiguous, a uid rarely has more than a few columns so this
+    #   takes the max with the n-th column of every uid that has one in a few whole array passes
+    values = df.to_numpy(dtype=np.float64).T[column_order]
+    group_sizes = np.diff(np.append(group_starts, len(codes)))
+    merged_values = values[group_starts]
+    for offset in range(1, group_sizes.max(initial=1)):
+        groups = np.flatnonzero(group_sizes > offset)
+        merged_values[groups] = np.fmax(merged_values[groups], values[group_starts[groups] + offset])
+    merged_values = merged_values.T
 
-    to_merge_df = df[list(duplicate_uids)]
-    to_merge_df = to_merge_df.T.groupby(to_merge_df.columns).max().T # Merge columns with the same UID
-
-    df = pd.concat([static_df, to_merge_df], axis=1)
-
-    order = np.argsort(df.columns)
-    df = df.iloc[:, order]
+    if(preserve_columns):
+        # The first column of each uid keeps its original name
+        columns = df.columns[column_order[group_starts]]
+    else:
+        columns = sorted_uids
 
+    merged_df = pd.DataFrame(merged_values, columns=columns, index=time_col.index, copy=False)
+    merged_df.insert(0, 'Time', time_col) # Reattach Time column
     if(preserve_columns):
-        df.columns = [orig_names[uid] for uid in df.columns]
+        merged_df.attrs = df.attrs
 
-    df.insert(0, 'Time', time_col) # Reattach Time column
-
-    return df
+    return merged_df
 
 def _infer_times(df: pd.DataFrame, step):
     """
@@ -113,34 +99,28 @@ def _infer_times(df: pd.DataFrame, step):
         pd.DataFrame: The adjusted DataFrame with inferred time rows.    
     """
 
-    columns_excluding_time = list(df.columns)
-    columns_excluding_time.remove("Time")
-
-    i = 0
-    while i < len(df["Time"]) - 1:
-        
-        time = to_unix_ts(df["Time"][i])
-        next_time = to_unix_ts(df["Time"][i+1])
-        time_offset = next_time-time
-
-        if(time_offset <= step):
-            i += 1
-            continue
-
-        rows_to_add = math.floor(time_offset/step)
-
-        times_arr = [from_unix_ts(time + j*step) for j in range(1, rows_to_add)]
-        times_dict = { "Time": times_arr } 
+    times = np.array([to_unix_ts(time) for time in df["Time"]], dtype=np.int64)
+    if(len(times) < 2):
+        return df
 
-        rows_arr = [float('NaN')]*len(times_arr)
-        rows_dict = { key: rows_arr for key in columns_excluding_time }
+    # The amount of steps missing after each row, a gap of n steps is filled with n-1 rows
+    missing_cnts = np.maximum((times[1:]-times[:-1])//step - 1, 0)
+    if(not missing_cnts.any()):
+        return df
 
-        final_df = times_dict | rows_dict
+    # Lay the rows out on the filled grid: each row is followed by the steps missing after it,
+    #   the missing steps point to row -1 so the reindex fills them with NaN in one allocation
+    row_cnts = np.append(missing_cnts, 0) + 1
+    src_rows = np.full(row_cnts.sum(), -1, dtype=np.int64)
+    row_positions = np.cumsum(row_cnts) - row_cnts
+    src_rows[row_positions] = np.arange(len(times))
 
-        rows_df = pd.DataFrame(final_df)        
-                
-        df = pd.concat([df.iloc[:i+1], rows_df, df.iloc[i+1:]]).reset_index(drop=True)
+    inferred = src_rows == -1
+    # Each missing step is the previous row's timestamp plus its offset in the gap times the step
+    gap_offsets = np.arange(len(src_rows)) - np.repeat(row_positions, row_cnts)
+    inferred_times = np.repeat(times, row_cnts)[inferred] + gap_offsets[inferred]*step
 
-        i += rows_to_add
+    df = df.reset_index(drop=True).reindex(src_rows).reset_index(drop=True)
+    df.loc[inferred, "Time"] = [from_unix_ts(time) for time in inferred_times]
 
-    return df
\ No newline at end of file
+    return df
@@ -6,5 +6,24 @@ settings = {
         "gpu": ["nvidia_com_gpu", "nvidia_com_a100"]
     },
     # The string in the query to be replaced with whatever type of data we're retrieving
-    "type_string_identifier": "%TYPE_STRING%"
+    "type_string_identifier": "%TYPE_STRING%",
+    # How query responses are turned into Grafana DataFrames: "matrix" fills a NumPy matrix directly
+    #   from the response, "pivot" builds a long DataFrame and pivots it
+    "transform_method": "matrix",
+    # How a query config is pulled: "raw" pulls a column per pod and applies the status filter
+    #   locally, "aggregate" has Prometheus apply it and only returns totals per namespace
+    "mode_options": ["raw", "aggregate"],
+    # Query planning: requests are split into time chunks so series*steps stays under the point
+    #   budget (~20 bytes of JSON per point) and no series exceeds Prometheus' 11,000 point limit
+    "point_budget": 2_000_000,
+    "expected_series": 2000,
+    "max_steps_per_request": 11000,
+    # Transient request failures (connection errors, timeouts, 429 and 5xx) are retried with
+    #   exponential backoff, all requests stop after circuit_breaker_failures failed in a row
+    "request_retries": 4,
+    "retry_backoff_base": 2,
+    "retry_backoff_max": 60,
+    "circuit_breaker_failures": 3,
+    # The amount of preprocessed status DataFrames kept in memory during a run
+    "status_cache_entries": 16
 }
\ No newline at end of file
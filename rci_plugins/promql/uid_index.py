@@ -0,0 +1,220 @@
+"""
+The uid index records which pod uids were active in each ingested period. Each (cfg_name, type,
+  period) entry is a compact int32 array of uid codes, the uids themselves and their namespace and
+  pod labels are stored once in a vocabulary shared by every entry. Job counts become set
+  operations over the codes, and unique job/user counts over any range of periods are answered
+  without loading the Grafana DataFrames.
+Each entry holds the source of the frame it was built from in the DataFrame cache (see
+  PromQLIngestController.get_source), at ingest an entry is only rebuilt when its period's frame
+  comes from a different source. The analyses look entries up by (cfg_name, type, period) without
+  touching the frames. The index is built at ingest and persisted next to the query cache:
+  ./io/cached_dfs/uid_index.npz
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+from plugins.rci_plugins.promql.grafana_df_cleaning import has_time_column, clear_time_column
+from plugins.rci_plugins.promql.label_table import get_column_labels
+from plugins.rci_plugins.promql.pod_intervals import PodIntervalStore
+from plugins.rci_plugins.promql.query_cache import CACHE_LOCATION, get_period_str
+
+UID_INDEX_NAME = "uid_index.npz"
+
+_VOCAB_LABELS = ["namespace", "pod"]
+
+class UidIndex():
+    """
+    Maps (cfg_name, type, period) to the codes of the uids active in that period. A uid is active
+        if the first column with that uid has a total above 0, like the columns counted by
+        _analyze_jobs_byns_ondf. Codes are kept in column order so counts built from them come
+        out in the same order as counts over the DataFrame.
+    """
+
+    def __init__(self, path, uids, labels, entries, entry_sources):
+        self.path = path
+        self.uids = list(uids)
+        self._codes = {uid: code for code, uid in enumerate(self.uids)}
+        # Label name to the list of each uid's value, None where the uid doesn't have the label
+        self.labels = {label: list(labels[label]) for label in _VOCAB_LABELS}
+        self.entries = entries
+        # The cache source of the frame each entry was built from, None if the frame wasn't cached
+        self.entry_sources = entry_sources
+        # Held while an entry is added, entries added from several threads share the vocabulary
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, cache_location=CACHE_LOCATION):
+        """ Load the index from the cache location, otherwise start an empty index. """
+        path = os.path.join(cache_location, UID_INDEX_NAME)
+
+        if(not os.path.exists(path)):
+            return cls(path, [], {label: [] for label in _VOCAB_LABELS}, {}, {})
+
+        with np.load(path, allow_pickle=False) as data:
+            labels = {label: [value if value != "" else None for value in data[f"label_{label}"].tolist()] for label in _VOCAB_LABELS}
+
+            entries = {}
+            entry_sources = {}
+            # Indexes written before entries had sources only keep their vocabulary, every entry is
+            #   rebuilt
+            if("entry_sources" in data):
+                offsets = data["entry_offsets"]
+                codes = data["entry_codes"]
+                sources = data["entry_sources"].tolist()
+                for idx, entry_key in enumerate(data["entry_keys"].tolist()):
+                    key = cls._parse_entry_key(entry_key)
+                    entries[key] = codes[offsets[idx]:offsets[idx+1]]
+                    entry_sources[key] = sources[idx] if sources[idx] != "" else None
+
+            return cls(path, data["uids"].tolist(), labels, entries, entry_sources)
+
+    @staticmethod
+    def get_entry_key(cfg_name, type, period):
+        return (cfg_name, type, int(period[0]), int(period[1]))
+
+    @staticmethod
+    def _parse_entry_key(entry_key):
+        cfg_name, type, period_str = entry_key.rsplit("/", 2)
+        start_ts, end_ts = period_str.split("-")
+        return (cfg_name, type, int(start_ts), int(end_ts))
+
+    def has(self, cfg_name, type, period, source=None):
+        """
+        Check if the period is indexed, with a source only if its entry was built from a frame of
+            that source.
+        """
+        key = self.get_entry_key(cfg_name, type, period)
+        if(source is None):
+            return key in self.entries
+
+        return key in self.entries and self.entry_sources.get(key) == source
+
+    def add(self, cfg_name, type, period, df, source=None):
+        """
+        Index the active uids of a Grafana DataFrame or pod interval store, replacing the entry of
+            the period if it has one. Call save() to persist.
+
+        Args:
+            source (str): The cache source of the frame, None if it isn't cached.
+        Returns:
+            np.ndarray: The codes of the active uids.
+        """
+        key = self.get_entry_key(cfg_name, type, period)
+
+        uids, has_usage = self._get_column_usage(df)
+        active = np.flatnonzero((~uids.duplicated().to_numpy()) & uids.notna().to_numpy() & has_usage)
+        active_uids = uids.to_numpy()[active]
+        active_labels = {label: self._get_column_labels(df, label).to_numpy()[active] for label in _VOCAB_LABELS}
+
+        with self._lock:
+            codes = np.empty(len(active_uids), dtype=np.int32)
+            for idx, uid in enumerate(active_uids):
+                code = self._codes.get(uid)
+                # Add the uids seen for the first time to the vocabulary
+                if(code is None):
+                    code = len(self.uids)
+                    self._codes[uid] = code
+                    self.uids.append(uid)
+                    for label in _VOCAB_LABELS:
+                        value = active_labels[label][idx]
+                        self.labels[label].append(None if pd.isna(value) else value)
+                codes[idx] = code
+
+            self.entries[key] = codes
+            self.entry_sources[key] = source
+
+        return codes
+
+    def get(self, cfg_name, type, period):
+        """
+        Get the codes of the uids active in a period.
+
+        Returns:
+            np.ndarray: The uid codes in column order, None if the period isn't indexed.
+        """
+        return self.entries.get(self.get_entry_key(cfg_name, type, period))
+
+    def get_labels(self, codes, label) -> pd.Series:
+        """ Get a label ("uid", "namespace" or "pod") for each uid code. """
+        values = self.uids if label == "uid" else self.labels[label]
+        return pd.Series([values[code] for code in codes], dtype=object)
+
+    def get_range(self, cfg_name, types, start_ts, end_ts):
+        """
+        Get the codes of the uids active in any indexed period of the query config and types that
+            lies within start_ts and end_ts, like the months of a year.
+
+        Returns:
+            np.ndarray: The unique uid codes, ordered by period then column.
+        """
+        keys = [key for key in self.entries.keys() if key[0] == cfg_name and key[1] in types and key[2] >= start_ts and key[3] <= end_ts]
+        keys.sort(key=lambda key: (key[2], types.index(key[1])))
+        if(len(keys) == 0):
+            return np.array([], dtype=np.int32)
+
+        return pd.unique(np.concatenate([self.entries[key] for key in keys]))
+
+    def count_unique_jobs(self, cfg_name, types, start_ts, end_ts):
+        """ Count the unique uids active within start_ts and end_ts, see get_range. """
+        return len(self.get_range(cfg_name, types, start_ts, end_ts))
+
+    def count_unique_users(self, cfg_name, types, start_ts, end_ts, user_label="namespace"):
+        """
+        Count the unique users with an active uid within start_ts and end_ts, see get_range. Users
+            are namespaces by default, JupyterHub configs have a pod per user and use "pod".
+        """
+        users = self.get_labels(self.get_range(cfg_name, types, start_ts, end_ts), user_label)
+        return users.nunique()
+
+    def save(self):
+        """ Write the index, replacing the old one atomically so a crash can't corrupt it. """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        keys = list(self.entries.keys())
+        offsets = np.zeros(len(keys)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self.entries[key]) for key in keys])
+        codes = np.concatenate([self.entries[key] for key in keys]) if len(keys) > 0 else np.array([], dtype=np.int32)
+
+        arrays = {
+            "uids": np.array(self.uids, dtype=str),
+            "entry_keys": np.array([f"{key[0]}/{key[1]}/{get_period_str(key[2:])}" for key in keys], dtype=str),
+            "entry_offsets": offsets,
+            "entry_codes": codes.astype(np.int32),
+            "entry_sources": np.array([self.entry_sources.get(key) or "" for key in keys], dtype=str)
+        }
+        for label in _VOCAB_LABELS:
+            arrays[f"label_{label}"] = np.array(["" if value is None else value for value in self.labels[label]], dtype=str)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def _get_column_usage(cls, df):
+        """ Get the uid of each column and whether the column has a total above 0. """
+        if(isinstance(df, PodIntervalStore)):
+            totals = df.get_column_totals()
+        else:
+            totals = (clear_time_column(df) if has_time_column(df) else df).sum().to_numpy(dtype=float)
+
+        return cls._get_column_labels(df, "uid"), totals > 0
+
+    @staticmethod
+    def _get_column_labels(df, label) -> pd.Series:
+        return df.get_column_labels(label) if isinstance(df, PodIntervalStore) else get_column_labels(df, label)
+
+_uid_index = None
+_uid_index_lock = threading.Lock()
+
+def get_uid_index() -> UidIndex:
+    """ Get the uid index of this run, loaded from the cache location the first time. """
+    global _uid_index
+    with _uid_index_lock:
+        if(_uid_index is None):
+            _uid_index = UidIndex.load()
+
+    return _uid_index
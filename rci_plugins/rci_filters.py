@@ -1,6 +1,31 @@
 from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
 from src.data.filters import *
 
+class _SourceTypeFilter():
+    """ The filter_source_type filter, answered from the identifier index by rci_index.filter_ids. """
+
+    def __init__(self, resource_type: str):
+        self.resource_type = resource_type
+
+    def __call__(self, identifier):
+        return isinstance(identifier, GrafanaIdentifier) and identifier.type == self.resource_type
+
+    def lookup(self, index):
+        return index.get_source_ids(type=self.resource_type)
+
+class _AnalysisConfigFilter():
+    """ The filter_analysis_cfg filter, answered from the identifier index by rci_index.filter_ids. """
+
+    def __init__(self, analysis: str, query_cfg: str):
+        self.analysis = analysis
+        self.query_cfg = query_cfg
+
+    def __call__(self, identifier):
+        return getattr(identifier, "analysis", None) == self.analysis and identifier.find_base().query_cfg == self.query_cfg
+
+    def lookup(self, index):
+        return index.get_all_analysis_ids(self.analysis, cfg=self.query_cfg)
+
 def filter_source_type(resource_type: str):
     """
     Get a list of SourceIdentifiers that have the same type as resource_type.
@@ -8,11 +33,23 @@ def filter_source_type(resource_type: str):
     Args:
         resource_type (str): The target resource type for SourceIdentifiers.
     Returns:
-        Callable[[Identifier], bool]: The lambda operation.
+        Callable[[Identifier], bool]: The filter.
+    """
+
+    return _SourceTypeFilter(resource_type)
+
+def filter_analysis_cfg(analysis: str, query_cfg: str):
+    """
+    Get the identifiers of an analysis run on the GrafanaIdentifiers of a query configuration.
+
+    Args:
+        analysis (str): The analysis name.
+        query_cfg (str): The query configuration of the analysis' base GrafanaIdentifiers.
+    Returns:
+        Callable[[Identifier], bool]: The filter.
     """
 
-    analysis_type_lambda = filter_type(GrafanaIdentifier)
-    return lambda identifier: analysis_type_lambda(identifier) and identifier.type == resource_type
+    return _AnalysisConfigFilter(analysis, query_cfg)
 
 grafana_analysis_key = lambda identifier: identifier.find_base().query_cfg
-""" The analysis key is on the query configuration of the GrafanaIdentifier. """
\ No newline at end of file
+""" The analysis key is on the query configuration of the GrafanaIdentifier. """
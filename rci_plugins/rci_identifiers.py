@@ -1,19 +1,64 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+import weakref
 
 from src.data.identifier import TimeStampIdentifier, AnalysisIdentifier
 from src.utils.timeutils import get_range_printable
 from src.utils.fileutils import convert_readable_period_fs
 
+_interned = weakref.WeakValueDictionary()
+
+class _InternedIdentifierType(type(TimeStampIdentifier)):
+    """
+    Metaclass of the RCI identifiers. Constructing an identifier with the same arguments as a live
+        one returns the live instance, so the DataRepository and the drivers share one instance
+        per identifier. Keyword arguments are moved to their field's position, so positional and
+        keyword constructions are interned together, and __init__/__post_init__ only run for new
+        instances. The identifiers' fields have no defaults.
+    """
+
+    def __call__(cls, *args, **kwargs):
+        if(kwargs):
+            field_names = cls.__dict__.get("_field_names")
+            if(field_names is None):
+                field_names = tuple(field.name for field in fields(cls) if field.init)
+                type.__setattr__(cls, "_field_names", field_names)
+
+            if(len(args) + len(kwargs) != len(field_names) or any(name not in kwargs for name in field_names[len(args):])):
+                # Let the dataclass __init__ raise its TypeError
+                return super().__call__(*args, **kwargs)
+            args += tuple(kwargs[name] for name in field_names[len(args):])
+
+        key = (cls, args)
+        identifier = _interned.get(key)
+        if(identifier is None):
+            identifier = _interned.setdefault(key, super().__call__(*args))
+        return identifier
+
+class _InternedIdentifier(metaclass=_InternedIdentifierType):
+    """
+    Base of the RCI identifiers, see _InternedIdentifierType. The identifiers compute their hash
+        once in __post_init__ instead of on every dict lookup, and compare hashes before comparing
+        fields.
+    """
+
 @dataclass(frozen=True)
-class GrafanaIdentifier(TimeStampIdentifier):
+class GrafanaIdentifier(_InternedIdentifier, TimeStampIdentifier):
     type: str
     query_cfg: str # Talks abt the configuration of the ingest controller, like monthly or csu
 
+    def __post_init__(self):
+        object.__setattr__(self, "_hash", hash((TimeStampIdentifier.__hash__(self), self.type, self.query_cfg)))
+
     def __hash__(self) -> int:
-        return hash((super().__hash__(), self.type, self.query_cfg))
+        return self._hash
 
     def __eq__(self, other) -> bool:
-        return isinstance(other, GrafanaIdentifier) and super().__eq__(other) and self.type == other.type and self.query_cfg == other.query_cfg
+        return self is other or (isinstance(other, GrafanaIdentifier) and self._hash == other._hash and self.start_ts == other.start_ts and self.end_ts == other.end_ts
+                                 and self.type == other.type and self.query_cfg == other.query_cfg)
+
+    def __reduce__(self):
+        # Rebuilt through the constructor so the hash is recomputed in the unpickling process
+        return (self.__class__, (self.start_ts, self.end_ts, self.type, self.query_cfg))
 
     def __str__(self) -> str:
         return f"grafana {self.query_cfg}, {self.type}, {get_range_printable(self.start_ts, self.end_ts, 3600)}"
@@ -24,30 +69,48 @@ class GrafanaIdentifier(TimeStampIdentifier):
         return f"{self.query_cfg}-{self.type}-{readable_period_cleaned}"
     
 @dataclass(frozen=True)
-class AvailableHoursIdentifier(AnalysisIdentifier):
+class AvailableHoursIdentifier(_InternedIdentifier, AnalysisIdentifier):
     type: str
     config: str
 
+    def __post_init__(self):
+        object.__setattr__(self, "_hash", hash((AnalysisIdentifier.__hash__(self), self.type, self.config)))
+        object.__setattr__(self, "_base", AnalysisIdentifier.find_base(self))
+
     def __hash__(self) -> int:
-        return hash((super().__hash__(), self.type, self.config))
+        return self._hash
 
     def __eq__(self, other) -> bool:
-        return isinstance(other, AvailableHoursIdentifier) and super().__eq__(other) and self.type == other.type and self.config == other.config
+        return self is other or (isinstance(other, AvailableHoursIdentifier) and self._hash == other._hash and self.on == other.on and self.analysis == other.analysis
+                                 and self.type == other.type and self.config == other.config)
+
+    def __reduce__(self):
+        return (self.__class__, (self.on, self.analysis, self.type, self.config))
+
+    def find_base(self):
+        return self._base
 
     def __str__(self) -> str:
         return f"{self.analysis}({self.on}, {self.type}, {self.config})"
     
 @dataclass(frozen=True)
-class SummaryIdentifier(TimeStampIdentifier):
+class SummaryIdentifier(_InternedIdentifier, TimeStampIdentifier):
     """
     An identifier for a summary of a period, the start_ts and end_ts will match the corresponding
       SourceIdentifiers' start_ts and end_ts.
     """
+
+    def __post_init__(self):
+        object.__setattr__(self, "_hash", hash((self.start_ts, self.end_ts)))
+
     def __hash__(self) -> int:
-        return hash((self.start_ts, self.end_ts))
+        return self._hash
     
     def __eq__(self, other) -> bool:
-        return isinstance(other, SummaryIdentifier) and super().__eq__(other) and self.start_ts == other.start_ts and self.start_ts == other.start_ts
+        return self is other or (isinstance(other, SummaryIdentifier) and self._hash == other._hash and self.start_ts == other.start_ts and self.end_ts == other.end_ts)
+
+    def __reduce__(self):
+        return (self.__class__, (self.start_ts, self.end_ts))
 
     def __str__(self) -> str:
         return f"summary of {self.start_ts}-{self.end_ts}"
@@ -58,22 +121,32 @@ class SummaryIdentifier(TimeStampIdentifier):
         return f"{readable_period_cleaned} summary"
     
 @dataclass(frozen=True)
-class TideSplitIdentifier(AnalysisIdentifier):
+class TideSplitIdentifier(_InternedIdentifier, AnalysisIdentifier):
     """
     An identifier for the tide split information for a period.
     """
     type: str
 
+    def __post_init__(self):
+        object.__setattr__(self, "_hash", hash((AnalysisIdentifier.__hash__(self), self.type)))
+        object.__setattr__(self, "_base", AnalysisIdentifier.find_base(self))
+
     def __hash__(self) -> int:
-        return hash((super().__hash__(), self.type))
+        return self._hash
     
     def __eq__(self, other) -> bool:
-        return isinstance(other, TideSplitIdentifier) and super().__eq__(other) and self.type == other.type
+        return self is other or (isinstance(other, TideSplitIdentifier) and self._hash == other._hash and self.on == other.on and self.analysis == other.analysis and self.type == other.type)
+
+    def __reduce__(self):
+        return (self.__class__, (self.on, self.analysis, self.type))
+
+    def find_base(self):
+        return self._base
 
     def __str__(self) -> str:
         return f"tidesplit named {self.analysis} for type {self.type} on {self.on}"
 
     def fs_str(self) -> str:
-        readable_period = get_range_printable(self.find_base().start_ts, self.find_base().end_ts, 3600)
+        readable_period = get_range_printable(self._base.start_ts, self._base.end_ts, 3600)
         readable_period_cleaned = convert_readable_period_fs(readable_period)
         return f"{readable_period_cleaned} tidesplit"
@@ -0,0 +1,204 @@
+"""
+The identifier index answers the identifier lookups of the RCI drivers without scanning the
+  DataRepository. Scans like filter_ids(...) and resolve_analysis(...) call find_base() on every
+  identifier in the repository, with many periods and query configs the drivers doing them for
+  every period become quadratic. The index buckets identifiers once:
+  - TimeStampIdentifiers (strict), sorted by start_ts
+  - GrafanaIdentifiers, in repository order
+  - AnalysisIdentifiers, by analysis name, then base period, then (type, cfg)
+Each DataRepository has one index, built the first time it's retrieved with get_identifier_index.
+  The ingest builds ObservableDataRepositories, which tell their index about every identifier added
+  or removed. The index of any other DataRepository is checked against the repository's
+  identifiers each time it's retrieved, which is a dict lookup per identifier instead of a
+  find_base() scan.
+"""
+
+import bisect
+import weakref
+
+from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
+from src.data.data_repository import DataRepository
+from src.data.identifier import AnalysisIdentifier, TimeStampIdentifier
+
+class ObservableDataRepository(DataRepository):
+    """
+    A DataRepository that calls its listeners' on_add(identifier)/on_remove(identifier) after
+        every identifier added or removed, see add_listener.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def add(self, identifier, data):
+        result = super().add(identifier, data)
+        for listener in self._listeners:
+            listener.on_add(identifier)
+        return result
+
+    def remove(self, identifier, *args, **kwargs):
+        result = super().remove(identifier, *args, **kwargs)
+        for listener in self._listeners:
+            listener.on_remove(identifier)
+        return result
+
+class IdentifierIndex():
+    """
+    The index of a DataRepository's identifiers, see the module docstring. AnalysisIdentifiers
+        are keyed by the type and cfg of the identifier or its base identifier, the cfg is a
+        GrafanaIdentifier's query config or an AvailableHoursIdentifier's config. Either is None
+        for identifiers without one.
+    """
+
+    def __init__(self, data_repo: DataRepository):
+        # Indexed identifier -> the order it was indexed in, which is the repository's order
+        self._indexed = {}
+        self._order = 0
+        self._timestamp_ids = []
+        self._source_ids = []
+        # Analysis name -> (base start_ts, base end_ts) -> (type, cfg) -> identifiers
+        self._analysis_ids = {}
+
+        for identifier in data_repo.get_ids():
+            self._index(identifier)
+
+        self.observed = isinstance(data_repo, ObservableDataRepository)
+        if(self.observed):
+            data_repo.add_listener(self)
+
+    def on_add(self, identifier):
+        self._index(identifier)
+
+    def on_remove(self, identifier):
+        self._unindex(identifier)
+
+    def sync(self, data_repo: DataRepository):
+        """ Index the identifiers added to and unindex the ones removed from the repository. """
+        identifiers = data_repo.get_ids()
+        # The same amount of identifiers, all of them indexed, is the same set of identifiers
+        if(len(identifiers) == len(self._indexed) and all(identifier in self._indexed for identifier in identifiers)):
+            return
+
+        current = set(identifiers)
+        for identifier in [identifier for identifier in self._indexed.keys() if identifier not in current]:
+            self._unindex(identifier)
+        for identifier in identifiers:
+            self._index(identifier)
+
+    def _index(self, identifier):
+        if(identifier in self._indexed):
+            return
+        self._indexed[identifier] = self._order
+        self._order += 1
+
+        if(type(identifier) is TimeStampIdentifier):
+            bisect.insort(self._timestamp_ids, identifier, key=lambda id: id.start_ts)
+        elif(isinstance(identifier, GrafanaIdentifier)):
+            self._source_ids.append(identifier)
+        elif(isinstance(identifier, AnalysisIdentifier)):
+            self._get_bucket(identifier, create=True).append(identifier)
+
+    def _unindex(self, identifier):
+        if(identifier not in self._indexed):
+            return
+        del self._indexed[identifier]
+
+        if(type(identifier) is TimeStampIdentifier):
+            self._timestamp_ids.remove(identifier)
+        elif(isinstance(identifier, GrafanaIdentifier)):
+            self._source_ids.remove(identifier)
+        elif(isinstance(identifier, AnalysisIdentifier)):
+            self._get_bucket(identifier).remove(identifier)
+
+    def _get_bucket(self, identifier: AnalysisIdentifier, create=False):
+        base = identifier.find_base()
+        type = getattr(identifier, "type", getattr(base, "type", None))
+        cfg = getattr(identifier, "config", getattr(base, "query_cfg", None))
+
+        periods = self._analysis_ids.setdefault(identifier.analysis, {}) if create else self._analysis_ids[identifier.analysis]
+        keys = periods.setdefault((base.start_ts, base.end_ts), {}) if create else periods[(base.start_ts, base.end_ts)]
+        return keys.setdefault((type, cfg), []) if create else keys[(type, cfg)]
+
+    def get_timestamp_ids(self):
+        """ Get the strict TimeStampIdentifiers (the timeline's periods), sorted by start_ts. """
+        return list(self._timestamp_ids)
+
+    def get_source_ids(self, type=None, query_cfg=None):
+        """ Get the GrafanaIdentifiers, optionally only the ones of a type and/or query config. """
+        return [identifier for identifier in self._source_ids
+                if (type is None or identifier.type == type) and (query_cfg is None or identifier.query_cfg == query_cfg)]
+
+    def get_analysis_ids(self, analysis, start_ts, end_ts, type=None, cfg=None):
+        """
+        Get the identifiers of an analysis whose base identifier covers start_ts to end_ts,
+            optionally only the ones of a type and/or cfg.
+        """
+        keys = self._analysis_ids.get(analysis, {}).get((start_ts, end_ts), {})
+        if(type is not None and cfg is not None):
+            return list(keys.get((type, cfg), []))
+
+        return [identifier for (id_type, id_cfg), identifiers in keys.items() for identifier in identifiers
+                if (type is None or id_type == type) and (cfg is None or id_cfg == cfg)]
+
+    def get_all_analysis_ids(self, analysis, type=None, cfg=None):
+        """
+        Get the identifiers of an analysis over every period in repository order, optionally only
+            the ones of a type and/or cfg.
+        """
+        identifiers = [identifier for keys in self._analysis_ids.get(analysis, {}).values() for (id_type, id_cfg), bucket in keys.items()
+                       if (type is None or id_type == type) and (cfg is None or id_cfg == cfg) for identifier in bucket]
+        identifiers.sort(key=self._indexed.__getitem__)
+        return identifiers
+
+    def get_analysis_periods(self, analysis):
+        """
+        Get every bucket of an analysis in one go, a dict of (base start_ts, base end_ts) ->
+            (type, cfg) -> identifiers. The dict is the index's own, don't modify it.
+        """
+        return self._analysis_ids.get(analysis, {})
+
+    def resolve(self, analysis, start_ts, end_ts, type=None, cfg=None):
+        """
+        Find the identifier of an analysis over a period, like resolve_analysis, optionally the
+            one of a type and/or cfg.
+
+        Returns:
+            AnalysisIdentifier: The identifier, None if the analysis wasn't run for the period.
+        """
+        identifiers = self.get_analysis_ids(analysis, start_ts, end_ts, type, cfg)
+
+        if(len(identifiers) == 0):
+            return None
+        if(len(identifiers) > 1):
+            raise Exception(f"Can't resolve analysis \"{analysis}\" for {start_ts}-{end_ts}, {len(identifiers)} identifiers match the type {type} and cfg {cfg}.")
+
+        return identifiers[0]
+
+_indexes = weakref.WeakKeyDictionary()
+
+def get_identifier_index(data_repo: DataRepository) -> IdentifierIndex:
+    """
+    Get the identifier index of a DataRepository, built the first time it's retrieved. The index
+        of a DataRepository that isn't observable is synced with it first.
+    """
+    index = _indexes.get(data_repo)
+    if(index is None):
+        index = IdentifierIndex(data_repo)
+        _indexes[data_repo] = index
+    elif(not index.observed):
+        index.sync(data_repo)
+
+    return index
+
+def filter_ids(data_repo: DataRepository, filter):
+    """
+    Like data_repo.filter_ids(filter), filters with a lookup(index) method (see rci_filters) are
+        answered from the repository's identifier index instead of scanning it.
+    """
+    if(hasattr(filter, "lookup")):
+        return filter.lookup(get_identifier_index(data_repo))
+
+    return data_repo.filter_ids(filter)
@@ -1,27 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import numpy as np
 import os
+import pandas as pd
 
+from plugins.rci_plugins.promql.label_table import get_label_table
+from plugins.rci_plugins.promql.pod_intervals import PodIntervalStore
 from plugins.rci_plugins.rci_identifiers import GrafanaIdentifier
+from plugins.rci_plugins.sysutils import get_available_cpus
 from src.data.data_repository import DataRepository
 from src.data.filters import *
+from src.parameter_utils import ConfigurationException
 from src.plugin_mgmt.plugins import Saver
 from src.program_data import ProgramData
+from src.utils.timeutils import to_unix_ts
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File extension to the compression pandas writes the csv with
+CSV_FORMATS = {"csv": None, "csv.gz": "gzip", "csv.zst": "zstd"}
+
+FORMATS = ["parquet"] + list(CSV_FORMATS.keys())
 
 class DataFrameSaver(Saver):
-    """ Save DataFrames as .csv files in the file system. """
+    """
+    Save the Grafana DataFrames in the file system, by default as zstd compressed Parquet files
+        with the Time column as UTC timestamps. The label table of each DataFrame is saved next to
+        it as a <name>.labels.json file (see LabelTable.to_dict), so the labels don't have to be
+        parsed out of the column names. The plain csv format writes the DataFrame alone, like the
+        saver always has. Files are written on a thread pool, pyarrow and the
+        compressors release the GIL while writing.
+    """
+
+    def verify_config_section(self, config_section):
+        # Optional config section, if its None that's fine
+        if(config_section is None):
+            return True
+
+        if(not set(config_section.keys()).issubset(set(["format", "workers"]))):
+            raise ConfigurationException("The configuration section for DataFrameSaver only expects format and workers sections.")
+
+        format = config_section.get("format")
+        if(format is not None and format not in FORMATS):
+            raise ConfigurationException(f"The configuration section for DataFrameSaver format is expected to be one of {FORMATS}. Is: {format}")
+        if(format == "parquet" and pyarrow is None):
+            raise ConfigurationException("The parquet DataFrameSaver format requires pyarrow, install it or use a csv format.")
+        if(format == "csv.zst" and zstandard is None):
+            raise ConfigurationException("The csv.zst DataFrameSaver format requires zstandard, install it or use the csv.gz format.")
+
+        workers = config_section.get("workers")
+        if(workers is not None and (not isinstance(workers, int) or isinstance(workers, bool) or workers < 1)):
+            raise ConfigurationException(f"The configuration section for DataFrameSaver workers is expected to be a positive integer. Is: {workers}")
+
+        return True
 
     def save(self, prog_data: ProgramData, config_section: dict, base_path: str):
 
         data_repo: DataRepository = prog_data.data_repo
 
+        if(config_section is None):
+            config_section = {}
+
+        format = config_section.get("format")
+        if(format is None):
+            format = "parquet" if pyarrow is not None else "csv.gz"
+
         out_path = base_path
         if(not os.path.exists(out_path)):
             os.makedirs(out_path, exist_ok=True)
-        
-        for identifier in data_repo.filter_ids(filter_type(GrafanaIdentifier)):
-            df = data_repo.get_data(identifier)
 
-            # Convert the readable_period into a string thats saveable by the file system
-            df_path = os.path.join(out_path, f"{identifier.fs_str()}.csv")
-            print(f"  Saving DataFrame file \"{df_path}\"")
+        identifiers = data_repo.filter_ids(filter_type(GrafanaIdentifier))
+
+        workers = config_section.get("workers")
+        if(workers is None):
+            workers = get_available_cpus()
+        workers = max(1, min(workers, len(identifiers)))
+
+        df_paths = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for identifier in identifiers:
+                df = data_repo.get_data(identifier)
+
+                # Convert the readable_period into a string thats saveable by the file system
+                df_path = os.path.join(out_path, f"{identifier.fs_str()}.{format}")
+                print(f"  Saving DataFrame file \"{df_path}\"")
+
+                futures.append(executor.submit(write_df, df, df_path, format))
+                df_paths.append(df_path)
+
+            # Raise the first failed write
+            for future in futures:
+                future.result()
+
+        return df_paths
+
+def write_df(df, df_path, format):
+    """
+    Write a Grafana DataFrame (or pod interval store) in a DataFrameSaver format, with its label
+        table in a .labels.json file next to it unless the format is plain csv. The csv formats
+        write the DataFrame as is.
+    """
+    if(isinstance(df, PodIntervalStore)):
+        df = df.to_grafana_df()
+
+    if(format == "parquet"):
+        _write_parquet(df, df_path)
+    else:
+        df.to_csv(df_path, index=False, compression=CSV_FORMATS[format])
+
+    if(format == "csv"):
+        return
+
+    labels_path = df_path.removesuffix(f".{format}") + ".labels.json"
+    with open(labels_path, "w") as file:
+        json.dump(get_label_table(df).to_dict(), file)
+
+def _write_parquet(df: pd.DataFrame, df_path):
+    """
+    Write a DataFrame as a zstd compressed Parquet file. Grafana DataFrames have thousands of
+        columns with long names, so the file footer is kept to the schema: the pandas/arrow schema
+        metadata would repeat every column name and the column statistics aren't used by readers of
+        these files. The Time strings are local times, they're stored as UTC timestamps through
+        to_unix_ts like the parquet cache backend does. Reading it back with pd.read_parquet gives
+        the same columns and values, with the Time column as those timestamps.
+    """
+    df = df.copy(deep=False)
+    # The label table is written to its own file
+    df.attrs = {}
+    if("Time" in df.columns):
+        df["Time"] = pd.to_datetime(np.array([to_unix_ts(time) for time in df["Time"]], dtype=np.int64), unit="s", utc=True)
 
-            df.to_csv(df_path, index=False)
\ No newline at end of file
+    table = pyarrow.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+    pyarrow.parquet.write_table(table, df_path, compression="zstd", write_statistics=False, store_schema=False)
@@ -1,164 +1,217 @@
+import math
 import os
-import pandas as pd
+import xlsxwriter
 
 from plugins.rci_plugins.analyses.summary_driver import SummaryData
 from plugins.rci_plugins.rci_identifiers import SummaryIdentifier
 from src.data.data_repository import DataRepository
 from src.data.filters import *
+from src.parameter_utils import ConfigurationException
 from src.plugin_mgmt.plugins import Saver
 from src.program_data import ProgramData
 from src.utils.timeutils import from_unix_ts_as_monthday, from_unix_ts_as_monthyear
 
+# Formats shared by every sheet of the workbook, "header" matches the header cells of DataFrame.to_excel
+FORMATS = {
+    "title": {'bold': True, 'font_size': 14, 'valign': 'vcenter'},
+    "section": {'bold': True, 'font_size': 12, 'valign': 'vcenter', 'bg_color': '#E2EFDA', 'border': 1},
+    "bold": {'bold': True},
+    "header": {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+}
+
+COLUMN_WIDTHS = [("A:A", 10), ("B:B", 45), ("C:C", 12)]
+
+SCHOOLS = ["San Diego State University",
+           "California State University, San Bernardino",
+           "California State Polytechnic University, Humboldt",
+           "San Francisco State University",
+           "California State University, Sacramento",
+           "California State University San Marcos",
+           "California State University, Northridge",
+           "California State University, Fullerton",
+           "California State University, Chico",
+           "California State University, Stanislaus",
+           "California State University, Fresno",
+           "San José State University",
+           "California State University, Los Angeles",
+           "California State University Channel Islands",
+           "California State Polytechnic University, Pomona",
+           "California State University, Long Beach",
+           "California State University, Dominguez Hills",
+           "California Polytechnic State University, San Luis Obispo",
+           "California State University, Office of the Chancellor",
+           "Sonoma State University",
+           "California State University, Bakersfield",
+           "California State University, East Bay",
+           "California State University, Monterey Bay",
+           "California State University Maritime Academy"]
+
 class SummarySaver(Saver):
+    """
+    Save the summaries as the sheets of an Excel workbook. Each sheet is laid out then written with
+        formats shared by every sheet. In streaming mode the workbook uses xlsxwriter's constant memory
+        mode, each row is flushed to disk once the next one is started so the workbook is never
+        held in memory.
+    """
+
+    def verify_config_section(self, config_section):
+        # Optional config section, if its None that's fine
+        if(config_section is None):
+            return True
+
+        if(not set(config_section.keys()).issubset(set(["streaming"]))):
+            raise ConfigurationException("The configuration section for SummarySaver only expects a streaming section.")
+
+        if(not isinstance(config_section.get("streaming", False), bool)):
+            raise ConfigurationException(f"The configuration section for SummarySaver streaming is expected to be a bool. Is: {config_section['streaming']}")
+
+        return True
+
     def save(self, prog_data: ProgramData, config_section: dict, base_path: str):
-        
+
         data_repo: DataRepository = prog_data.data_repo
 
+        if(config_section is None):
+            config_section = {}
+
         if(not os.path.exists(base_path)):
             os.makedirs(base_path, exist_ok=True)
 
         summary_filepath = os.path.join(base_path, f"Summary.xlsx")
         identifiers = data_repo.filter_ids(filter_type(SummaryIdentifier))
-        with pd.ExcelWriter(summary_filepath, engine="xlsxwriter") as writer:
 
-            for identifier in identifiers:
-                summary_data: SummaryData = data_repo.get_data(identifier)
+        workbook = xlsxwriter.Workbook(summary_filepath, {"constant_memory": config_section.get("streaming", False)})
+        formats = {name: workbook.add_format(properties) for name, properties in FORMATS.items()}
 
-                sheet_name = from_unix_ts_as_monthyear(identifier.start_ts)
+        # Each sheet is written once it's laid out, so only one sheet's cells are held at a time
+        for identifier in identifiers:
+            sheet_name = from_unix_ts_as_monthyear(identifier.start_ts)
+            write_summary_sheet(workbook, formats, sheet_name, get_summary_cells(identifier, data_repo.get_data(identifier)))
 
-                try:
-                    write_new_method(identifier, writer, sheet_name, summary_data)
-                except PermissionError:
-                    print("ERROR: Excel may still be open. Close it if needed.")
-                
-                print(f"  Saving summary file \"{summary_filepath}\"")
+        try:
+            workbook.close()
+            print(f"  Saved summary file \"{summary_filepath}\"")
+        except PermissionError:
+            print("ERROR: Excel may still be open. Close it if needed.")
 
         return [summary_filepath]
 
-def write_new_method(identifier, writer, sheet_name, summary_data: SummaryData):
-        workbook = writer.book
-        worksheet = workbook.add_worksheet(sheet_name)
-        writer.sheets[sheet_name] = worksheet
-
-        # --- Define formats ---
-        title_fmt = workbook.add_format({
-            'bold': True, 'font_size': 14, 'valign': 'vcenter'
-        })
-        section_fmt = workbook.add_format({
-            'bold': True, 'font_size': 12, 'valign': 'vcenter',
-            'bg_color': '#E2EFDA', 'border': 1
-        })
-        bold_fmt = workbook.add_format({'bold': True})
-        num_fmt = workbook.add_format({'num_format': '#,##0.00'})
-
-        space_between = 0
-        row = 0
-
-        # ---- Title ----
-        start_monthday = from_unix_ts_as_monthday(identifier.start_ts)
-        end_monthday = from_unix_ts_as_monthday(identifier.end_ts)
-        worksheet.merge_range('A1:C1', f"Compute Hours for {start_monthday} - {end_monthday}", title_fmt)
-        row += 1 + space_between
-
-        # ---- Top 5 Jupyterhub Users ----
-        worksheet.merge_range(row, 0, row, 2, "Top 5 Jupyterhub Users", section_fmt)
-        row += 1 + space_between
-
-        worksheet.merge_range(row, 1, row, 2, "Top GPU Users", bold_fmt)
-        summary_data.gpu_jh_users_df.to_excel(
-            writer, sheet_name=sheet_name, startrow=row + 1, startcol=1, index=False, header=True
-        )
-        row += len(summary_data.gpu_jh_users_df) + 2 + space_between
-
-        worksheet.merge_range(row, 1, row, 2, "Top CPU Users", bold_fmt)
-        summary_data.cpu_jh_users_df.to_excel(
-            writer, sheet_name=sheet_name, startrow=row + 1, startcol=1, index=False, header=True
-        )
-        row += len(summary_data.cpu_jh_users_df) + 2 + space_between
-
-        # ---- Top 5 Namespaces ----
-        worksheet.merge_range(row, 0, row, 2, "Top 5 Namespaces", section_fmt)
-        row += 1 + space_between
-
-        worksheet.merge_range(row, 1, row, 2, "Top 5 GPU Hours", bold_fmt)
-        summary_data.gpu_df.to_excel(
-            writer, sheet_name=sheet_name, startrow=row + 1, startcol=1, index=False, header=True
-        )
-        row += len(summary_data.gpu_df) + 2 + space_between
-
-        worksheet.merge_range(row, 1, row, 2, "Top 5 CPU Hours", bold_fmt)
-        summary_data.cpu_df.to_excel(
-            writer, sheet_name=sheet_name, startrow=row + 1, startcol=1, index=False, header=True
-        )
-        row += len(summary_data.cpu_df) + 2 + space_between
-
-        # ---- Jobs ----
-        worksheet.merge_range(row, 0, row, 2, "Jobs", section_fmt)
-        row += 1 + space_between
-        jobs_df = pd.DataFrame({
-            "Category": ["CPU Only Jobs", "GPU Jobs", "Jobs Total"],
-            "Count": [summary_data.cpujobstotal, summary_data.gpujobstotal, summary_data.jobstotal]
-        })
-        jobs_df.to_excel(writer, sheet_name=sheet_name, startrow=row, startcol=1, index=False)
-        row += len(jobs_df) + 1 + space_between
-
-        # ---- Compute Hours ----
-        worksheet.merge_range(row, 0, row, 2, "Compute Hours", section_fmt)
-        row += 1 + space_between
-        compute_df = pd.DataFrame({
-            "Type": ["CPU Hours", "GPU Hours"],
-            "Hours": [summary_data.cpuhourstotal, summary_data.gpuhourstotal]
-        })
-        compute_df.to_excel(writer, sheet_name=sheet_name, startrow=row, startcol=1, index=False)
-        row += len(compute_df) + 1 + space_between
-
-        # ---- TB of Storage Used ----
-        worksheet.merge_range(row, 0, row, 2, "TB of Storage Used", section_fmt)
-        row += 1 + space_between
-        storage_df = pd.DataFrame({
-            # Removing CSUSB because we don't get that info
-            # "Site": ["TIDE", "CSUSB"],
-            # "TB Used": [round(summary_data.usedcapacity, 2), None]
-            "Site": ["TIDE"],
-            "TB Used": [round(summary_data.usedcapacity, 2)]
-        })
-        storage_df.to_excel(writer, sheet_name=sheet_name, startrow=row, startcol=1, index=False)
-        row += len(storage_df) + 1 + space_between
-
-        # ---- Total number of access granted on JupyterHubs ----
-        worksheet.merge_range(row, 0, row, 2, "Total number of access granted on JupyterHubs", section_fmt)
-        row += 1 + space_between
-        schools = ["San Diego State University",
-                   "California State University, San Bernardino",
-                   "California State Polytechnic University, Humboldt",
-                   "San Francisco State University",
-                   "California State University, Sacramento",
-                   "California State University San Marcos",
-                   "California State University, Northridge",
-                   "California State University, Fullerton",
-                   "California State University, Chico",
-                   "California State University, Stanislaus",
-                   "California State University, Fresno",
-                   "San José State University",
-                   "California State University, Los Angeles",
-                   "California State University Channel Islands",
-                   "California State Polytechnic University, Pomona",
-                   "California State University, Long Beach",
-                   "California State University, Dominguez Hills",
-                   "California Polytechnic State University, San Luis Obispo",
-                   "California State University, Office of the Chancellor",
-                   "Sonoma State University",
-                   "California State University, Bakersfield",
-                   "California State University, East Bay",
-                   "California State University, Monterey Bay",
-                   "California State University Maritime Academy"]
-        access_df = pd.DataFrame({
-            "Total": schools,
-            f"=SUM(C{row+2}:C{row+1+len(schools)})": [None]*len(schools)
-        })
-        access_df.to_excel(writer, sheet_name=sheet_name, startrow=row, startcol=1, index=False)
-
-        # ---- Formatting / Column widths ----
-        worksheet.set_column("A:A", 10)
-        worksheet.set_column("B:B", 45)
-        worksheet.set_column("C:C", 12)
\ No newline at end of file
+def write_summary_sheet(workbook, formats, sheet_name, cells):
+    """
+    Write the cells of a summary sheet, see get_summary_cells. The cells are in row order, which
+        constant memory mode requires.
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+
+    for columns, width in COLUMN_WIDTHS:
+        worksheet.set_column(columns, width)
+
+    for row, first_col, last_col, value, format_name in cells:
+        cell_format = formats[format_name] if format_name is not None else None
+        if(first_col != last_col):
+            worksheet.merge_range(row, first_col, row, last_col, value, cell_format)
+        else:
+            worksheet.write(row, first_col, value, cell_format)
+
+def get_summary_cells(identifier, summary_data: SummaryData):
+    """
+    Lay out the summary sheet of a period.
+
+    Returns:
+        list[tuple]: The (row, first_col, last_col, value, format_name) of each cell in row order,
+            cells spanning more than one column are merged.
+    """
+    cells = []
+
+    def merge(row, first_col, last_col, value, format_name):
+        cells.append((row, first_col, last_col, value, format_name))
+
+    def write_rows(columns, rows, startrow, startcol):
+        """ Lay out a table like DataFrame.to_excel(index=False), a header row then the values. """
+        for col, column in enumerate(columns):
+            cells.append((startrow, startcol + col, startcol + col, str(column), "header"))
+
+        for row, values in enumerate(rows):
+            for col, value in enumerate(values):
+                value = _get_cell_value(value)
+                if(value is not None):
+                    cells.append((startrow + 1 + row, startcol + col, startcol + col, value, None))
+
+    def write_df(df, startrow, startcol):
+        write_rows(df.columns, df.itertuples(index=False, name=None), startrow, startcol)
+
+    space_between = 0
+    row = 0
+
+    # ---- Title ----
+    start_monthday = from_unix_ts_as_monthday(identifier.start_ts)
+    end_monthday = from_unix_ts_as_monthday(identifier.end_ts)
+    merge(0, 0, 2, f"Compute Hours for {start_monthday} - {end_monthday}", "title")
+    row += 1 + space_between
+
+    # ---- Top 5 Jupyterhub Users ----
+    merge(row, 0, 2, "Top 5 Jupyterhub Users", "section")
+    row += 1 + space_between
+
+    merge(row, 1, 2, "Top GPU Users", "bold")
+    write_df(summary_data.gpu_jh_users_df, row + 1, 1)
+    row += len(summary_data.gpu_jh_users_df) + 2 + space_between
+
+    merge(row, 1, 2, "Top CPU Users", "bold")
+    write_df(summary_data.cpu_jh_users_df, row + 1, 1)
+    row += len(summary_data.cpu_jh_users_df) + 2 + space_between
+
+    # ---- Top 5 Namespaces ----
+    merge(row, 0, 2, "Top 5 Namespaces", "section")
+    row += 1 + space_between
+
+    merge(row, 1, 2, "Top 5 GPU Hours", "bold")
+    write_df(summary_data.gpu_df, row + 1, 1)
+    row += len(summary_data.gpu_df) + 2 + space_between
+
+    merge(row, 1, 2, "Top 5 CPU Hours", "bold")
+    write_df(summary_data.cpu_df, row + 1, 1)
+    row += len(summary_data.cpu_df) + 2 + space_between
+
+    # ---- Jobs ----
+    merge(row, 0, 2, "Jobs", "section")
+    row += 1 + space_between
+    jobs_rows = [("CPU Only Jobs", summary_data.cpujobstotal), ("GPU Jobs", summary_data.gpujobstotal), ("Jobs Total", summary_data.jobstotal)]
+    write_rows(["Category", "Count"], jobs_rows, row, 1)
+    row += len(jobs_rows) + 1 + space_between
+
+    # ---- Compute Hours ----
+    merge(row, 0, 2, "Compute Hours", "section")
+    row += 1 + space_between
+    compute_rows = [("CPU Hours", summary_data.cpuhourstotal), ("GPU Hours", summary_data.gpuhourstotal)]
+    write_rows(["Type", "Hours"], compute_rows, row, 1)
+    row += len(compute_rows) + 1 + space_between
+
+    # ---- TB of Storage Used ----
+    merge(row, 0, 2, "TB of Storage Used", "section")
+    row += 1 + space_between
+    # Removing CSUSB because we don't get that info
+    # storage_rows = [("TIDE", round(summary_data.usedcapacity, 2)), ("CSUSB", None)]
+    storage_rows = [("TIDE", round(summary_data.usedcapacity, 2))]
+    write_rows(["Site", "TB Used"], storage_rows, row, 1)
+    row += len(storage_rows) + 1 + space_between
+
+    # ---- Total number of access granted on JupyterHubs ----
+    merge(row, 0, 2, "Total number of access granted on JupyterHubs", "section")
+    row += 1 + space_between
+    write_rows(["Total", f"=SUM(C{row+2}:C{row+1+len(SCHOOLS)})"], [(school, None) for school in SCHOOLS], row, 1)
+
+    return cells
+
+def _get_cell_value(value):
+    """ Convert a DataFrame value like DataFrame.to_excel, None for missing values (blank cells). """
+    if(value is None or (isinstance(value, float) and math.isnan(value))):
+        return None
+    if(isinstance(value, float) and math.isinf(value)):
+        return "inf" if value > 0 else "-inf"
+    if(hasattr(value, "item")):
+        return _get_cell_value(value.item())
+    if(isinstance(value, (bool, int, float, str))):
+        return value
+
+    return str(value)
@@ -0,0 +1,35 @@
+import os
+
+def get_available_cpus():
+    """
+    Get the amount of CPUs this process can use. In a container os.cpu_count() is the node's CPU
+        count, the container's CPU limit is read from its cgroup CPU quota.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+    quota = _get_cgroup_cpu_quota()
+    if(quota is not None):
+        cpus = min(cpus, max(1, int(quota)))
+
+    return cpus
+
+def _get_cgroup_cpu_quota():
+    """ Get the cgroup CPU quota in CPUs, None if the process isn't limited. """
+    try:
+        # cgroup v2, "<quota> <period>" or "max <period>"
+        if(os.path.exists("/sys/fs/cgroup/cpu.max")):
+            with open("/sys/fs/cgroup/cpu.max", "r") as file:
+                quota, period = file.read().split()
+            return None if quota == "max" else int(quota) / int(period)
+
+        # cgroup v1, a quota of -1 is unlimited
+        if(os.path.exists("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")):
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as file:
+                quota = int(file.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as file:
+                period = int(file.read())
+            return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        pass
+
+    return None